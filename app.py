@@ -13,8 +13,11 @@ import pickle
 from datetime import datetime
 
 from utils.utils import TextProcessor
+from utils.loader import load_table
+from utils.profiler import profiler, span
 from models.distance import DistanceModel
 from recommender.predictor import Predictor, Formatter
+from recommender.generation import Reloader
 from preprocessors.queproc import QueProc
 from preprocessors.proproc import ProProc
 
@@ -25,26 +28,6 @@ DATA_PATH = 'data'
 SAMPLE_PATH = 'demo_data'
 DUMP_PATH = 'dump'
 
-# init model
-model = DistanceModel(que_dim= 34 - 2 + 8 - 2,
-                                  que_input_embs=[102, 42], que_output_embs=[2, 2],
-                                  pro_dim=42 - 2,
-                                  pro_input_embs=[102, 102, 42], pro_output_embs=[2, 2, 2],
-                                  inter_dim=20, output_dim=10)
-# load weights
-model.load_weights(os.path.join(DUMP_PATH, 'model.h5'))
-
-# load dumped data
-with open(os.path.join(DUMP_PATH, 'dump.pkl'), 'rb') as file:
-    d = pickle.load(file)
-    que_data = d['que_data']
-    stu_data = d['stu_data']
-    pro_data = d['pro_data']
-    que_proc = d['que_proc']
-    pro_proc = d['pro_proc']
-    que_to_stu = d['que_to_stu']
-    pos_pairs = d['pos_pairs']
-
 # init text processor
 tp = TextProcessor()
 
@@ -52,21 +35,51 @@ tp = TextProcessor()
 professionals_sample = pd.read_csv(os.path.join(SAMPLE_PATH, 'pro_sample.csv'))
 pro_tags_sample = pd.read_csv(os.path.join(SAMPLE_PATH, 'tag_users_sample.csv'))
 
-answers = pd.read_csv(os.path.join(DATA_PATH, 'answers.csv'))
-questions = pd.read_csv(os.path.join(DATA_PATH, 'questions.csv'))
 
-professionals_sample['professionals_date_joined'] = pd.to_datetime(professionals_sample['professionals_date_joined'], infer_datetime_format=True)
+def build():
+  """
+  Load model, dumped data and raw tables into a new generation of served objects
+  """
+  # init model
+  model = DistanceModel(que_dim= 34 - 2 + 8 - 2,
+                                    que_input_embs=[102, 42], que_output_embs=[2, 2],
+                                    pro_dim=42 - 2,
+                                    pro_input_embs=[102, 102, 42], pro_output_embs=[2, 2, 2],
+                                    inter_dim=20, output_dim=10)
+  # load weights
+  model.load_weights(os.path.join(DUMP_PATH, 'model.h5'))
+
+  # load dumped data
+  with open(os.path.join(DUMP_PATH, 'dump.pkl'), 'rb') as file:
+      d = pickle.load(file)
+      que_data = d['que_data']
+      stu_data = d['stu_data']
+      pro_data = d['pro_data']
+      que_proc = d['que_proc']
+      pro_proc = d['pro_proc']
+      que_to_stu = d['que_to_stu']
+      pos_pairs = d['pos_pairs']
+  # serialized LDA corpus is kept next to dump.pkl
+  que_proc.locate(DUMP_PATH)
+
+  answers = load_table(DATA_PATH, 'answers')
+  answers['answers_body'] = answers['answers_body'].apply(tp.process)
+
+  # raw questions are held once by formatter, here only processed text columns are added
+  formatter = Formatter(DATA_PATH, DUMP_PATH)
+  questions = formatter.que[['questions_id', 'questions_author_id', 'questions_date_added']].copy()
 
-answers['answers_date_added'] = pd.to_datetime(answers['answers_date_added'], infer_datetime_format=True)
-answers['answers_body'] = answers['answers_body'].apply(tp.process)
+  questions['questions_body'] = formatter.que['questions_body'].apply(tp.process)
+  questions['questions_whole'] = formatter.que['questions_title'].apply(tp.process) + ' ' + questions['questions_body']
 
-questions['questions_date_added'] = pd.to_datetime(questions['questions_date_added'], infer_datetime_format=True)
-questions['questions_title'] = questions['questions_title'].apply(tp.process)
-questions['questions_body'] = questions['questions_body'].apply(tp.process)
-questions['questions_whole'] = questions['questions_title'] + ' ' + questions['questions_body']
+  pred = Predictor(model, que_data, stu_data, pro_data, que_proc, pro_proc, que_to_stu, pos_pairs)
 
-pred = Predictor(model, que_data, stu_data, pro_data, que_proc, pro_proc, que_to_stu, pos_pairs)
-formatter = Formatter(DATA_PATH)
+  return {'pred': pred, 'formatter': formatter, 'questions': questions, 'answers': answers}
+
+
+# the first generation is built at import, before server forks its workers,
+# later ones are built in background on /api/reload or when dump files change
+reloader = Reloader(build, [os.path.join(DUMP_PATH, 'model.h5'), os.path.join(DUMP_PATH, 'dump.pkl')])
 
 # init flask server
 app = Flask(__name__, static_url_path='', template_folder='views')
@@ -102,11 +115,14 @@ def question():
            return json.dumps([], default=str)
 
       que_df, que_tags = Formatter.convert_que_dict(que_dict)
-      tmp = pred.find_ques_by_que(que_df, que_tags)
-      final_df = formatter.get_que(tmp).fillna('')
+      # generation is taken once, so the whole request is served by the same objects, and kept open until its end
+      with reloader.use() as gen:
+        tmp = gen['pred'].find_ques_by_que(que_df, que_tags)
+        with span('serve.format'):
+          final_df = gen['formatter'].get_que(tmp).fillna('')
       final_data = final_df.to_dict('records')
 
-      return json.dumps(final_data, allow_nan=False) 
+      return json.dumps(final_data, allow_nan=False, default=str)
 
     except Exception as e:
       return json.dumps([], default=str)
@@ -143,15 +159,42 @@ def professional():
          return json.dumps([], default=str)
     
     pro_df, pro_tags = Formatter.convert_pro_dict(pro_dict)
-    tmp = pred.find_ques_by_pro(pro_df, questions, answers, pro_tags)
-    final_df = formatter.get_que(tmp).fillna('')
+    with reloader.use() as gen:
+      tmp = gen['pred'].find_ques_by_pro(pro_df, gen['questions'], gen['answers'], pro_tags)
+      with span('serve.format'):
+        final_df = gen['formatter'].get_que(tmp).fillna('')
     
     final_data = final_df.to_dict('records')
     
-    return json.dumps(final_data, allow_nan=False) 
+    return json.dumps(final_data, allow_nan=False, default=str)
       
   except Exception as e:
     return json.dumps([], default=str)
 
+
+@app.route('/metrics')
+def metrics():
+  # per-stage timings, call counts and peak memory in Prometheus text format
+  return Response(profiler.prometheus(), mimetype='text/plain')
+
+
+@app.route('/api/profile')
+def profile():
+  return json.dumps(profiler.report())
+
+
+@app.route('/api/reload', methods = ['POST'])
+def reload():
+  # new generation is built in background, the current one keeps serving until it is ready
+  started = reloader.reload()
+  return json.dumps({'started': started, **reloader.status()})
+
+
+@app.route('/api/reload', methods = ['GET'])
+def reload_status():
+  return json.dumps(reloader.status())
+
+
 if __name__ == '__main__':
+  reloader.watch()
   app.run(debug=False, host='0.0.0.0', port = 8000)
@@ -0,0 +1,114 @@
+import sys
+
+sys.path.extend(['..'])
+
+import os
+import json
+import time
+import pickle
+import argparse
+
+import numpy as np
+
+from sklearn.neighbors import KDTree
+
+from recommender.quantized import QuantizedEncoder, QuantizedIndex
+
+
+def agreement(full: np.ndarray, quant: np.ndarray) -> dict:
+    """
+    Compare neighbours found in full precision and quantized indices
+
+    :param full: indices of top-k neighbours found in full precision, one row per query
+    :param quant: indices of top-k neighbours found in quantized index
+    :return: dict with mean top-k overlap and share of queries with the same nearest neighbour
+    """
+    overlap = [np.intersect1d(f, q).size / f.size for f, q in zip(full, quant)]
+    return {'overlap@k': float(np.mean(overlap)), 'top1_agreement': float(np.mean(full[:, 0] == quant[:, 0]))}
+
+
+def latent_vectors(n: int, dim: int, seed: int) -> np.ndarray:
+    """
+    Synthetic latent vectors forming clusters, like the ones of trained encoders
+    """
+    rng = np.random.RandomState(seed)
+    centers = rng.randn(100, dim)
+    return (centers[rng.randint(0, 100, n)] + 0.3 * rng.randn(n, dim)).astype(np.float32)
+
+
+def run(index_vecs: np.ndarray, query_vecs: np.ndarray, k: int, encoders: tuple = None) -> dict:
+    """
+    Benchmark quantized indices and optionally encoders against full precision ones
+
+    :param index_vecs: full precision latent vectors to index
+    :param query_vecs: full precision latent vectors of queries
+    :param k: number of neighbours
+    :param encoders: optional tuple of Keras encoder and raw features of queries
+    :return: dict with results for each dtype
+    """
+    tick = time.time()
+    full_d, full_i = KDTree(index_vecs).query(query_vecs, k=k)
+    res = {'float32': {'index_mb': index_vecs.nbytes / 2 ** 20,
+                       'query_ms': (time.time() - tick) / len(query_vecs) * 1000}}
+
+    for dtype in ['float16', 'int8']:
+        index = QuantizedIndex(index_vecs, dtype)
+        tick = time.time()
+        dists, ids = index.query(query_vecs, k=k)
+        res[dtype] = {'index_mb': index.nbytes / 2 ** 20,
+                      'query_ms': (time.time() - tick) / len(query_vecs) * 1000,
+                      'max_dist_error': float(np.abs(dists - full_d).max()),
+                      **agreement(full_i, ids)}
+
+        if encoders is not None:
+            # end to end: quantized encoder followed by quantized index
+            model, feat = encoders
+            lat = QuantizedEncoder.from_keras(model, dtype).predict(feat)
+            res[dtype]['max_latent_error'] = float(np.abs(lat - query_vecs).max())
+            e2e = agreement(full_i, index.query(lat, k=k)[1])
+            res[dtype].update({f'e2e_{key}': value for key, value in e2e.items()})
+
+    return res
+
+
+DUMP_PATH = '../dump/'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ranking agreement of quantized latent indices and encoders')
+    parser.add_argument('--n', type=int, default=1000000, help='number of synthetic indexed vectors')
+    parser.add_argument('--queries', type=int, default=1000, help='number of queries')
+    parser.add_argument('--dim', type=int, default=10, help='dimension of synthetic latent vectors')
+    parser.add_argument('--k', type=int, default=10, help='number of neighbours')
+    parser.add_argument('--dump', action='store_true', help='use trained model and data from dump folder')
+    parser.add_argument('--out', default='quantization.json', help='file to save results to')
+    args = parser.parse_args()
+
+    if args.dump:
+        from models.distance import DistanceModel
+        from recommender.predictor import Predictor
+
+        model = DistanceModel(que_dim=34 - 2 + 8 - 2,
+                              que_input_embs=[102, 42], que_output_embs=[2, 2],
+                              pro_dim=42 - 2,
+                              pro_input_embs=[102, 102, 42], pro_output_embs=[2, 2, 2],
+                              inter_dim=20, output_dim=10)
+        model.load_weights(os.path.join(DUMP_PATH, 'model.h5'))
+
+        with open(os.path.join(DUMP_PATH, 'dump.pkl'), 'rb') as file:
+            d = pickle.load(file)
+        pred = Predictor(model, d['que_data'], d['stu_data'], d['pro_data'], d['que_proc'], d['pro_proc'],
+                         d['que_to_stu'], d['pos_pairs'])
+
+        # questions query professionals, the main use case of the index
+        queries = np.random.RandomState(0).choice(len(pred.que_feat), min(args.queries, len(pred.que_feat)),
+                                                  replace=False)
+        results = run(pred.pro_lat_vecs, pred.que_lat_vecs[queries], args.k,
+                      (pred.que_model, pred.que_feat[queries]))
+    else:
+        vecs = latent_vectors(args.n + args.queries, args.dim, 0)
+        results = run(vecs[args.queries:], vecs[:args.queries], args.k)
+
+    for dtype, res in results.items():
+        print(dtype, ', '.join(f'{key}: {value:.4f}' for key, value in res.items()))
+    with open(args.out, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
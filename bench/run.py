@@ -0,0 +1,277 @@
+import sys
+
+sys.path.extend(['..'])
+
+import os
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from bench.synthetic import generate, write_csv
+from nlp.doc2vec import pipeline_d2v
+from nlp.lda import pipeline_lda
+from preprocessors.queproc import QueProc
+from preprocessors.stuproc import StuProc
+from preprocessors.proproc import ProProc
+from train.generator import BatchGenerator
+from models.distance import DistanceModel
+from recommender.predictor import Predictor, Formatter
+from recommender.activity import activity_filter, activity_filter_bulk, build_csr, FilterEngine
+from utils.utils import TextProcessor
+from utils.profiler import Profiler
+
+pd.options.mode.chained_assignment = None
+
+
+class Bench:
+    """
+    Runs named benchmarks and collects their throughput and memory
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        """
+        :param trace_memory: whether to measure peak of Python allocations with tracemalloc,
+        which is precise but slows down Python-heavy code
+        """
+        self.profiler = Profiler()
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    def __call__(self, name: str, fn, n_items: int, repeat: int = 1):
+        """
+        Run fn repeat times and record its timing
+
+        :param name: name of the benchmark
+        :param fn: function without arguments to benchmark
+        :param n_items: number of processed items in single call, used to compute throughput
+        :param repeat: number of calls
+        :return: result of the last call
+        """
+        if self.trace_memory:
+            tracemalloc.start()
+
+        for _ in range(repeat):
+            with self.profiler.span(name):
+                res = fn()
+
+        stat = self.profiler.report()[name]
+        self.results[name] = {'calls': stat['count'], 'items': n_items,
+                              'mean_seconds': stat['mean_seconds'],
+                              'items_per_second': n_items / stat['mean_seconds'] if stat['mean_seconds'] else None,
+                              'peak_rss_mb': stat['peak_rss_mb']}
+        if self.trace_memory:
+            self.results[name]['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+
+        print(f'{name}: {self.results[name]}')
+        return res
+
+
+def run(scale: float, seed: int, trace_memory: bool, repeat: int, work_path: str) -> dict:
+    """
+    Generate synthetic data of given scale and benchmark all the hot paths on it
+
+    :param work_path: folder for intermediate files, like serialized LDA corpus
+
+    :return: dict with mappings from benchmark name to its results
+    """
+    bench = Bench(trace_memory)
+    data = generate(scale, seed)
+
+    que, ans, pro, stu = data['questions'], data['answers'], data['professionals'], data['students']
+
+    # ##################################################################################################################
+    #
+    #                                                   TEXT PROCESSING
+    #
+    # ##################################################################################################################
+
+    tp = TextProcessor()
+
+    def __process():
+        ans['answers_body'] = ans['answers_body'].apply(tp.process)
+        que['questions_title'] = que['questions_title'].apply(tp.process)
+        que['questions_body'] = que['questions_body'].apply(tp.process)
+        pro['professionals_headline'] = pro['professionals_headline'].apply(tp.process)
+        pro['professionals_industry'] = pro['professionals_industry'].apply(tp.process)
+        data['tags']['tags_tag_name'] = data['tags']['tags_tag_name'] \
+            .apply(lambda x: tp.process(x, allow_stopwords=True))
+
+    bench('text.process', __process, len(ans) + 2 * len(que) + 2 * len(pro) + len(data['tags']))
+    que['questions_whole'] = que['questions_title'] + ' ' + que['questions_body']
+
+    tag_que = data['tag_questions'].merge(data['tags'], left_on='tag_questions_tag_id', right_on='tags_tag_id')
+    tag_pro = data['tag_users'].merge(data['tags'], left_on='tag_users_tag_id', right_on='tags_tag_id')
+
+    # ##################################################################################################################
+    #
+    #                                                   PROCESSORS
+    #
+    # ##################################################################################################################
+
+    tag_embs, ind_embs, head_d2v, ques_d2v = bench(
+        'nlp.pipeline_d2v', lambda: pipeline_d2v(que, ans, pro, tag_que, tag_pro, 10), len(que))
+    lda_dic, lda_tfidf, lda_model, lda_corpus = bench(
+        'nlp.pipeline_lda', lambda: pipeline_lda(que, 10, os.path.join(work_path, 'lda_corpus.mm')), len(que))
+
+    que_proc = QueProc(tag_embs, ques_d2v, lda_dic, lda_tfidf, lda_model, lda_corpus)
+    que_data = bench('proc.que_transform', lambda: que_proc.transform(que.copy(), tag_que), len(que))
+
+    stu_proc = StuProc()
+    stu_data = bench('proc.stu_transform', lambda: stu_proc.transform(stu.copy(), que.copy(), ans.copy()), len(stu))
+
+    pro_proc = ProProc(tag_embs, ind_embs, head_d2v, ques_d2v)
+    pro_data = bench('proc.pro_transform', lambda: pro_proc.transform(pro.copy(), que.copy(), ans.copy(), tag_pro),
+                     len(pro))
+
+    # ##################################################################################################################
+    #
+    #                                                   GENERATOR
+    #
+    # ##################################################################################################################
+
+    pairs_df = que.merge(ans, left_on='questions_id', right_on='answers_question_id') \
+        .merge(pro, left_on='answers_author_id', right_on='professionals_id') \
+        .merge(stu, left_on='questions_author_id', right_on='students_id')
+    pos_pairs = list(pairs_df[['questions_id', 'students_id', 'professionals_id', 'answers_date_added']]
+                     .itertuples(index=False, name=None))
+    pro_to_date = dict(zip(pro['professionals_id'], pro['professionals_date_joined']))
+
+    bg = bench('generator.init',
+               lambda: BatchGenerator(que_data, stu_data, pro_data, 64, pos_pairs, pos_pairs, pro_to_date),
+               len(pos_pairs))
+    n_batches = min(len(bg), 20)
+    bench('generator.getitem', lambda: [bg[i] for i in range(n_batches)], n_batches * 2 * bg.batch_size)
+
+    # ##################################################################################################################
+    #
+    #                                                   PREDICTOR
+    #
+    # ##################################################################################################################
+
+    model = DistanceModel(que_dim=len(que_data.columns) - 2 + len(stu_data.columns) - 2,
+                          que_input_embs=[102, 42], que_output_embs=[2, 2],
+                          pro_dim=len(pro_data.columns) - 2,
+                          pro_input_embs=[102, 102, 42], pro_output_embs=[2, 2, 2],
+                          inter_dim=20, output_dim=10)
+    que_to_stu = dict(zip(que['questions_id'], que['questions_author_id']))
+
+    pred = bench('predictor.init',
+                 lambda: Predictor(model, que_data, stu_data, pro_data, que_proc, pro_proc, que_to_stu, pos_pairs),
+                 len(que_data) + len(pro_data))
+
+    que_row = que.iloc[[0]]
+    que_dict = {'questions_id': ['0'],
+                'questions_author_id': list(que_row['questions_author_id']),
+                'questions_date_added': [str(que_row['questions_date_added'].iloc[0])],
+                'questions_title': list(que_row['questions_title']),
+                'questions_body': list(que_row['questions_body']),
+                'questions_tags': [' '.join(tag_que['tags_tag_name'].iloc[:3])]}
+    que_df, que_tags = Formatter.convert_que_dict(que_dict)
+
+    pro_row = pro.iloc[[0]]
+    pro_dict = {'professionals_id': list(pro_row['professionals_id']),
+                'professionals_location': list(pro_row['professionals_location']),
+                'professionals_industry': list(pro_row['professionals_industry']),
+                'professionals_headline': list(pro_row['professionals_headline']),
+                'professionals_date_joined': [str(pro_row['professionals_date_joined'].iloc[0])],
+                'professionals_subscribed_tags': [' '.join(tag_pro['tags_tag_name'].iloc[:3])]}
+    pro_df, pro_tags = Formatter.convert_pro_dict(pro_dict)
+
+    ques_by_que = bench('predictor.find_ques_by_que', lambda: pred.find_ques_by_que(que_df.copy(), que_tags), 1,
+                        repeat)
+    pros_by_que = bench('predictor.find_pros_by_que', lambda: pred.find_pros_by_que(que_df.copy(), que_tags), 1,
+                        repeat)
+    bench('predictor.find_ques_by_pro',
+          lambda: pred.find_ques_by_pro(pro_df.copy(), que.copy(), ans.copy(), pro_tags), 1, repeat)
+    bench('predictor.find_pros_by_pro',
+          lambda: pred.find_pros_by_pro(pro_df.copy(), que.copy(), ans.copy(), pro_tags), 1, repeat)
+
+    # ##################################################################################################################
+    #
+    #                                                   FORMATTER
+    #
+    # ##################################################################################################################
+
+    with tempfile.TemporaryDirectory() as path:
+        write_csv(generate(scale, seed), path)
+        formatter = Formatter(path)
+        bench('formatter.load', lambda: formatter.que, len(que) + len(pro))
+
+        bench('formatter.get_que', lambda: formatter.get_que(ques_by_que), len(ques_by_que), repeat)
+        bench('formatter.get_pro', lambda: formatter.get_pro(pros_by_que), len(pros_by_que), repeat)
+
+    # ##################################################################################################################
+    #
+    #                                                   ACTIVITY FILTERS
+    #
+    # ##################################################################################################################
+
+    cur_date = np.datetime64(ans['answers_date_added'].max(), 'ns')
+    pro_index = pd.Index(pro['professionals_id'])
+    codes = np.concatenate([np.arange(len(pro)), pro_index.get_indexer(ans['answers_author_id'])])
+    dates = np.concatenate([pro['professionals_date_joined'].values, ans['answers_date_added'].values])
+    offsets, dates = build_csr(codes, len(pro), dates)
+
+    def __scalar():
+        ns = dates.astype('datetime64[ns]')
+        return [activity_filter(ns[offsets[i]:offsets[i + 1]], cur_date) for i in range(len(pro))]
+
+    bench('activity.filter_scalar', __scalar, len(pro))
+    bench('activity.filter_bulk', lambda: activity_filter_bulk(offsets, dates, cur_date), len(pro), repeat)
+
+    emails = data['emails'].merge(data['matches'], left_on='emails_id', right_on='matches_email_id')
+    engine = bench('activity.engine_init',
+                   lambda: FilterEngine(emails['emails_recipient_id'].values, emails['matches_question_id'].values,
+                                        emails['emails_date_sent'].values, ans['answers_author_id'].values,
+                                        ans['answers_question_id'].values, ans['answers_date_added'].values),
+                   len(emails) + len(ans))
+
+    rng = np.random.RandomState(seed)
+    cand_pros = pro['professionals_id'].values[rng.randint(0, len(pro), 20 * len(pro))]
+    cand_ques = que['questions_id'].values[rng.randint(0, len(que), cand_pros.size)]
+    bench('activity.engine_email_filter',
+          lambda: engine.email_filter(cand_pros, cand_ques, cur_date, offset_days=7), cand_pros.size, repeat)
+
+    return bench.results
+
+
+def environment() -> dict:
+    """
+    Describe the environment results were obtained in
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark hot paths on synthetic CareerVillage-shaped data')
+    parser.add_argument('--scale', type=float, nargs='+', default=[1], help='multipliers of Kaggle table sizes')
+    parser.add_argument('--seed', type=int, default=0, help='seed of synthetic data generator')
+    parser.add_argument('--repeat', type=int, default=5, help='number of calls of fast benchmarks')
+    parser.add_argument('--trace-memory', action='store_true', help='measure peak Python allocations')
+    parser.add_argument('--out', default='results.json', help='file to save results to')
+    args = parser.parse_args()
+
+    results = {'environment': environment(), 'seed': args.seed, 'scales': {}}
+    for scale in args.scale:
+        print(f'SCALE {scale}')
+        tick = time.time()
+        with tempfile.TemporaryDirectory() as work_path:
+            results['scales'][str(scale)] = run(scale, args.seed, args.trace_memory, args.repeat, work_path)
+        print(f'done in {time.time() - tick:.1f}s')
+
+    # sorted keys and fixed indentation make results easy to diff between commits
+    with open(args.out, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
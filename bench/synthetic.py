@@ -0,0 +1,140 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# sizes of the original Kaggle CareerVillage tables
+KAGGLE_SIZES = {
+    'professionals': 28152,
+    'students': 30971,
+    'questions': 23931,
+    'answers': 51123,
+    'tags': 16269,
+    'tag_users': 136663,
+    'tag_questions': 76553,
+    'emails': 1850101,
+    'matches': 4316275
+}
+
+
+def _ids(rng: np.random.RandomState, n: int) -> np.ndarray:
+    """
+    Random 32-digit hexadecimal ids, just like in original data
+    """
+    halves = rng.randint(0, 2 ** 62, size=(n, 2), dtype=np.int64)
+    return np.array(['%016x%016x' % (a, b) for a, b in halves], dtype=object)
+
+
+def _dates(rng: np.random.RandomState, n: int, start: str = '2011-10-01', end: str = '2019-01-31') -> pd.Series:
+    start, end = pd.Timestamp(start).value, pd.Timestamp(end).value
+    return pd.Series(pd.to_datetime(np.sort(rng.randint(start // 10 ** 9, end // 10 ** 9, size=n)), unit='s'))
+
+
+def _texts(rng: np.random.RandomState, vocab: np.ndarray, n: int, mean_len: int) -> np.ndarray:
+    lens = rng.poisson(mean_len, size=n) + 1
+    words = vocab[rng.randint(0, vocab.size, size=lens.sum())]
+    return np.array([' '.join(ws) for ws in np.split(words, np.cumsum(lens)[:-1])], dtype=object)
+
+
+def generate(scale: float = 1, seed: int = 0) -> dict:
+    """
+    Generate synthetic tables with the same columns and relations as CareerVillage data
+
+    :param scale: multiplier of the original Kaggle table sizes
+    :param seed: seed of random generator
+    :return: dict with mappings from table name to dataframe with parsed dates
+    """
+    rng = np.random.RandomState(seed)
+    n = {name: max(int(size * scale), 10) for name, size in KAGGLE_SIZES.items()}
+
+    vocab = np.array([''.join(rng.choice(list('abcdefghijklmnopqrstuvwxyz'), rng.randint(3, 10)))
+                      for _ in range(20000)], dtype=object)
+    locations = np.array([f'{city}, {state}' for city, state in
+                          zip(_texts(rng, vocab, 500, 0), _texts(rng, vocab, 500, 0)[rng.randint(0, 50, 500)])],
+                         dtype=object)
+    industries = _texts(rng, vocab, 300, 1)
+
+    pro = pd.DataFrame({
+        'professionals_id': _ids(rng, n['professionals']),
+        'professionals_location': locations[rng.randint(0, locations.size, n['professionals'])],
+        'professionals_industry': industries[rng.randint(0, industries.size, n['professionals'])],
+        'professionals_headline': _texts(rng, vocab, n['professionals'], 4),
+        'professionals_date_joined': _dates(rng, n['professionals'])
+    })
+
+    stu = pd.DataFrame({
+        'students_id': _ids(rng, n['students']),
+        'students_location': locations[rng.randint(0, locations.size, n['students'])],
+        'students_date_joined': _dates(rng, n['students'])
+    })
+
+    que = pd.DataFrame({
+        'questions_id': _ids(rng, n['questions']),
+        'questions_author_id': stu['students_id'].values[rng.randint(0, n['students'], n['questions'])],
+        'questions_date_added': _dates(rng, n['questions'], '2012-01-01'),
+        'questions_title': _texts(rng, vocab, n['questions'], 10),
+        'questions_body': _texts(rng, vocab, n['questions'], 50)
+    })
+
+    # answers come after their questions, more active professionals answer more
+    ans_que = rng.randint(0, n['questions'], n['answers'])
+    ans_pro = np.minimum(rng.zipf(1.5, n['answers']) - 1, n['professionals'] - 1)
+    ans_pro = rng.permutation(n['professionals'])[ans_pro]
+    ans = pd.DataFrame({
+        'answers_id': _ids(rng, n['answers']),
+        'answers_author_id': pro['professionals_id'].values[ans_pro],
+        'answers_question_id': que['questions_id'].values[ans_que],
+        'answers_date_added': que['questions_date_added'].values[ans_que] +
+                              pd.to_timedelta(rng.exponential(30, n['answers']), 'D').values,
+        'answers_body': _texts(rng, vocab, n['answers'], 80)
+    })
+
+    tags = pd.DataFrame({
+        'tags_tag_id': np.arange(n['tags']),
+        'tags_tag_name': np.array(['-'.join(words.split()) for words in _texts(rng, vocab, n['tags'], 0)],
+                                  dtype=object)
+    })
+
+    # tag popularity is heavy-tailed
+    def __tag_ids(size):
+        return np.minimum(rng.zipf(1.3, size) - 1, n['tags'] - 1)
+
+    tag_users = pd.DataFrame({
+        'tag_users_tag_id': __tag_ids(n['tag_users']),
+        'tag_users_user_id': pro['professionals_id'].values[rng.randint(0, n['professionals'], n['tag_users'])]
+    }).drop_duplicates()
+
+    tag_questions = pd.DataFrame({
+        'tag_questions_tag_id': __tag_ids(n['tag_questions']),
+        'tag_questions_question_id': que['questions_id'].values[rng.randint(0, n['questions'], n['tag_questions'])]
+    }).drop_duplicates()
+
+    emails = pd.DataFrame({
+        'emails_id': np.arange(n['emails']),
+        'emails_recipient_id': pro['professionals_id'].values[rng.randint(0, n['professionals'], n['emails'])],
+        'emails_date_sent': _dates(rng, n['emails'], '2015-01-01'),
+        'emails_frequency_level': np.array(['email_notification_daily', 'email_notification_weekly',
+                                            'email_notification_immediate'], dtype=object)[
+            rng.randint(0, 3, n['emails'])]
+    })
+
+    matches = pd.DataFrame({
+        'matches_email_id': rng.randint(0, n['emails'], n['matches']),
+        'matches_question_id': que['questions_id'].values[rng.randint(0, n['questions'], n['matches'])]
+    })
+
+    return {'professionals': pro, 'students': stu, 'questions': que, 'answers': ans, 'tags': tags,
+            'tag_users': tag_users, 'tag_questions': tag_questions, 'emails': emails, 'matches': matches}
+
+
+def write_csv(tables: dict, path: str):
+    """
+    Save generated tables as csv files in the same format as original data
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, df in tables.items():
+        df = df.copy()
+        for col in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S') + ' UTC+0000'
+        df.to_csv(os.path.join(path, name + '.csv'), index=False)
@@ -1,4 +1,6 @@
+import h5py
 import tensorflow as tf
+from keras import backend as K
 from keras.models import Model
 from keras.layers import Lambda
 from keras.optimizers import Adam
@@ -39,3 +41,31 @@ class DistanceModel(Model):
         self.outputs = Lambda(lambda x: tf.reshape(tf.exp(-self.merged), (-1, 1)))(self.merged)
 
         super().__init__([self.que_model.inputs[0], self.pro_model.inputs[0]], self.outputs)
+
+    def load_weights(self, filepath, by_name=False, **kwargs):
+        """
+        Load weights from HDF5 file, including files saved when each categorical feature had its own Embedding layer.
+        Tables of such layers are loaded into the tables of fused CategoricalEmbedding layers in their order,
+        together with the rest of weights
+
+        :param filepath: path to HDF5 file with weights
+        :param by_name: load weights by names of layers, passed to Keras as well as other arguments
+        """
+        with h5py.File(filepath, mode='r') as file:
+            group = file['model_weights'] if 'layer_names' not in file.attrs and 'model_weights' in file else file
+            saved = [group[name.decode('utf8')] for name in group.attrs['layer_names']]
+            saved = [[layer[name.decode('utf8')][()] for name in layer.attrs['weight_names']] for layer in saved]
+        saved = [weights for weights in saved if weights]
+
+        layers = [layer for layer in self.layers if layer.weights]
+        if by_name or len(saved) == len(layers):
+            return super().load_weights(filepath, by_name=by_name, **kwargs)
+
+        # file with separate Embedding layers, weighted layers differ but their weights go in the same order
+        weights = [w for layer in saved for w in layer]
+        symbolic = [w for layer in layers for w in layer.weights]
+        shapes = [K.int_shape(w) for w in symbolic]
+        if shapes != [w.shape for w in weights]:
+            raise ValueError(f'Weights in {filepath} of shapes {[w.shape for w in weights]} '
+                             f'do not match model weights of shapes {shapes}')
+        K.batch_set_value(list(zip(symbolic, weights)))
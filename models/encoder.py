@@ -1,6 +1,7 @@
 import tensorflow as tf
+from keras import backend as K
 from keras.models import Model
-from keras.layers import Input, Dense, Lambda, Embedding, Concatenate
+from keras.layers import Input, Dense, Layer
 
 
 def l2_reg_last_n(alpha: float, n: int):
@@ -10,6 +11,44 @@ def l2_reg_last_n(alpha: float, n: int):
     return lambda w: alpha * tf.reduce_mean(tf.square(w[-n:, :]))
 
 
+class CategoricalEmbedding(Layer):
+    """
+    Replaces encoded categorical features in first columns of input with their trainable embeddings
+    and passes the rest numerical features as is, all in a single layer
+    """
+
+    def __init__(self, input_dims: list, output_dims: list, **kwargs):
+        """
+        :param input_dims: number of unique classes in categorical features
+        :param output_dims: embedding dimensions of categorical features
+        """
+        self.input_dims = list(input_dims)
+        self.output_dims = list(output_dims)
+        super().__init__(**kwargs)
+
+    def build(self, input_shape):
+        # one table per feature, in the same order and of the same shapes as separate Embedding layers had,
+        # so their saved weights are loaded table by table, see DistanceModel.load_weights
+        self.tables = [self.add_weight(shape=(nunique, dim), initializer='uniform', name=f'embeddings_{i}')
+                       for i, (nunique, dim) in enumerate(zip(self.input_dims, self.output_dims))]
+        super().build(input_shape)
+
+    def call(self, inputs):
+        n_embs = len(self.tables)
+        codes = K.cast(inputs[:, :n_embs], 'int32')
+
+        # one gather per table and single concatenation with numerical features
+        embs = [K.gather(table, codes[:, i]) for i, table in enumerate(self.tables)]
+        return K.concatenate(embs + [inputs[:, n_embs:]], axis=-1)
+
+    def compute_output_shape(self, input_shape):
+        return input_shape[0], input_shape[1] - len(self.input_dims) + sum(self.output_dims)
+
+    def get_config(self):
+        config = {'input_dims': self.input_dims, 'output_dims': self.output_dims}
+        return {**super().get_config(), **config}
+
+
 def categorize(inputs: tf.Tensor, emb_input_dims: list, emb_output_dims: list):
     """
     Replaces categorical features with trainable embeddings
@@ -19,22 +58,8 @@ def categorize(inputs: tf.Tensor, emb_input_dims: list, emb_output_dims: list):
     :param emb_output_dims: embedding dimensions of categorical features
     :return: transformed tensor
     """
-    n_embs = len(emb_input_dims)
-
-    if n_embs > 0:
-        embs = []
-
-        # iterate over categorical features
-        for i, nunique, dim in zip(range(n_embs), emb_input_dims, emb_output_dims):
-            # separate their values with Lambda layer
-            tmp = Lambda(lambda x: x[:, i])(inputs)
-            # pass them through Embedding layer
-            embs.append(Embedding(nunique, dim)(tmp))
-
-        # pass all the numerical features directly
-        embs.append(Lambda(lambda x: x[:, n_embs:])(inputs))
-        # and concatenate them
-        outputs = Concatenate()(embs)
+    if len(emb_input_dims) > 0:
+        outputs = CategoricalEmbedding(emb_input_dims, emb_output_dims)(inputs)
     else:
         outputs = inputs
 
@@ -1,36 +1,186 @@
-import random
-
+import numpy as np
 import pandas as pd
 
 from gensim.models.doc2vec import Doc2Vec, TaggedDocument
 
+from utils.utils import join_grouped
+
 
-def train_d2v(df: pd.DataFrame, target: str, features: list, dim: int) -> (Doc2Vec, dict):
+class TaggedCorpus:
     """
-    Train Doc2Vec object on provided data
-    :param df: data to work with
-    :param target: column name of target entity in df to train embeddings for
-    :param features: list of feature names to be used for training
+    Restartable stream of tagged documents built from columnar arrays of texts and tags.
+    Texts are split into words only when yielded, and each pass goes in new random order:
+    blocks of consecutive documents are shuffled, as well as documents inside each block
+    """
+
+    def __init__(self, texts: list, tags: list, block_size: int = 1000, seed: int = 0):
+        """
+        :param texts: list of arrays of texts, one array per feature
+        :param tags: list of arrays of tags of corresponding texts
+        :param block_size: number of consecutive documents shuffled together
+        :param seed: seed of random generator used for shuffling
+        """
+        self.texts = np.concatenate([np.asarray(t, dtype=object) for t in texts])
+        self.tags = np.concatenate([np.asarray(t, dtype=object) for t in tags])
+        self.block_size = block_size
+        self.seed = seed
+        self.passes = 0
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, target: str, features: list, **kwargs):
+        """
+        Create corpus of unique feature-target pairs of dataframe
+
+        :param df: data to work with
+        :param target: column name of target entity in df, used as tag of documents
+        :param features: list of feature names used as texts of documents
+        """
+        texts, tags = [], []
+        for feature in features:
+            if feature != target:
+                pairs = df[[feature, target]].drop_duplicates()
+                texts.append(pairs[feature].values)
+                tags.append(pairs[target].values)
+            else:
+                uniques = df[target].drop_duplicates().values
+                texts.append(uniques)
+                tags.append(uniques)
+        return cls(texts, tags, **kwargs)
+
+    def __len__(self):
+        return self.texts.size
+
+    def __iter__(self):
+        # every pass, including vocabulary building, gets its own order
+        rng = np.random.RandomState([self.seed, self.passes])
+        self.passes += 1
+
+        n = self.texts.size
+        for block in rng.permutation((n + self.block_size - 1) // self.block_size):
+            start = block * self.block_size
+            for i in start + rng.permutation(min(self.block_size, n - start)):
+                yield TaggedDocument(self.texts[i].split(), [self.tags[i]])
+
+
+class CorpusJoin:
+    """
+    Normalized join of answers with their questions, question's tags and professionals.
+    Instead of materializing wide merged frames with text columns repeated for each row,
+    texts of every column are deduplicated once and rows of the join are kept as integer codes into them
+    """
+
+    def __init__(self, que: pd.DataFrame, ans: pd.DataFrame, pro: pd.DataFrame, tag_que: pd.DataFrame,
+                 tag_pro: pd.DataFrame):
+        """
+        :param que: raw questions.csv dataset
+        :param ans: raw answers.csv dataset
+        :param pro: raw professionals.csv dataset
+        :param tag_que: tags.csv merged with tag_questions.csv
+        :param tag_pro: tags.csv merged with tag_users.csv
+        """
+        que_index, pro_index = pd.Index(que['questions_id']), pd.Index(pro['professionals_id'])
+
+        # tags of known questions and professionals, sorted by owner with original order inside each owner
+        tq_que = que_index.get_indexer(tag_que['tag_questions_question_id'].values)
+        tq_names = tag_que['tags_tag_name'].values[tq_que >= 0]
+        tq_que = tq_que[tq_que >= 0]
+        order = np.argsort(tq_que, kind='mergesort')
+        tq_que, tq_names = tq_que[order], tq_names[order]
+        tq_offsets = np.zeros(len(que) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tq_que, minlength=len(que)), out=tq_offsets[1:])
+
+        tp_pro = pro_index.get_indexer(tag_pro['tag_users_user_id'].values)
+        tp_names = tag_pro['tags_tag_name'].values[tp_pro >= 0]
+        tp_pro = tp_pro[tp_pro >= 0]
+
+        # all the tags of question or professional aggregated in one string
+        que_tags = join_grouped(tq_que, tq_names).reindex(np.arange(len(que))).values
+        pro_tags = join_grouped(tp_pro, tp_names).reindex(np.arange(len(pro))).values
+
+        # answers on questions with tags given by professionals with tags
+        ans_que = que_index.get_indexer(ans['answers_question_id'].values)
+        ans_pro = pro_index.get_indexer(ans['answers_author_id'].values)
+        keep = (ans_que >= 0) & (ans_pro >= 0)
+        keep[keep] = (np.diff(tq_offsets)[ans_que[keep]] > 0) & pd.notnull(pro_tags[ans_pro[keep]])
+        ans_pos, ans_que, ans_pro = np.flatnonzero(keep), ans_que[keep], ans_pro[keep]
+
+        # deduplicated texts and codes of each entity into them
+        def __factorize(values):
+            codes, uniques = pd.factorize(values)
+            return codes, np.asarray(uniques, dtype=object)
+
+        que_cols = {col: __factorize(que[col].values)
+                    for col in ['questions_id', 'questions_title', 'questions_body', 'questions_whole']}
+        que_cols['tags_tag_name'] = __factorize(que_tags)
+        pro_cols = {col: __factorize(pro[col].values) for col in ['professionals_industry', 'professionals_headline']}
+        pro_cols['tags_pro_name'] = __factorize(pro_tags)
+        ans_body = __factorize(ans['answers_body'].values)
+        tag_name = __factorize(tq_names)
+
+        # answer rows, with all the tags of question in one string
+        answers = {col: (uniques, codes[ans_que]) for col, (codes, uniques) in que_cols.items()}
+        answers.update({col: (uniques, codes[ans_pro]) for col, (codes, uniques) in pro_cols.items()})
+        answers['answers_body'] = (ans_body[1], ans_body[0][ans_pos])
+
+        # answer rows repeated for each tag of question
+        counts = np.diff(tq_offsets)[ans_que]
+        rows = np.repeat(np.arange(ans_pos.size), counts)
+        tag_rows = np.repeat(tq_offsets[ans_que] - np.cumsum(counts) + counts, counts) + np.arange(rows.size)
+        tags = {col: (uniques, codes[rows]) for col, (uniques, codes) in answers.items()}
+        tags['tags_tag_name'] = (tag_name[1], tag_name[0][tag_rows])
+
+        # question rows, only questions with tags
+        ques = np.flatnonzero(np.diff(tq_offsets) > 0)
+        questions = {col: (uniques, codes[ques]) for col, (codes, uniques) in que_cols.items()}
+
+        self.rows = {'tags': tags, 'answers': answers, 'questions': questions}
+
+    def corpus(self, rows: str, target: str, features: list, **kwargs) -> TaggedCorpus:
+        """
+        Create corpus of unique feature-target pairs of join rows,
+        same as TaggedCorpus.from_frame on the materialized join
+
+        :param rows: kind of join rows: 'tags' for answers repeated for each tag of question,
+        'answers' for answers with all the tags of question in one string, 'questions' for questions with tags
+        :param target: column name of target entity, used as tag of documents
+        :param features: list of column names used as texts of documents, rows with missing text or target are skipped
+        """
+        cols = self.rows[rows]
+        tag_uniques, tag_codes = cols[target]
+
+        texts, tags = [], []
+        for feature in features:
+            if feature != target:
+                uniques, codes = cols[feature]
+                # missing values have negative codes
+                known = (codes >= 0) & (tag_codes >= 0)
+                # pair of codes as single integer key
+                keys = np.unique(codes[known].astype(np.int64) * len(tag_uniques) + tag_codes[known])
+                texts.append(uniques[keys // len(tag_uniques)])
+                tags.append(tag_uniques[keys % len(tag_uniques)])
+            else:
+                codes = np.unique(tag_codes[tag_codes >= 0])
+                texts.append(tag_uniques[codes])
+                tags.append(tag_uniques[codes])
+        return TaggedCorpus(texts, tags, **kwargs)
+
+
+def train_d2v(corpus: TaggedCorpus, dim: int, workers: int = 4) -> (Doc2Vec, dict):
+    """
+    Train Doc2Vec object on provided corpus
+    :param corpus: stream of tagged documents
     :param dim: dimension of embedding vectors to train
+    :param workers: number of worker threads used for training
     :return: trained Doc2Vec object
     """
-    prepared = []
-    for feature in features:
-        if feature != target:
-            prepared += [TaggedDocument(row[feature].split(), [row[target]])
-                         for i, row in df[[feature, target]].drop_duplicates().iterrows()]
-        else:
-            prepared += [TaggedDocument(s.split(), [s]) for s in df[target].drop_duplicates()]
-    # shuffle prepared data, just in case
-    prepared = random.sample(prepared, len(prepared))
-    d2v = Doc2Vec(prepared, vector_size=dim, workers=4, epochs=10, dm=0)
+    d2v = Doc2Vec(corpus, vector_size=dim, workers=workers, epochs=10, dm=0)
     docvecs = {d2v.docvecs.index2entity[i]: d2v.docvecs.vectors_docs[i]
                for i in range(len(d2v.docvecs.index2entity))}
     return d2v, docvecs
 
 
 def pipeline_d2v(que: pd.DataFrame, ans: pd.DataFrame, pro: pd.DataFrame, tag_que: pd.DataFrame, tag_pro: pd.DataFrame,
-                 dim: int) -> (dict, dict, Doc2Vec):
+                 dim: int, workers: int = 4) -> (dict, dict, Doc2Vec):
     """
     Pipeline for training embeddings for
     professional's industries and question's tags via doc2vec algorithm
@@ -42,38 +192,23 @@ def pipeline_d2v(que: pd.DataFrame, ans: pd.DataFrame, pro: pd.DataFrame, tag_qu
     :param tag_que: tags.csv merged with tag_questions.csv
     :param tag_pro: tags.csv merged with tag_users.csv
     :param dim: dimension of doc2vec embeddings to train
+    :param workers: number of worker threads used for training
     :return: trained tags, industries embeddings and question's Doc2Vec model
     """
-    # aggregate all the tags in one string for same professionals
-    pro_tags = tag_pro[['tag_users_user_id', 'tags_tag_name']].groupby(by='tag_users_user_id', as_index=False) \
-        .aggregate(lambda x: ' '.join(x)).rename(columns={'tags_tag_name': 'tags_pro_name'})
-    pro_tags = pro.merge(pro_tags, left_on='professionals_id', right_on='tag_users_user_id')
-
-    # merge questions, tags, answers and professionals
-    que_tags = que.merge(tag_que, left_on='questions_id', right_on='tag_questions_question_id')
-    ans_que_tags = ans.merge(que_tags, left_on="answers_question_id", right_on="questions_id")
-    df = ans_que_tags.merge(pro_tags, left_on='answers_author_id', right_on='professionals_id')
-
     text_features = ['questions_title', 'questions_body', 'answers_body', 'tags_tag_name', 'tags_pro_name',
                      'professionals_industry', 'professionals_headline']
 
-    # train and save question's tags embeddings
-    _, tags_embs = train_d2v(df, 'tags_tag_name', text_features, dim)
-
-    # aggregate all the tags in one string for same questions
-    que_tags = que_tags[['questions_id', 'tags_tag_name']].groupby(by='questions_id', as_index=False) \
-        .aggregate(lambda x: ' '.join(x))
+    # join is built once and shared by all the trainings
+    join = CorpusJoin(que, ans, pro, tag_que, tag_pro)
 
-    # merge questions, aggregated tags, answers and professionals
-    que_tags = que.merge(que_tags, on='questions_id')
-    ans_que_tags = ans.merge(que_tags, left_on="answers_question_id", right_on="questions_id")
-    df = ans_que_tags.merge(pro_tags, left_on='answers_author_id', right_on='professionals_id')
+    # train and save question's tags embeddings
+    _, tags_embs = train_d2v(join.corpus('tags', 'tags_tag_name', text_features), dim, workers)
 
     # train and save professional's industries embeddings
-    _, inds_embs = train_d2v(df, 'professionals_industry', text_features, dim)
+    _, inds_embs = train_d2v(join.corpus('answers', 'professionals_industry', text_features), dim, workers)
 
-    head_d2v, _ = train_d2v(df, 'professionals_headline', text_features, 5)
+    head_d2v, _ = train_d2v(join.corpus('answers', 'professionals_headline', text_features), 5, workers)
 
-    ques_d2v, _ = train_d2v(que_tags, 'questions_id', ['questions_whole'], dim)
+    ques_d2v, _ = train_d2v(join.corpus('questions', 'questions_id', ['questions_whole']), dim, workers)
 
     return tags_embs, inds_embs, head_d2v, ques_d2v
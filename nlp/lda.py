@@ -1,34 +1,154 @@
+import os
+import hashlib
+
+import numpy as np
 import pandas as pd
 
-from gensim.corpora import Dictionary
+from gensim.corpora import Dictionary, MmCorpus
 from gensim.models import TfidfModel
 from gensim.models.ldamulticore import LdaMulticore
 
 
-def pipeline_lda(que: pd.DataFrame, dim: int) -> (Dictionary, TfidfModel, LdaMulticore):
+def text_key(text: str) -> bytes:
+    """
+    Content hash of processed text, identifies the same text regardless of question's id
+    """
+    return hashlib.md5(text.encode()).digest()
+
+
+class Tokens:
+    """
+    Restartable stream of tokenized texts
+    """
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def __iter__(self):
+        for text in self.texts:
+            yield text.split()
+
+
+class BowCorpus:
+    """
+    Bag-of-words corpus of questions serialized in Matrix Market format and streamed from disk.
+    Only file name of the corpus is pickled, unpickled corpus is found with locate in the folder it was moved to,
+    usually next to dump.pkl. Until then questions are converted with dictionary
+    """
+
+    def __init__(self, path: str, ids: np.ndarray, keys: list):
+        """
+        :param path: path to serialized corpus
+        :param ids: ids of questions in the order of documents in corpus
+        :param keys: content hashes of serialized texts, aligned with ids
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        self.ids = pd.Index(ids)
+        self.keys = np.array(keys, dtype=object)
+        self.__mm = None
+
+    @classmethod
+    def serialize(cls, path: str, ids: np.ndarray, texts: np.ndarray, dic: Dictionary):
+        """
+        Convert texts to bag-of-words and stream them to disk
+
+        :param path: path to save corpus to, together with its index
+        :param ids: ids of questions
+        :param texts: texts of questions, aligned with ids
+        :param dic: dictionary used for conversion
+        """
+        MmCorpus.serialize(path, (dic.doc2bow(doc) for doc in Tokens(texts)), id2word=dic)
+        return cls(path, ids, [text_key(text) for text in texts])
+
+    def locate(self, folder: str) -> bool:
+        """
+        Find corpus file in given folder
+
+        :return: whether the file is there
+        """
+        path = os.path.join(folder, self.name)
+        self.path, self.__mm = (path if os.path.isfile(path) else None), None
+        return self.path is not None
+
+    @property
+    def mm(self) -> MmCorpus:
+        # corpus file is opened lazily, so BowCorpus can be pickled with processors
+        if self.path is None:
+            raise FileNotFoundError(f'corpus {self.name} is not located')
+        if self.__mm is None:
+            self.__mm = MmCorpus(self.path)
+        return self.__mm
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['path'], state['_BowCorpus__mm'] = None, None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # corpora pickled with absolute paths
+        if 'name' not in state:
+            self.name, self.path = os.path.basename(self.path), None
+
+    def __iter__(self):
+        return iter(self.mm)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, ids: np.ndarray, texts: np.ndarray, dic: Dictionary) -> list:
+        """
+        Bag-of-words of given questions, read from disk for serialized questions with unchanged texts
+        and converted otherwise
+
+        :param ids: ids of questions
+        :param texts: texts of questions, aligned with ids
+        :param dic: dictionary used for conversion of unknown or edited questions, and of all of them
+        if corpus is not located
+        :return: list of bag-of-words
+        """
+        if self.path is None:
+            return [dic.doc2bow(text.split()) for text in texts]
+        pos = self.ids.get_indexer(ids)
+        known = pos >= 0
+        known[known] = [self.keys[p] == text_key(text) for p, text in zip(pos[known], np.asarray(texts)[known])]
+        pos = np.where(known, pos, -1)
+        # whole corpus in original order is read sequentially
+        if pos.size == len(self.ids) and np.array_equal(pos, np.arange(pos.size)):
+            return list(self.mm)
+        return [self.mm[p] if p >= 0 else dic.doc2bow(text.split()) for p, text in zip(pos, texts)]
+
+
+def pipeline_lda(que: pd.DataFrame, dim: int, path: str,
+                 workers: int = 4) -> (Dictionary, TfidfModel, LdaMulticore, BowCorpus):
     """
     Pipeline for training embeddings for questions via LDA algorithm
     on question titles and bodies
 
     :param que: raw questions.csv dataset
     :param dim: dimension of doc2vec embeddings to train
-    :return: trained tags, industries embeddings and question's Doc2Vec model
+    :param path: path to serialize bag-of-words corpus to, it has to outlive the returned corpus.
+    Usually it is in the dump folder, where pickled corpus is located after loading
+    :param workers: number of worker processes used for training
+    :return: trained Dictionary, TfidfModel, LDA model and serialized bag-of-words corpus
     """
-    lda_tokens = que['questions_whole'].apply(lambda x: x.split())
+    lda_tokens = Tokens(que['questions_whole'].values)
 
     # create Dictionary and train it on text corpus
     lda_dic = Dictionary(lda_tokens)
     lda_dic.filter_extremes(no_below=10, no_above=0.6, keep_n=8000)
-    lda_corpus = [lda_dic.doc2bow(doc) for doc in lda_tokens]
+
+    # serialize corpus once, every further pass streams it from disk
+    lda_corpus = BowCorpus.serialize(path, que['questions_id'].values, que['questions_whole'].values, lda_dic)
 
     # create TfidfModel and train it on text corpus
     lda_tfidf = TfidfModel(lda_corpus)
-    lda_corpus = lda_tfidf[lda_corpus]
 
-    # create LDA Model and train it on text corpus
+    # create LDA Model and train it on lazily transformed text corpus
     lda_model = LdaMulticore(
-        lda_corpus, num_topics=dim, id2word=lda_dic, workers=4,
+        lda_tfidf[lda_corpus], num_topics=dim, id2word=lda_dic, workers=workers,
         passes=20, chunksize=1000, random_state=0
     )
 
-    return lda_dic, lda_tfidf, lda_model
+    return lda_dic, lda_tfidf, lda_model, lda_corpus
@@ -66,31 +66,34 @@ class BaseProc(ABC):
             self.pp[feature] = preproc
         return preproc
 
-    def numerical(self, df: pd.DataFrame, feature: str, fillmode: str):
+    def numerical(self, df: pd.DataFrame, feature: str, fillmode: str, fit_rows: np.ndarray = None):
         """
         Transforms via StandardScaler, fills NaNs according to fillmode
 
         :param df: data to work with
         :param feature: name of a column in df that contains numerical data
         :param fillmode: method to fill NaNs, either 'mean' or 'zero'
+        :param fit_rows: boolean mask of rows to fit new preprocessor on, all rows by default
         """
+        fit_rows = np.ones(len(df), dtype=bool) if fit_rows is None else fit_rows
+
         # calculate default value and fill NaNs with it
         if fillmode == 'mean':
             if feature in self.pp:
                 na = self.pp[feature].mean_[0]
             else:
-                na = df[feature].mean()
+                na = df.loc[fit_rows, feature].mean()
         else:
             na = 0
 
-        df[feature].fillna(na, inplace=True)
+        df[feature] = df[feature].fillna(na)
 
         # standardize feature values
-        fit_data = df[feature].values.reshape(-1, 1).astype('float64')
-        sc = self.__get_preprocessor(fit_data, feature, StandardScaler)
-        df[feature] = sc.transform(fit_data)
+        data = df[feature].values.reshape(-1, 1).astype('float64')
+        sc = self.__get_preprocessor(data[fit_rows], feature, StandardScaler)
+        df[feature] = sc.transform(data).ravel().astype(np.float32)
 
-    def categorical(self, df: pd.DataFrame, feature: str, n: int):
+    def categorical(self, df: pd.DataFrame, feature: str, n: int, fit_rows: np.ndarray = None):
         """
         Encodes top n most popular values with different labels from 0 to n-1,
         remaining values with n and NaNs with n+1
@@ -99,34 +102,73 @@ class BaseProc(ABC):
         :param feature: name of a column in df that contains categorical data
         :param n: number of top by popularity values to move in separate categories.
                   0 to encode everything with different labels
+        :param fit_rows: boolean mask of rows to fit new preprocessor on, all rows by default
         """
-        vc = df[feature].value_counts()
+        fit = df[feature] if fit_rows is None else df.loc[fit_rows, feature]
+        vc = fit.value_counts()
         # number of unique values to leave
         n = len(vc) if n == 0 else n
         # unique values to leave
         top = set(vc[:n].index)
-        isin_top = df[feature].isin(top)
 
-        fit_data = df.loc[isin_top, feature]
+        fit_data = fit[fit.isin(top)]
         le = self.__get_preprocessor(fit_data, feature, LabelEncoder)
 
+        # codes are collected in integer array instead of being written into object column,
+        # NaNs are encoded with n+1
+        codes = np.full(len(df), n + 1, dtype=np.int64)
+
         # isin_le differs from isin_top if new preprocessor object was fitted
-        isin_le = df[feature].isin(set(le.classes_))
-        df.loc[isin_le, feature] = le.transform(df.loc[isin_le, feature])
+        isin_le = df[feature].isin(set(le.classes_)).values
+        codes[isin_le] = le.transform(df.loc[isin_le, feature])
 
-        # unique values to throw away - encode with single label n
-        bottom = set(vc.index) - set(le.classes_)
-        isin_bottom = df[feature].isin(bottom)
-        df.loc[isin_bottom, feature] = n
+        # unique values to throw away, including ones not seen in fit rows - encode with single label n
+        codes[df[feature].notnull().values & ~isin_le] = n
 
-        df[feature].fillna(n + 1, inplace=True)
+        df[feature] = codes.astype(np.int16 if n + 1 < np.iinfo(np.int16).max else np.int32)
 
-    def preprocess(self, df: pd.DataFrame):
+    def typed(self, df: pd.DataFrame, embs: list) -> pd.DataFrame:
+        """
+        Form final dataframe with strictly typed layout: entity's id, time as datetime64[ns],
+        categorical codes as int16 or int32 and numerical features and embeddings as float32
+
+        :param df: dataframe of entity's id, time and all the features in self.features['all'] order
+        :param embs: list of triples of embedding column's prefix, embedding vectors, one per row of df,
+        and their dimension
+        :return: new dataframe with embedding columns appended
+        """
+        categorical = {name for name, deg in self.features['categorical']}
+        df = df.copy()
+        df[df.columns[1]] = pd.to_datetime(df[df.columns[1]]).astype('datetime64[ns]')
+        for feature in self.features['all']:
+            if feature not in categorical:
+                df[feature] = df[feature].astype(np.float32)
+
+        # embedding columns are appended as whole float32 blocks
+        blocks = [pd.DataFrame(np.vstack(list(vectors)).astype(np.float32) if len(df) else np.empty((0, dim)),
+                               index=df.index, columns=[f'{prefix}_{i}' for i in range(dim)], dtype=np.float32)
+                  for prefix, vectors, dim in embs]
+        return pd.concat([df] + blocks, axis=1)
+
+    @staticmethod
+    def _fit_rows(times: pd.Series, fit_before: str = None) -> np.ndarray:
+        """
+        :return: boolean mask of rows with times before fit_before, None if it is not given
+        """
+        if fit_before is None:
+            return None
+        return (pd.to_datetime(times) < pd.Timestamp(fit_before)).values
+
+    def preprocess(self, df: pd.DataFrame, fit_rows: np.ndarray = None):
         """
         Full preprocessing pipeline
 
         :param df: data to work with
+        :param fit_rows: boolean mask of rows to fit new preprocessors on, all rows by default.
+        Already fitted preprocessors are reused as they are
         """
+        fit_rows = None if fit_rows is None else np.asarray(fit_rows, dtype=bool)
+
         # preprocess all date features
         self.features['gen'] = []
         if 'date' in self.features:
@@ -139,9 +181,9 @@ class BaseProc(ABC):
                 for feature in self.features['numerical'][fillmode] + \
                                (self.features['gen'] if fillmode == 'mean' else []):
                     if feature in df.columns:
-                        self.numerical(df, feature, fillmode)
+                        self.numerical(df, feature, fillmode, fit_rows)
 
         # preprocess all categorical features
         if 'categorical' in self.features:
             for feature, n in self.features['categorical']:
-                self.categorical(df, feature, n)
+                self.categorical(df, feature, n, fit_rows)
@@ -33,7 +33,7 @@ class ProProc(BaseProc):
     # TODO: add average question age
     # TODO: add average time between answers
 
-    def transform(self, pro, que, ans, tags) -> pd.DataFrame:
+    def transform(self, pro, que, ans, tags, fit_before: str = None) -> pd.DataFrame:
         """
         Main method to calculate, preprocess students's features and append textual embeddings
 
@@ -41,6 +41,8 @@ class ProProc(BaseProc):
         :param que: questions dataframe with preprocessed textual columns
         :param ans: answers dataframe with preprocessed textual columns
         :param tags: merged tags and tag_users dataframes with preprocessed textual columns
+        :param fit_before: only rows before this date are used to fit scalers and encoders, all rows by default.
+        Features are computed from the whole history, so rows before it are the same as with history cut there
         :return: dataframe of professional's id, timestamp and model-friendly professional's features after that timestamp
         """
         # aggregate tags for each professional
@@ -108,7 +110,9 @@ class ProProc(BaseProc):
         df = df.merge(pro, on='professionals_id').merge(tags_grouped, how='left', left_on='professionals_id',
                                                         right_on='tag_users_user_id')
         # launch feature pre-processing
-        self.preprocess(df)
+        # default snapshots are dated by professional's registration
+        fit_rows = self._fit_rows(df['professionals_time'].fillna(df['professionals_date_joined']), fit_before)
+        self.preprocess(df, fit_rows)
 
         # prepare subscribed tag embeddings
 
@@ -143,17 +147,8 @@ class ProProc(BaseProc):
         # re-order the columns
         df = df[['professionals_id', 'professionals_time'] + self.features['all']]
 
-        # append subscribed tag embeddings
-        for i in range(tag_emb_len):
-            df[f'pro_tag_emb_{i}'] = mean_tag_embs.apply(lambda x: x[i])
-
-        for i in range(industry_emb_len):
-            df[f'pro_ind_emb_{i}'] = ind_embs.apply(lambda x: x[i])
-
-        for i in range(head_emb_len):
-            df[f'pro_head_emb_{i}'] = head_embs.apply(lambda x: x[i])
-
-        for i in range(que_emb_len):
-            df[f'pro_que_emb_{i}'] = que_embs.apply(lambda x: x[i])
-
-        return df
+        # append subscribed tag, industry, headline and answered question's embeddings
+        return self.typed(df, [('pro_tag_emb', mean_tag_embs, tag_emb_len),
+                               ('pro_ind_emb', ind_embs, industry_emb_len),
+                               ('pro_head_emb', head_embs, head_emb_len),
+                               ('pro_que_emb', que_embs, que_emb_len)])
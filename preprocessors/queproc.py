@@ -1,7 +1,39 @@
+import copy
+import threading
+import multiprocessing
+from collections import OrderedDict
+
 import pandas as pd
 import numpy as np
 
 from preprocessors.baseproc import BaseProc
+from nlp.lda import text_key
+
+# state shared with forked worker processes, set by one pool at a time
+_state = {}
+_state_lock = threading.Lock()
+
+
+def _infer_lda(lda_model, lda_tfidf, seeds: list, bows: list) -> np.ndarray:
+    """
+    Infer topic vectors of a chunk of bag-of-words documents
+    """
+    # shallow copy shares model's arrays, but has its own random state, so concurrent calls don't interfere
+    lda_model = copy.copy(lda_model)
+    embs = []
+    # each document has its own random initialization seeded by its text,
+    # so its vector depends neither on number of workers nor on other documents inferred with it
+    for seed, bow in zip(seeds, bows):
+        lda_model.random_state = np.random.RandomState(seed)
+        embs.append(lda_model.inference([lda_tfidf[bow]])[0][0])
+    return np.array(embs, dtype=np.float32).reshape(len(bows), lda_model.num_topics)
+
+
+def _infer_lda_task(task: tuple) -> np.ndarray:
+    """
+    Infer topic vectors of a chunk in worker process, with model shared through _state
+    """
+    return _infer_lda(_state['lda_model'], _state['lda_tfidf'], *task)
 
 
 class QueProc(BaseProc):
@@ -9,7 +41,8 @@ class QueProc(BaseProc):
     Questions data preprocessor
     """
 
-    def __init__(self, tag_embs, ques_d2v, lda_dic, lda_tfidf, lda_model):
+    def __init__(self, tag_embs, ques_d2v, lda_dic, lda_tfidf, lda_model, lda_corpus=None,
+                 n_jobs: int = 1, chunk_size: int = 1000, cache_size: int = 100000):
         super().__init__()
 
         self.tag_embs = tag_embs
@@ -18,6 +51,13 @@ class QueProc(BaseProc):
         self.lda_dic = lda_dic
         self.lda_tfidf = lda_tfidf
         self.lda_model = lda_model
+        # serialized bag-of-words of questions LDA was trained on
+        self.lda_corpus = lda_corpus
+        # topic vectors of recently processed texts by their content hash, least recently used are evicted
+        self.lda_cache = OrderedDict()
+        self.cache_size = cache_size
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
 
         self.features = {
             'numerical': {
@@ -28,12 +68,99 @@ class QueProc(BaseProc):
 
         self._unroll_features()
 
-    def transform(self, que, tags):
+    def __getstate__(self):
+        # cached vectors are not saved to dump
+        state = self.__dict__.copy()
+        state['lda_cache'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        # attributes missing in dumps made by older versions
+        self.__dict__.update({'lda_corpus': None, 'n_jobs': 1, 'chunk_size': 1000, 'cache_size': 100000})
+        self.__dict__.update(state)
+        self.lda_cache = OrderedDict()
+
+    def locate(self, dump_path: str) -> bool:
+        """
+        Find serialized LDA corpus in the folder of loaded dump, questions are converted with dictionary without it
+
+        :return: whether the corpus is found
+        """
+        return self.lda_corpus is not None and self.lda_corpus.locate(dump_path)
+
+    def infer_lda(self, ids: np.ndarray, texts: np.ndarray) -> np.ndarray:
+        """
+        Infer LDA topic vectors of questions in chunks across a process pool,
+        skipping texts whose vectors are already cached
+
+        :param ids: ids of questions
+        :param texts: processed texts of questions, aligned with ids
+        :return: float32 matrix of topic vectors
+        """
+        keys = [text_key(text) for text in texts]
+
+        # cached vectors of unique texts, and the first position of each unique text missing in cache
+        found, missing = {}, {}
+        for i, key in enumerate(keys):
+            if key in found or key in missing:
+                continue
+            # cache is shared by serving threads, so a key may be evicted by another thread at any moment
+            emb = self.lda_cache.get(key)
+            if emb is None:
+                missing[key] = i
+                continue
+            found[key] = emb
+            try:
+                self.lda_cache.move_to_end(key)
+            except KeyError:
+                pass
+        if missing:
+            pos = list(missing.values())
+            embs = dict(zip(missing.keys(), self.__infer_lda(ids[pos], texts[pos], list(missing.keys()))))
+            found.update(embs)
+            self.lda_cache.update(embs)
+            try:
+                while len(self.lda_cache) > self.cache_size:
+                    self.lda_cache.popitem(last=False)
+            except KeyError:
+                pass
+
+        return np.array([found[key] for key in keys], dtype=np.float32) \
+            .reshape(len(keys), self.lda_model.num_topics)
+
+    def __infer_lda(self, ids: np.ndarray, texts: np.ndarray, keys: list) -> np.ndarray:
+        """
+        Infer LDA topic vectors of questions without cache
+        """
+        if self.lda_corpus is not None:
+            bows = self.lda_corpus.get(ids, texts, self.lda_dic)
+        else:
+            bows = [self.lda_dic.doc2bow(text.split()) for text in texts]
+        seeds = [int.from_bytes(key[:4], 'little') for key in keys]
+        tasks = [(seeds[start:start + self.chunk_size], bows[start:start + self.chunk_size])
+                 for start in range(0, len(bows), self.chunk_size)]
+
+        if self.n_jobs > 1 and len(tasks) > 1:
+            with _state_lock:
+                _state.update(lda_model=self.lda_model, lda_tfidf=self.lda_tfidf)
+                try:
+                    with multiprocessing.Pool(min(self.n_jobs, len(tasks))) as pool:
+                        embs = pool.map(_infer_lda_task, tasks)
+                finally:
+                    _state.clear()
+        else:
+            embs = [_infer_lda(self.lda_model, self.lda_tfidf, *task) for task in tasks]
+
+        return np.vstack(embs)
+
+    def transform(self, que, tags, fit_before: str = None):
         """
         Main method to calculate, preprocess question's features and append textual embeddings
 
         :param que: questions dataframe with preprocessed textual columns
         :param tags: merged tags and tag_questions dataframes with preprocessed textual columns
+        :param fit_before: only rows before this date are used to fit scalers and encoders, all rows by default.
+        Features are computed from the whole history, so rows before it are the same as with history cut there
         :return: dataframe of question's id, question's date added and model-friendly question's features
         """
         que['questions_time'] = que['questions_date_added']
@@ -46,7 +173,7 @@ class QueProc(BaseProc):
         df = que.merge(tags_grouped, how='left', left_on='questions_id', right_on='tag_questions_question_id')
 
         # launch feature pre-processing
-        self.preprocess(df)
+        self.preprocess(df, self._fit_rows(df['questions_time'], fit_before))
 
         # prepare tag embeddings
 
@@ -63,10 +190,8 @@ class QueProc(BaseProc):
 
         mean_embs = df['tags_tag_name'].apply(__convert)
 
-        lda_emb_len = len(self.lda_model[[]])
-        lda_corpus = [self.lda_dic.doc2bow(doc) for doc in df['questions_whole'].apply(lambda x: x.split())]
-        lda_corpus = self.lda_tfidf[lda_corpus]
-        lda_que_embs = self.lda_model.inference(lda_corpus)[0]
+        lda_emb_len = self.lda_model.num_topics
+        lda_que_embs = self.infer_lda(df['questions_id'].values, df['questions_whole'].values)
 
         d2v_emb_len = len(self.ques_d2v.infer_vector([]))
 
@@ -79,16 +204,7 @@ class QueProc(BaseProc):
         # re-order the columns
         df = df[['questions_id', 'questions_time'] + self.features['all']]
 
-        # append lda question embeddings
-        for i in range(lda_emb_len):
-            df[f'que_lda_emb_{i}'] = lda_que_embs[:, i]
-
-        # append d2v question embeddings
-        for i in range(d2v_emb_len):
-            df[f'que_d2v_emb_{i}'] = d2v_que_embs.apply(lambda x: x[i])
-
-        # append tag embeddings
-        for i in range(tag_emb_len):
-            df[f'que_tag_emb_{i}'] = mean_embs.apply(lambda x: x[i])
-
-        return df
+        # append lda, d2v and tag question embeddings
+        return self.typed(df, [('que_lda_emb', lda_que_embs, lda_emb_len),
+                               ('que_d2v_emb', d2v_que_embs, d2v_emb_len),
+                               ('que_tag_emb', mean_embs, tag_emb_len)])
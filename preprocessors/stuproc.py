@@ -25,13 +25,15 @@ class StuProc(BaseProc):
 
         self._unroll_features()
 
-    def transform(self, stu, que, ans) -> pd.DataFrame:
+    def transform(self, stu, que, ans, fit_before: str = None) -> pd.DataFrame:
         """
         Main method to calculate, preprocess students's features and append textual embeddings
 
         :param stu: students dataframe with preprocessed textual columns
         :param que: questions dataframe with preprocessed textual columns
         :param ans: answers dataframe with preprocessed textual columns
+        :param fit_before: only rows before this date are used to fit scalers and encoders, all rows by default.
+        Features are computed from the whole history, so rows before it are the same as with history cut there
         :return: dataframe of students's id, timestamp and model-friendly students's features after that timestamp
         """
         stu['students_state'] = stu['students_location'].apply(lambda s: str(s).split(', ')[-1])
@@ -104,9 +106,10 @@ class StuProc(BaseProc):
 
         df = df.merge(stu, on='students_id')
         # launch feature pre-processing
-        self.preprocess(df)
+        # default snapshots are dated by student's registration
+        self.preprocess(df, self._fit_rows(df['students_time'].fillna(df['students_date_joined']), fit_before))
 
         # re-order the columns
         df = df[['students_id', 'students_time'] + self.features['all']]
 
-        return df
+        return self.typed(df, [])
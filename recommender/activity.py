@@ -1,6 +1,10 @@
 import numpy as np
+import pandas as pd
 from scipy.stats import t
 
+# number of nanoseconds in one day, used to convert int64 dates to days
+DAY_NS = np.timedelta64(1, 'D').astype('timedelta64[ns]').astype(np.int64)
+
 def activity_filter(ans_dates: np.ndarray, cur_date: np.datetime64, tail_prob: np.double=0.05,
                     min_days: np.double=0.5, max_days: np.double=15):
     """
@@ -122,4 +126,270 @@ def email_filter(que: str, email_ques: np.ndarray, email_dates: np.ndarray,
     score = 2 * email_frac * ans_prob / (email_frac + ans_prob)
     
     # send email if F1 score is larger than threshold
-    return score > thresh
\ No newline at end of file
+    return score > thresh
+
+
+def to_ns(dates) -> np.ndarray:
+    """
+    Convert dates of any numpy or pandas datetime type to int64 nanoseconds
+    
+    :param dates: scalar or array of dates, or int64 nanoseconds already
+    """
+    dates = np.asarray(dates)
+    if dates.dtype.kind == 'i':
+        return dates.astype(np.int64)
+    return dates.astype('datetime64[ns]').astype(np.int64)
+
+
+def build_csr(codes: np.ndarray, n: int, dates: np.ndarray, *columns) -> tuple:
+    """
+    Group events by integer entity codes into CSR layout,
+    sorting events of each entity by date
+    
+    :param codes: integer codes of entities in range [0, n) each event belongs to
+    :param n: total number of entities
+    :param dates: dates of events
+    :param columns: any other arrays aligned with codes to reorder in the same way
+    :return: offsets of length n + 1, int64 dates and reordered columns
+    """
+    dates = to_ns(dates)
+    order = np.lexsort((dates, codes))
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=n), out=offsets[1:])
+    return (offsets, dates[order]) + tuple(np.asarray(col)[order] for col in columns)
+
+
+def segment_t_params(values: np.ndarray, segments: np.ndarray, n: int,
+                     min_days: np.double, max_days: np.double) -> tuple:
+    """
+    Estimate parameters of t-distribution in each segment at once,
+    just like it is done for single professional in activity_filter and email_filter
+    
+    :param values: interval lengths in days
+    :param segments: segment index of each value
+    :param n: total number of segments
+    :param min_days: lower bound to clip interval lengths
+    :param max_days: upper bound to clip interval lengths
+    :return: number of values, loc and scale for each segment
+    """
+    values = np.clip(values, min_days, max_days)
+    sizes = np.bincount(segments, minlength=n)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        locs = np.bincount(segments, weights=values, minlength=n) / sizes
+        # two-pass variance is numerically safer than sum of squares
+        sq_dev = np.bincount(segments, weights=(values - locs[segments]) ** 2, minlength=n)
+        stds = np.sqrt(sq_dev / (sizes - 1))
+    
+    scales = np.fmax(stds, min_days)
+    return sizes, locs, scales
+
+
+def activity_filter_bulk(offsets: np.ndarray, dates: np.ndarray, cur_date: np.datetime64,
+                         tail_prob: np.double=0.05, min_days: np.double=0.5, max_days: np.double=15) -> np.ndarray:
+    """
+    Vectorized version of activity_filter for all the professionals at once.
+    
+    :param offsets: CSR offsets, dates of i-th professional are dates[offsets[i]:offsets[i + 1]]
+    :param dates: int64 nanoseconds of professionals' sorted answer dates,
+    the first date of each professional is registration date
+    :param cur_date: np.datetime64 object containing current date
+    :param tail_prob: tail probability of t-distribution
+    :param min_days: minimum number of days after previous answer date
+    :param max_days: maximum number of days after previous answer date
+    :return: boolean mask of active professionals
+    """
+    offsets, dates = np.asarray(offsets, dtype=np.int64), to_ns(dates)
+    n = offsets.size - 1
+    sizes = np.diff(offsets)
+    nonempty = sizes > 0
+    
+    # distance between current date and previous answer date
+    realiz = np.full(n, np.nan)
+    realiz[nonempty] = (to_ns(cur_date) - dates[offsets[1:][nonempty] - 1]) / DAY_NS
+    
+    # intervals between consecutive dates inside the same professional
+    segments = np.repeat(np.arange(n), sizes)
+    inside = segments[1:] == segments[:-1]
+    int_lens = (np.diff(dates) / DAY_NS)[inside]
+    _, locs, scales = segment_t_params(int_lens, segments[1:][inside], n, min_days, max_days)
+    
+    # professionals with less than two answers so far are checked by min_days and max_days only
+    active = (realiz > min_days) & (realiz < max_days)
+    
+    # others are checked by probability of realization to come from t-distribution
+    many = sizes >= 3
+    prob = t.cdf(realiz[many], df=sizes[many] - 2, loc=locs[many], scale=scales[many])
+    prob = np.minimum(prob, 1 - prob)
+    active[many] = ((prob > tail_prob / 2) | (realiz[many] < max_days)) & (realiz[many] > min_days)
+    
+    return active
+
+
+class FilterEngine:
+    """
+    Batch version of spam_filter and email_filter,
+    which makes decisions for all the (professional, question) candidate pairs of a mailing round at once
+    """
+    
+    def __init__(self, email_pros: np.ndarray, email_ques: np.ndarray, email_dates: np.ndarray,
+                 ans_pros: np.ndarray, ans_ques: np.ndarray, ans_dates: np.ndarray,
+                 pro_ids: np.ndarray = (), que_ids: np.ndarray = ()):
+        """
+        :param email_pros: ids of email-notified professionals
+        :param email_ques: ids of questions professionals were email-notified about
+        :param email_dates: dates email notifications were sent
+        :param ans_pros: ids of answer authors
+        :param ans_ques: ids of answered questions
+        :param ans_dates: answer dates
+        :param pro_ids: ids of other professionals emails can be added for later, see add_emails
+        :param que_ids: ids of other questions emails can be added for later, see add_emails
+        """
+        # intern professional's and question's ids into integer codes
+        self.pro_index = pd.Index(np.unique(np.concatenate([np.asarray(email_pros, dtype=object),
+                                                            np.asarray(ans_pros, dtype=object),
+                                                            np.asarray(pro_ids, dtype=object)])))
+        self.que_index = pd.Index(np.unique(np.concatenate([np.asarray(email_ques, dtype=object),
+                                                            np.asarray(ans_ques, dtype=object),
+                                                            np.asarray(que_ids, dtype=object)])))
+        n_pros, n_ques = len(self.pro_index), len(self.que_index)
+        
+        email_pros, email_ques = self.pro_index.get_indexer(email_pros), self.que_index.get_indexer(email_ques)
+        ans_pros, ans_ques = self.pro_index.get_indexer(ans_pros), self.que_index.get_indexer(ans_ques)
+        
+        # index emails by professional to get number of emails and previous email date
+        offsets, dates = build_csr(email_pros, n_pros, email_dates)
+        self.email_counts = np.diff(offsets)
+        self.last_email = np.full(n_pros, np.iinfo(np.int64).min)
+        self.last_email[self.email_counts > 0] = dates[offsets[1:][self.email_counts > 0] - 1]
+        
+        # hashed set of already emailed (professional, question) pairs
+        email_keys, email_dates = FilterEngine.__first_events(email_pros * n_ques + email_ques, email_dates)
+        self.emailed = pd.Index(email_keys)
+        
+        # select answered email-notified questions, and also email and answer dates assosiated to them
+        ans_keys, ans_dates = FilterEngine.__first_events(ans_pros * n_ques + ans_ques, ans_dates)
+        keys, email_idx, ans_idx = np.intersect1d(email_keys, ans_keys, assume_unique=True, return_indices=True)
+        self.matched_pros = keys // n_ques
+        self.matched_lens = (ans_dates[ans_idx] - email_dates[email_idx]) / DAY_NS
+        
+        self.n_ques = n_ques
+        self.scores = {}
+    
+    @staticmethod
+    def __first_events(keys: np.ndarray, dates: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Leave only the earliest event for each unique key
+        """
+        dates = to_ns(dates)
+        order = np.lexsort((dates, keys))
+        keys, dates = keys[order], dates[order]
+        first = np.ones(keys.size, dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        return keys[first], dates[first]
+    
+    def __encode(self, pros: np.ndarray, ques: np.ndarray) -> (np.ndarray, np.ndarray):
+        return self.pro_index.get_indexer(pros), self.que_index.get_indexer(ques)
+    
+    def add_emails(self, pros: np.ndarray, ques: np.ndarray, dates: np.ndarray):
+        """
+        Add newly sent emails to spam filter state, answers are not changed
+        
+        :param pros: ids of email-notified professionals, all of them must be known
+        :param ques: ids of questions professionals were email-notified about, all of them must be known
+        :param dates: dates email notifications were sent
+        """
+        pro_codes, que_codes = self.__encode(pros, ques)
+        unknown = (pro_codes < 0) | (que_codes < 0)
+        if unknown.any():
+            raise KeyError((np.asarray(pros)[unknown][0], np.asarray(ques)[unknown][0]))
+        dates = np.broadcast_to(to_ns(dates), pro_codes.shape)
+        
+        self.email_counts += np.bincount(pro_codes, minlength=self.email_counts.size)
+        np.maximum.at(self.last_email, pro_codes, dates)
+        self.emailed = pd.Index(np.union1d(self.emailed.values.astype(np.int64), pro_codes * self.n_ques + que_codes))
+        # fractions of answered emails have changed
+        self.scores = {}
+    
+    def email_scores(self, offset_days: np.double, min_days: np.double=0.5, max_days: np.double=7) -> np.ndarray:
+        """
+        Compute F1 score of each known professional, as in email_filter.
+        Professionals with less than 2 answered email-notified questions get NaN
+        
+        :param offset_days: period (in days) during which we want question to be answered
+        :param min_days: minimum number of days after previous email notification
+        :param max_days: number of days on which to clip interval lengths
+        :return: array of scores aligned with self.pro_index
+        """
+        params = (offset_days, min_days, max_days)
+        if params in self.scores:
+            return self.scores[params]
+        
+        n_pros = len(self.pro_index)
+        sizes, locs, scales = segment_t_params(self.matched_lens, self.matched_pros, n_pros, min_days, max_days)
+        
+        scores = np.full(n_pros, np.nan)
+        many = sizes >= 2
+        
+        # fraction of email-notified questions that were answered
+        email_frac = sizes[many] / self.email_counts[many]
+        # probability of answering an email-notified question within offset_days period
+        ans_prob = t.cdf(offset_days, df=sizes[many] - 1, loc=locs[many], scale=scales[many])
+        scores[many] = 2 * email_frac * ans_prob / (email_frac + ans_prob)
+        
+        self.scores[params] = scores
+        return scores
+    
+    def spam_filter(self, pros: np.ndarray, ques: np.ndarray, cur_date: np.datetime64,
+                    min_days: np.double=0.5) -> np.ndarray:
+        """
+        Vectorized spam_filter for candidate pairs
+        
+        :param pros: professional's ids of candidate pairs
+        :param ques: question's ids of candidate pairs
+        :param cur_date: np.datetime64 object containing current date
+        :param min_days: minimum number of days after previous email notification
+        :return: boolean mask of pairs which passed the filter
+        """
+        pro_codes, que_codes = self.__encode(pros, ques)
+        return self.__spam_mask(pro_codes, que_codes, cur_date, min_days)
+    
+    def __spam_mask(self, pro_codes: np.ndarray, que_codes: np.ndarray, cur_date: np.datetime64,
+                    min_days: np.double) -> np.ndarray:
+        known = pro_codes >= 0
+        
+        # professionals without any emails are always allowed to be notified
+        passed = np.ones(pro_codes.size, dtype=bool)
+        last = self.last_email[pro_codes[known]]
+        recent = (self.email_counts[pro_codes[known]] > 0) & ((to_ns(cur_date) - last) / DAY_NS < min_days)
+        
+        # membership of already emailed pairs is checked via hash table
+        emailed = (que_codes[known] >= 0) & \
+                  (self.emailed.get_indexer(pro_codes[known] * self.n_ques + que_codes[known]) >= 0)
+        passed[known] = ~(recent | emailed)
+        return passed
+    
+    def email_filter(self, pros: np.ndarray, ques: np.ndarray, cur_date: np.datetime64, offset_days: np.double,
+                     min_days: np.double=0.5, max_days: np.double=7, thresh: np.double=0.1) -> np.ndarray:
+        """
+        Vectorized email_filter for candidate pairs
+        
+        :param pros: professional's ids of candidate pairs
+        :param ques: question's ids of candidate pairs
+        :param cur_date: np.datetime64 object containing current date
+        :param offset_days: period (in days) during which we want question to be answered
+        :param min_days: minimum number of days after previous email notification
+        :param max_days: number of days on which to clip interval lengths
+        :param thresh: threshold for F1 score
+        :return: boolean mask of pairs to send email about
+        """
+        pro_codes, que_codes = self.__encode(pros, ques)
+        passed = self.__spam_mask(pro_codes, que_codes, cur_date, min_days)
+        
+        scores = self.email_scores(offset_days, min_days, max_days)
+        known = pro_codes >= 0
+        good = np.zeros(pro_codes.size, dtype=bool)
+        with np.errstate(invalid='ignore'):
+            good[known] = scores[pro_codes[known]] > thresh
+        
+        return passed & good
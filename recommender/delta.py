@@ -0,0 +1,134 @@
+import numpy as np
+
+from sklearn.neighbors import KDTree
+
+
+def build_kdtree(vectors: np.ndarray, positions: np.ndarray) -> KDTree:
+    """
+    Default builder of main index of DeltaIndex
+    """
+    return KDTree(vectors)
+
+
+class DeltaIndex:
+    """
+    Latent index accepting inserts, replacements and removals without rebuild.
+    New and replaced vectors go to delta buffer searched by brute force, removed and outdated ones are masked
+    out of results of the main index, and both are merged into it once there are enough of them.
+    Has the same query interface as sklearn's KDTree, returned indices are positions of vectors
+    """
+
+    def __init__(self, vectors: np.ndarray, main=None, build=build_kdtree, merge_size: int = 10000):
+        """
+        :param vectors: latent vectors, their positions are kept stable through all the updates
+        :param main: already built index over vectors, built with build if not given
+        :param build: function building main index from matrix of vectors and their positions
+        :param merge_size: number of buffered inserts or removals triggering merge
+        """
+        self.vectors = np.array(vectors, dtype=np.float32)
+        self.build = build
+        self.merge_size = merge_size
+
+        self.main = build(self.vectors, np.arange(self.vectors.shape[0])) if main is None else main
+        # positions of vectors in the main index and in the delta buffer
+        self.main_positions = np.arange(self.vectors.shape[0])
+        self.delta = np.empty(0, dtype=np.int64)
+        self.removed = np.zeros(self.vectors.shape[0], dtype=bool)
+        # positions whose entries in the main index are outdated, because they were removed or replaced
+        self.stale = np.zeros(self.vectors.shape[0], dtype=bool)
+        self.stale_main = 0
+
+    def __len__(self):
+        return self.main_positions.size - self.stale_main + (~self.removed[self.delta]).sum()
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Insert new vectors
+
+        :return: their positions
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        positions = np.arange(self.vectors.shape[0], self.vectors.shape[0] + vectors.shape[0])
+        self.vectors = np.vstack([self.vectors, vectors])
+        self.removed = np.concatenate([self.removed, np.zeros(positions.size, dtype=bool)])
+        self.stale = np.concatenate([self.stale, np.zeros(positions.size, dtype=bool)])
+        self.delta = np.concatenate([self.delta, positions])
+
+        if self.delta.size >= self.merge_size:
+            self.merge()
+        return positions
+
+    def replace(self, positions: np.ndarray, vectors: np.ndarray):
+        """
+        Replace vectors at given positions, keeping the positions. Removed positions are restored
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        self.vectors[positions] = vectors
+        self.removed[positions] = False
+        self.__invalidate(positions)
+        # new versions are searched in the delta buffer until the next merge
+        self.delta = np.union1d(self.delta, positions)
+
+        if self.delta.size >= self.merge_size or self.stale_main >= self.merge_size:
+            self.merge()
+
+    def remove(self, positions: np.ndarray):
+        """
+        Remove vectors at given positions, their positions are reused only by replace
+        """
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        self.removed[positions] = True
+        self.__invalidate(positions)
+
+        if self.stale_main >= self.merge_size:
+            self.merge()
+
+    def __invalidate(self, positions: np.ndarray):
+        """
+        Mask entries of the main index at given positions out of results
+        """
+        positions = positions[~self.stale[positions]]
+        positions = positions[np.isin(positions, self.main_positions)]
+        self.stale[positions] = True
+        self.stale_main += positions.size
+
+    def merge(self):
+        """
+        Rebuild main index from all the live vectors and empty the delta buffer
+        """
+        live = np.flatnonzero(~self.removed)
+        main, self.main = self.main, self.build(self.vectors[live], live)
+        self.main_positions, self.delta = live, np.empty(0, dtype=np.int64)
+        self.stale, self.stale_main = np.zeros(self.vectors.shape[0], dtype=bool), 0
+
+        # indices holding worker processes have to be stopped
+        if hasattr(main, 'close'):
+            main.close()
+
+    def query(self, x: np.ndarray, k: int = 1) -> (np.ndarray, np.ndarray):
+        """
+        Find k nearest live vectors for each row of x
+
+        :param x: query vectors
+        :param k: number of neighbours, fewer are returned if there are fewer live vectors
+        :return: distances and positions of neighbours, both sorted by distance
+        """
+        x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+        rows = np.arange(x.shape[0])[:, None]
+
+        # main index over-fetches by the number of its stale entries, which are masked afterwards
+        dists, positions = np.empty((x.shape[0], 0)), np.empty((x.shape[0], 0), dtype=np.int64)
+        if self.main_positions.size:
+            dists, ind = self.main.query(x, k=min(k + self.stale_main, self.main_positions.size))
+            positions = self.main_positions[ind]
+            dists = np.where(self.stale[positions], np.inf, dists)
+
+        # delta buffer is searched by brute force
+        delta = self.delta[~self.removed[self.delta]]
+        if delta.size:
+            d = np.sqrt(np.square(x[:, None, :] - self.vectors[delta][None, :, :]).sum(axis=2))
+            dists, positions = np.hstack([dists, d]), np.hstack([positions, np.tile(delta, (x.shape[0], 1))])
+
+        k = min(k, len(self))
+        order = np.argsort(dists, axis=1, kind='mergesort')[:, :k]
+        return dists[rows, order], positions[rows, order]
@@ -10,6 +10,7 @@ import pandas as pd
 from models.distance import DistanceModel
 from recommender.predictor import Predictor, Formatter
 from utils.utils import TextProcessor
+from utils.loader import load_table, load_tables
 
 pd.set_option('display.max_columns', 100, 'display.width', 1024)
 
@@ -34,9 +35,18 @@ if __name__ == '__main__':
         pro_proc = d['pro_proc']
         que_to_stu = d['que_to_stu']
         pos_pairs = d['pos_pairs']
+    # serialized LDA corpus is kept next to dump.pkl
+    que_proc.locate(DUMP_PATH)
     pred = Predictor(model, que_data, stu_data, pro_data, que_proc, pro_proc, que_to_stu, pos_pairs)
 
-    formatter = Formatter(DATA_PATH)
+    formatter = Formatter(DATA_PATH, DUMP_PATH)
+
+    # tag inverted indices for hybrid queries, tag names are processed the same way as in queries
+    raw = load_tables(DATA_PATH, ['tags', 'tag_questions', 'tag_users'])
+    tags = raw['tags']
+    tags['tags_tag_name'] = tags['tags_tag_name'].apply(lambda x: tp.process(x, allow_stopwords=True))
+    pred.index_tags(raw['tag_questions'].merge(tags, left_on='tag_questions_tag_id', right_on='tags_tag_id'),
+                    raw['tag_users'].merge(tags, left_on='tag_users_tag_id', right_on='tags_tag_id'))
 
     # From ques
 
@@ -55,17 +65,22 @@ if __name__ == '__main__':
     tmp = pred.find_pros_by_que(que_df, que_tags)
     print(formatter.get_pro(tmp))
 
+    # only professionals subscribed to question's tags are scored
+    tmp = pred.find_pros_by_que(que_df, que_tags, hybrid=True)
+    print(formatter.get_pro(tmp))
+
     tmp = pred.find_ques_by_que(que_df, que_tags)
     print(formatter.get_que(tmp))
 
     # From pros
 
-    ans_df = pd.read_csv(os.path.join(DATA_PATH, 'answers.csv'))
-    que_df = pd.read_csv(os.path.join(DATA_PATH, 'questions.csv'))
-    que_df['questions_title'] = que_df['questions_title'].apply(tp.process)
-    que_df['questions_body'] = que_df['questions_body'].apply(tp.process)
+    ans_df = load_table(DATA_PATH, 'answers')
     ans_df['answers_body'] = ans_df['answers_body'].apply(tp.process)
-    que_df['questions_whole'] = que_df['questions_title'] + ' ' + que_df['questions_body']
+
+    # reuse raw questions already loaded by formatter
+    que_df = formatter.que[['questions_id', 'questions_author_id', 'questions_date_added']].copy()
+    que_df['questions_body'] = formatter.que['questions_body'].apply(tp.process)
+    que_df['questions_whole'] = formatter.que['questions_title'].apply(tp.process) + ' ' + que_df['questions_body']
 
     pro_dict = {'professionals_id': ['eae09bbc30e34f008e10d5aa70d521b2'],
                 'professionals_location': ['Narberth, Pennsylvania'],
@@ -1,53 +1,66 @@
+import sys
+
+sys.path.extend(['..'])
+
+import os
+import pickle
+import argparse
+import multiprocessing
+
 import numpy as np
 import pandas as pd
 
-from activity import activity_filter, spam_filter
+from recommender.activity import activity_filter, spam_filter, activity_filter_bulk, build_csr, FilterEngine
+from models.distance import DistanceModel
+from recommender.predictor import Predictor, Formatter
+from recommender.exclusion import PairedIndex, query_unseen
+from utils.loader import load_tables
 
 
-def send_quesionts_to_professional(pro_sample_dict, pro_answer_dates, questions,
-                                   answers, pro_email_ques, current_date=np.datetime64('now'), 
+def send_quesionts_to_professional(predictor: Predictor, formatter: Formatter, pro_sample_dict, pro_answer_dates,
+                                   questions, answers, pro_email_ques, current_date=np.datetime64('now'),
                                    top_content=20, min_days=7):
     eps_1 = 0.01
     eps_2 = 0.5
     eps_3 = 0.3
-    
+
     # Get top n suggested questions
     pro_sample_df, pro_sample_tags = Formatter.convert_pro_dict(pro_sample_dict)
     tmp = predictor.find_ques_by_pro(pro_sample_df, questions, answers, pro_sample_tags, top=top_content)
     content_result = formatter.get_que(tmp)
     que_ids = content_result['questions_id'].values
-    
+
     # Get answer dates for professional
     pro_id = pro_sample_df['professionals_id'].iloc[0]
     answer_dates = pro_answer_dates.loc[pro_id].values
-    
+
     # Check if professional is active
     is_active = activity_filter(answer_dates, current_date)
-    
+
     # Exclude dates that are greater than current date
     try:
         email_ques = pro_email_ques['questions_id'].loc[pro_id].values
         email_dates = pro_email_ques['emails_date_sent'].loc[pro_id].values
 
         email_ques, email_dates = email_ques[email_dates < current_date], email_dates[email_dates < current_date]
-    except:
+    except KeyError:
         email_ques = []
         email_dates = []
 
-    if not email_ques:
+    if len(email_ques) == 0:
         mask = [True] * len(que_ids)
     else:
         mask = []
         for que_id in que_ids:
-            mask.append(spam_filter(que_id, email_ques, email_dates.max(), cur_date, min_days=min_days))
-    
+            mask.append(spam_filter(que_id, email_ques, email_dates.max(), current_date, min_days=min_days))
+
     # Divide mails to spam / not spam
     mask = np.array(mask)
     passed_questions = que_ids[mask]
     spam_questions = que_ids[~mask]
-    
+
     explore_questions = []
-    
+
     # epsilon greedy
     if is_active:
         if passed_questions.size > 0:
@@ -59,12 +72,292 @@ def send_quesionts_to_professional(pro_sample_dict, pro_answer_dates, questions,
             e_cond = eps_2
         else:
             e_cond = eps_3
-    
+
         for sq in spam_questions:
             if np.random.rand() < e_cond:
                 explore_questions.append(sq)
-            
-    final_q_ids = np.append(passed_questions, explore_questions)       
+
+    final_q_ids = np.append(passed_questions, explore_questions)
     final_df = content_result[content_result['questions_id'].isin(final_q_ids)]
-    
+
     return final_df
+
+
+def epsilon_greedy(local: np.ndarray, passed: np.ndarray, is_active: np.ndarray, eps: tuple,
+                   rng: np.random.RandomState) -> np.ndarray:
+    """
+    Vectorized epsilon greedy step of send_quesionts_to_professional for many professionals at once
+
+    :param local: index of professional in is_active for each candidate pair
+    :param passed: whether candidate pair passed spam filter
+    :param is_active: whether professional is active
+    :param eps: exploration probabilities for spam questions of
+    active professional with passed questions, inactive one with passed questions, and inactive one without them
+    :param rng: seeded random generator
+    :return: mask of spam pairs to send anyway
+    """
+    # probability of exploration depends on activity and presence of passed questions
+    has_passed = np.bincount(local, weights=passed, minlength=is_active.size) > 0
+    eps_1, eps_2, eps_3 = eps
+    eps = np.where(is_active, np.where(has_passed, eps_1, 0), np.where(has_passed, eps_2, eps_3))
+    return ~passed & (rng.random_sample(passed.size) < eps[local])
+
+
+class Dispatcher:
+    """
+    Batched version of send_quesionts_to_professional,
+    which runs recommend -> activity filter -> spam filter -> epsilon exploration
+    for all the known professionals at once
+    """
+
+    def __init__(self, pro_ids: np.ndarray, pro_lat_vecs: np.ndarray, que_ids: np.ndarray, que_tree,
+                 entity_to_paired: dict, professionals: pd.DataFrame, answers: pd.DataFrame, emails: pd.DataFrame,
+                 top_content: int = 20, min_days: float = 7, eps: tuple = (0.01, 0.5, 0.3),
+                 active_min_days: float = 0.5, active_max_days: float = 15, batch_size: int = 10000):
+        """
+        :param pro_ids: ids of professionals to dispatch questions to
+        :param pro_lat_vecs: latent vectors of professionals
+        :param que_ids: ids of questions in que_tree
+        :param que_tree: KDTree built on latent vectors of questions
+        :param entity_to_paired: mappings from entity to other entities it was in positive pair
+        :param professionals: professionals data with registration dates
+        :param answers: answers data with authors and dates
+        :param emails: emails data merged with matches, with columns
+        'emails_recipient_id', 'questions_id' and 'emails_date_sent'
+        :param top_content: number of recommended questions for each professional
+        :param min_days: minimum number of days after previous email notification
+        :param eps: exploration probabilities for spam questions of
+        active professional with passed questions, inactive one with passed questions, and inactive one without them
+        :param active_min_days: minimum number of days after previous answer date for activity filter
+        :param active_max_days: maximum number of days after previous answer date for activity filter
+        :param batch_size: number of professionals queried from que_tree at once
+        """
+        self.pro_ids = np.asarray(pro_ids).ravel()
+        self.pro_lat_vecs = pro_lat_vecs
+        self.que_ids = np.asarray(que_ids).ravel()
+        self.que_tree = que_tree
+
+        self.top_content = top_content
+        self.min_days = min_days
+        self.eps = eps
+        self.active_min_days = active_min_days
+        self.active_max_days = active_max_days
+        self.batch_size = batch_size
+
+        # already paired questions of each professional, which are never recommended
+        self.paired = PairedIndex({pro: entity_to_paired[pro] for pro in self.pro_ids if pro in entity_to_paired},
+                                  self.que_ids)
+
+        # raw data needed for activity and spam filters, sorted by dates once
+        self.pro_dates = pd.Series(professionals['professionals_date_joined'].values,
+                                   index=professionals['professionals_id'].values)
+        self.answers = answers[['answers_author_id', 'answers_date_added']].sort_values('answers_date_added')
+        self.emails = emails[['emails_recipient_id', 'questions_id', 'emails_date_sent']] \
+            .sort_values('emails_date_sent')
+
+    @classmethod
+    def from_predictor(cls, predictor: Predictor, professionals: pd.DataFrame, answers: pd.DataFrame,
+                       emails: pd.DataFrame, **kwargs):
+        """
+        Create Dispatcher from latent vectors and index already computed by Predictor, removed professionals are skipped
+        """
+        live = ~predictor.pro_tree.removed
+        return cls(predictor.pro_ids[live], predictor.pro_lat_vecs[live], predictor.que_ids, predictor.que_tree,
+                   predictor.entity_to_paired, professionals, answers, emails, **kwargs)
+
+    def shard(self, shard: int, n_shards: int) -> np.ndarray:
+        """
+        Positions of professionals that belong to the given shard.
+        Shards are contiguous ranges of sorted professional's ids, so they are stable between runs
+
+        :param shard: index of the shard, from 0 to n_shards - 1
+        :param n_shards: total number of shards
+        """
+        return np.array_split(np.argsort(self.pro_ids, kind='mergesort'), n_shards)[shard]
+
+    def __recommend(self, pos: np.ndarray, que_index, n_ques: int, **kwargs) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Get top questions for professionals at given positions, except the ones they are paired with
+
+        :return: indices of professionals in pos, positions of questions and scores of recommended pairs
+        """
+        pro_local, que_pos, scores = [], [], []
+        for start in range(0, pos.size, self.batch_size):
+            batch = np.arange(start, min(start + self.batch_size, pos.size))
+            # over-fetch and refill, so every professional gets top_content questions not paired with them
+            dists, ques = query_unseen(que_index, self.pro_lat_vecs[pos[batch]], self.pro_ids[pos[batch]],
+                                       self.top_content, self.paired, n_ques, **kwargs)
+
+            pros, ques, dists = np.repeat(batch, ques.shape[1]), ques.ravel(), dists.ravel()
+            new = ques >= 0
+
+            pro_local.append(pros[new])
+            que_pos.append(ques[new])
+            scores.append(np.exp(-dists[new]))
+
+        if not pro_local:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(pro_local), np.concatenate(que_pos), np.concatenate(scores)
+
+    def __active(self, pos: np.ndarray, cur_date: np.datetime64) -> np.ndarray:
+        """
+        Apply activity filter to professionals at given positions based on answers before current date
+        """
+        pro_ids = self.pro_ids[pos]
+        answers = self.answers[self.answers['answers_date_added'] < cur_date]
+        answers = answers[answers['answers_author_id'].isin(set(pro_ids))]
+
+        # registration date is the first date for each professional
+        local = pd.Index(pro_ids)
+        codes = np.concatenate([np.arange(pos.size), local.get_indexer(answers['answers_author_id'])])
+        dates = np.concatenate([self.pro_dates.reindex(pro_ids).values.astype('datetime64[ns]'),
+                                answers['answers_date_added'].values.astype('datetime64[ns]')])
+
+        # professionals without registration date are considered inactive
+        known = ~np.isnat(dates)
+        offsets, dates = build_csr(codes[known], pos.size, dates[known])
+        return activity_filter_bulk(offsets, dates, cur_date, min_days=self.active_min_days,
+                                    max_days=self.active_max_days)
+
+    def filter_engine(self, cur_date: np.datetime64) -> FilterEngine:
+        """
+        Build spam filter state from emails sent before current date, answers are not needed for spam filter.
+        All the known professionals and questions are interned, so newly sent emails can be added to it
+        """
+        emails = self.emails[self.emails['emails_date_sent'] < np.datetime64(cur_date, 'ns')]
+        no_answers = np.array([], dtype=object)
+        return FilterEngine(emails['emails_recipient_id'].values, emails['questions_id'].values,
+                            emails['emails_date_sent'].values,
+                            no_answers, no_answers, np.array([], dtype='datetime64[ns]'),
+                            pro_ids=self.pro_ids, que_ids=self.que_ids)
+
+    def dispatch(self, pos: np.ndarray, cur_date: np.datetime64, rng: np.random.RandomState, engine: FilterEngine,
+                 que_index=None, n_ques: int = None, **kwargs) -> tuple:
+        """
+        Run recommend -> activity filter -> spam filter -> epsilon exploration for professionals at given positions
+
+        :param pos: positions of professionals
+        :param cur_date: np.datetime64 object containing current date
+        :param rng: seeded random generator used for epsilon exploration
+        :param engine: spam filter state with emails sent before current date
+        :param que_index: index to recommend questions from, with positions of questions in que_ids, que_tree by default
+        :param n_ques: number of questions in que_index
+        :param kwargs: additional arguments of que_index's query, like time window of TimeIndex
+        :return: positions of professionals and questions, scores, exploration flags and send flags of all the
+        recommended pairs
+        """
+        cur_date = np.datetime64(cur_date, 'ns')
+        que_index, n_ques = (self.que_tree, self.que_ids.size) if que_index is None else (que_index, n_ques)
+
+        local, que_pos, scores = self.__recommend(pos, que_index, n_ques, **kwargs)
+
+        # check if professionals are active
+        is_active = self.__active(pos, cur_date)
+
+        # divide mails to spam / not spam
+        passed = engine.spam_filter(self.pro_ids[pos[local]], self.que_ids[que_pos], cur_date,
+                                    min_days=self.min_days)
+
+        # epsilon greedy
+        explore = epsilon_greedy(local, passed, is_active, self.eps, rng)
+
+        return pos[local], que_pos, scores, explore, passed | explore
+
+    def run(self, cur_date: np.datetime64, rng: np.random.RandomState,
+            shard: int = 0, n_shards: int = 1) -> pd.DataFrame:
+        """
+        Decide which questions to send to each professional of the shard
+
+        :param cur_date: np.datetime64 object containing current date
+        :param rng: seeded random generator used for epsilon exploration
+        :param shard: index of the shard to process
+        :param n_shards: total number of shards
+        :return: send-list dataframe of professional's and question's ids, scores and exploration flags
+        """
+        cur_date = np.datetime64(cur_date, 'ns')
+        pros, ques, scores, explore, send = self.dispatch(self.shard(shard, n_shards), cur_date, rng,
+                                                          self.filter_engine(cur_date))
+
+        return pd.DataFrame({'professionals_id': self.pro_ids[pros[send]], 'questions_id': self.que_ids[ques[send]],
+                             'match_score': scores[send], 'explore': explore[send]},
+                            columns=['professionals_id', 'questions_id', 'match_score', 'explore'])
+
+
+def save_send_list(send: pd.DataFrame, path: str):
+    """
+    Save send-list in compact form: tables of unique ids and integer codes referencing them
+    """
+    pro_codes, pro_ids = pd.factorize(send['professionals_id'])
+    que_codes, que_ids = pd.factorize(send['questions_id'])
+    np.savez_compressed(path, pro_ids=np.asarray(pro_ids).astype(str), que_ids=np.asarray(que_ids).astype(str),
+                        pro_codes=pro_codes.astype(np.int32), que_codes=que_codes.astype(np.int32),
+                        scores=send['match_score'].values.astype(np.float32), explore=send['explore'].values)
+
+
+def load_send_list(path: str) -> pd.DataFrame:
+    """
+    Load send-list saved by save_send_list
+    """
+    with np.load(path) as f:
+        return pd.DataFrame({'professionals_id': f['pro_ids'][f['pro_codes']],
+                             'questions_id': f['que_ids'][f['que_codes']],
+                             'match_score': f['scores'], 'explore': f['explore']},
+                            columns=['professionals_id', 'questions_id', 'match_score', 'explore'])
+
+
+# dispatcher shared with forked worker processes
+dispatcher = None
+
+
+def _run_shard(args: tuple) -> str:
+    cur_date, seed, shard, n_shards, out_path = args
+    send = dispatcher.run(cur_date, np.random.RandomState([seed, shard]), shard, n_shards)
+    path = os.path.join(out_path, f'send_list_{shard}.npz')
+    save_send_list(send, path)
+    return path
+
+
+DATA_PATH, DUMP_PATH = '../data/', '../dump/'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Epsilon-greedy email dispatcher')
+    parser.add_argument('--date', default=str(np.datetime64('now')), help='current date')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generator used for exploration')
+    parser.add_argument('--shards', default='0', help='comma-separated indices of shards to process')
+    parser.add_argument('--n-shards', type=int, default=1, help='total number of shards')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--out', default=DUMP_PATH, help='folder to save send-lists to')
+    args = parser.parse_args()
+
+    model = DistanceModel(que_dim=34 - 2 + 8 - 2,
+                          que_input_embs=[102, 42], que_output_embs=[2, 2],
+                          pro_dim=42 - 2,
+                          pro_input_embs=[102, 102, 42], pro_output_embs=[2, 2, 2],
+                          inter_dim=20, output_dim=10)
+    model.load_weights(os.path.join(DUMP_PATH, 'model.h5'))
+
+    with open(os.path.join(DUMP_PATH, 'dump.pkl'), 'rb') as file:
+        d = pickle.load(file)
+    pred = Predictor(model, d['que_data'], d['stu_data'], d['pro_data'], d['que_proc'], d['pro_proc'],
+                     d['que_to_stu'], d['pos_pairs'])
+
+    raw = load_tables(DATA_PATH, {'professionals': ['professionals_id', 'professionals_date_joined'],
+                                  'answers': ['answers_id', 'answers_author_id', 'answers_question_id',
+                                              'answers_date_added'],
+                                  'emails': None, 'matches': None})
+    professionals, answers = raw['professionals'], raw['answers']
+    emails = raw['emails'].merge(raw['matches'], left_on='emails_id', right_on='matches_email_id') \
+        .rename(columns={'matches_question_id': 'questions_id'})
+
+    dispatcher = Dispatcher.from_predictor(pred, professionals, answers, emails)
+
+    # shards are processed by forked workers, which share dispatcher's arrays with the parent
+    tasks = [(args.date, args.seed, int(shard), args.n_shards, args.out) for shard in args.shards.split(',')]
+    if args.jobs > 1:
+        with multiprocessing.Pool(args.jobs) as pool:
+            paths = pool.map(_run_shard, tasks)
+    else:
+        paths = [_run_shard(task) for task in tasks]
+
+    for path in paths:
+        print(path)
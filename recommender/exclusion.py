@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+
+class PairedIndex:
+    """
+    Entities already paired with each known entity, in CSR form over interned ids:
+    for every key entity, positions of paired target entities in the latent index
+    """
+
+    def __init__(self, entity_to_paired: dict, target_ids: np.ndarray):
+        """
+        :param entity_to_paired: mappings from entity to other entities it was in positive pair
+        :param target_ids: ids of target entities in the order of latent index, others are ignored
+        """
+        target_index = pd.Index(np.asarray(target_ids).ravel())
+        pairs = [(key, target) for key, targets in entity_to_paired.items() for target in targets]
+        targets = target_index.get_indexer([target for key, target in pairs]).astype(np.int64)
+        keys = np.array([key for key, target in pairs], dtype=object)
+
+        self.index = pd.Index([])
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.targets = np.empty(0, dtype=np.int64)
+        self.add(keys[targets >= 0], targets[targets >= 0])
+
+    def add(self, keys: np.ndarray, targets: np.ndarray):
+        """
+        Add new pairs
+
+        :param keys: ids of key entities
+        :param targets: positions of paired target entities
+        """
+        # existing pairs are unrolled back to flat form and CSR is rebuilt vectorized
+        keys = np.concatenate([np.repeat(np.asarray(self.index, dtype=object), np.diff(self.offsets)),
+                               np.asarray(keys, dtype=object)])
+        targets = np.concatenate([self.targets, np.asarray(targets, dtype=np.int64)])
+
+        codes, uniques = pd.factorize(keys)
+        order = np.lexsort((targets, codes))
+        codes, targets = codes[order], targets[order]
+        # duplicate pairs are stored once
+        first = np.ones(codes.size, dtype=bool)
+        first[1:] = (codes[1:] != codes[:-1]) | (targets[1:] != targets[:-1])
+
+        self.index = pd.Index(uniques)
+        self.offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes[first], minlength=len(uniques)), out=self.offsets[1:])
+        self.targets = targets[first]
+
+    def counts(self, ids: np.ndarray) -> np.ndarray:
+        """
+        :return: number of paired targets of each entity, zero for unknown ones
+        """
+        rows = self.index.get_indexer(np.asarray(ids).ravel())
+        # unknown entities point to the trailing zero, which also works for empty index
+        return np.append(np.diff(self.offsets), 0)[rows]
+
+    def excluded(self, ids: np.ndarray, cands: np.ndarray) -> np.ndarray:
+        """
+        Check which candidates are already paired with entity of their row
+
+        :param ids: ids of key entities
+        :param cands: matrix of candidate's positions, one row per key entity
+        :return: boolean matrix of the same shape as cands
+        """
+        rows = self.index.get_indexer(np.asarray(ids).ravel())
+        mask = np.zeros(cands.shape, dtype=bool)
+        if cands.size == 0:
+            return mask
+
+        # bitmap over target positions is set only for paired targets of the current row
+        bitmap = np.zeros(max(cands.max(), self.targets.max() if self.targets.size else 0) + 1, dtype=bool)
+        for i in np.flatnonzero(rows >= 0):
+            paired = self.targets[self.offsets[rows[i]]:self.offsets[rows[i] + 1]]
+            bitmap[paired] = True
+            mask[i] = bitmap[cands[i]]
+            bitmap[paired] = False
+        return mask
+
+
+def query_unseen(index, vectors: np.ndarray, ids: np.ndarray, top: int, paired: PairedIndex, n: int,
+                 **kwargs) -> (np.ndarray, np.ndarray):
+    """
+    Top-k query which skips already paired entities.
+    Each row over-fetches by the size of its paired set,
+    rows which still have fewer than top unseen neighbours are queried again with doubled k
+
+    :param index: latent index with KDTree-like query
+    :param vectors: query vectors
+    :param ids: ids of query entities
+    :param top: number of unseen neighbours to find
+    :param paired: already paired targets of query entities
+    :param n: number of vectors in index
+    :param kwargs: additional arguments of index's query
+    :return: distances and positions of neighbours, padded with inf and -1 if there are fewer unseen ones
+    """
+    vectors, ids = np.atleast_2d(vectors), np.asarray(ids).ravel()
+    dists = np.full((ids.size, top), np.inf)
+    positions = np.full((ids.size, top), -1, dtype=np.int64)
+    if n == 0 or top == 0:
+        return dists, positions
+
+    # k is rounded up to power of two, so rows are queried in few groups
+    k = np.minimum(2 ** np.ceil(np.log2(top + paired.counts(ids))).astype(np.int64), n)
+    pending = np.arange(ids.size)
+    while pending.size:
+        retry = []
+        for cur_k in np.unique(k[pending]):
+            rows = pending[k[pending] == cur_k]
+            d, c = index.query(vectors[rows], k=int(cur_k), **kwargs)
+            unseen = ~paired.excluded(ids[rows], c)
+
+            # index has no more neighbours to fetch
+            exhausted = c.shape[1] < cur_k or cur_k >= n
+            done = (unseen.sum(axis=1) >= top) | exhausted
+            retry.append(rows[~done])
+
+            # first top unseen neighbours, keeping order by distance
+            sel = np.argsort(~unseen[done], axis=1, kind='mergesort')[:, :top]
+            valid = np.take_along_axis(unseen[done], sel, axis=1)
+            d, c = np.take_along_axis(d[done], sel, axis=1), np.take_along_axis(c[done], sel, axis=1)
+            dists[rows[done], :sel.shape[1]] = np.where(valid, d, np.inf)
+            positions[rows[done], :sel.shape[1]] = np.where(valid, c, -1)
+
+        pending = np.concatenate(retry)
+        k[pending] = np.minimum(k[pending] * 2, n)
+
+    return dists, positions
@@ -0,0 +1,181 @@
+import gc
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import tensorflow as tf
+
+
+class Generation:
+    """
+    One loaded version of served objects: model, Predictor, Formatter and everything else built from dump files.
+    Each generation owns TensorFlow graph and session, so it can be built in a background thread
+    while the previous generation keeps serving. Requests using generation are counted,
+    so retired generation is closed once the last of them is finished
+    """
+
+    def __init__(self, number: int, build):
+        """
+        :param number: sequential number of generation
+        :param build: function without arguments returning dict of served objects, called inside generation's scope
+        """
+        self.number = number
+        self.graph = tf.Graph()
+        self.session = tf.Session(graph=self.graph)
+
+        tick = time.time()
+        with self.scope():
+            self.objects = build()
+        self.build_time = time.time() - tick
+        self.loaded = time.time()
+
+        # number of requests using generation and whether it was replaced by a newer one
+        self.lock = threading.Lock()
+        self.users = 0
+        self.retired = False
+
+    def __getitem__(self, key: str):
+        return self.objects[key]
+
+    @contextmanager
+    def scope(self):
+        """
+        Make generation's graph and session default ones, Keras models of generation are used only inside it
+        """
+        with self.graph.as_default(), self.session.as_default():
+            yield self
+
+    def acquire(self):
+        """
+        Register request using generation
+        """
+        with self.lock:
+            self.users += 1
+
+    def release(self):
+        """
+        Unregister finished request, the last one closes retired generation
+        """
+        with self.lock:
+            self.users -= 1
+            close = self.retired and self.users == 0
+        if close:
+            self.close()
+
+    def retire(self):
+        """
+        Mark generation as replaced, it is closed as soon as no requests use it
+        """
+        with self.lock:
+            self.retired = True
+            close = self.users == 0
+        if close:
+            self.close()
+
+    def close(self):
+        self.session.close()
+
+
+class Reloader:
+    """
+    Holds active generation of served objects and replaces it with a new one when dump files change.
+    New generation is built in background and swapped atomically once ready, requests take the active generation
+    once with use and keep it to the end, so they never see a mix of old and new objects.
+
+    In pre-fork servers the first generation should be built before fork, e.g. at import time with `gunicorn --preload`,
+    so workers share its arrays copy-on-write. Reloads happen per process, after fork
+    """
+
+    def __init__(self, build, paths: list):
+        """
+        :param build: function without arguments returning dict of served objects
+        :param paths: files generation is built from, like model.h5 and dump.pkl, watched for changes
+        """
+        self.build = build
+        self.paths = paths
+        self.lock = threading.Lock()
+        self.thread = None
+        self.error = None
+
+        self.mtimes = self.__mtimes()
+        self.current = Generation(1, build)
+
+        # objects of the first generation are moved out of garbage collector's tracking,
+        # so its passes don't touch their pages and break sharing with forked workers
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+    def __mtimes(self) -> tuple:
+        return tuple(os.path.getmtime(path) if os.path.isfile(path) else None for path in self.paths)
+
+    def __reload(self, mtimes: tuple):
+        try:
+            gen = Generation(self.current.number + 1, self.build)
+        except Exception as e:
+            # broken dump keeps the old generation serving, it is retried only when files change again
+            self.mtimes, self.error = mtimes, repr(e)
+            return
+
+        with self.lock:
+            old, self.current, self.mtimes, self.error = self.current, gen, mtimes, None
+        # requests which took the old generation before swap finish with it, the last of them closes it
+        old.retire()
+
+    @contextmanager
+    def use(self):
+        """
+        Take the active generation for one request and enter its scope, it stays open until the request is finished
+        """
+        # generation can't be retired between taking and registering
+        with self.lock:
+            gen = self.current
+            gen.acquire()
+        try:
+            with gen.scope():
+                yield gen
+        finally:
+            gen.release()
+
+    def reload(self, wait: bool = False) -> bool:
+        """
+        Start building a new generation in background
+
+        :param wait: block until the new generation is active
+        :return: False if a reload is already in progress
+        """
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            self.thread = threading.Thread(target=self.__reload, args=(self.__mtimes(),), daemon=True)
+            self.thread.start()
+
+        if wait:
+            self.thread.join()
+        return True
+
+    def watch(self, interval: float = 10):
+        """
+        Start daemon thread reloading generation whenever watched files are modified
+        """
+
+        def __loop():
+            while True:
+                time.sleep(interval)
+                mtimes = self.__mtimes()
+                # files have to be complete and unchanged for the whole interval
+                if None not in mtimes and mtimes != self.mtimes and mtimes == self.__last:
+                    self.reload(wait=True)
+                self.__last = mtimes
+
+        self.__last = self.mtimes
+        threading.Thread(target=__loop, daemon=True).start()
+
+    def status(self) -> dict:
+        """
+        :return: number and load time of the active generation, whether reload is in progress and its last error
+        """
+        return {'generation': self.current.number, 'loaded': self.current.loaded,
+                'build_time': self.current.build_time,
+                'reloading': self.thread is not None and self.thread.is_alive(), 'error': self.error}
@@ -2,12 +2,23 @@ import pandas as pd
 import numpy as np
 import keras
 import os
+import pickle
 
+from functools import partial
 from sklearn.neighbors import KDTree
 
 from preprocessors.queproc import QueProc
 from preprocessors.proproc import ProProc
-from utils.utils import TextProcessor
+from recommender.quantized import QuantizedEncoder, QuantizedIndex
+from recommender.sharded import ShardedIndex, time_partition
+from recommender.timeindex import TimeIndex
+from recommender.delta import DeltaIndex
+from recommender.snapshots import SnapshotStore
+from recommender.tagindex import TagIndex, query_tagged
+from recommender.exclusion import PairedIndex, query_unseen
+from utils.utils import TextProcessor, join_grouped
+from utils.loader import load_tables, write_atomic
+from utils.profiler import span
 
 tp = TextProcessor()
 
@@ -18,7 +29,7 @@ class Predictor:
     """
 
     def __init__(self, model: keras.Model, que_data: pd.DataFrame, stu_data: pd.DataFrame, pro_data: pd.DataFrame,
-                 que_proc: QueProc, pro_proc: ProProc, que_to_stu: dict, pos_pairs: list):
+                 que_proc: QueProc, pro_proc: ProProc, que_to_stu: dict, pos_pairs: list, n_shards: int = 1):
         """
         :param model: compiled Keras model
         :param que_data: processed questions's data
@@ -28,47 +39,45 @@ class Predictor:
         :param pro_proc: professional's data processor
         :param que_to_stu: mappings from question's id to its author id
         :param pos_pairs: list of positive question-student-professional-time pairs
+        :param n_shards: number of processes holding question's index, partitioned by time buckets
         """
         self.model = model
+        self.n_shards = n_shards
+        # type latent indices are stored in, full precision unless quantize is called
+        self.index_dtype = None
 
-        # construct mappings from entity id to features
-        self.que_dict = {row.values[0]: row.values[2:] for i, row in que_data.iterrows()}
-        self.stu_dict = {stu: group.values[-1, 2:] for stu, group in stu_data.groupby('students_id')}
-        self.pro_dict = {pro: group.values[-1, 2:] for pro, group in pro_data.groupby('professionals_id')}
+        # construct question's features matrix and time-indexed student's and professional's features
+        que_index = pd.Index(que_data['questions_id'].values)
+        que_mat = que_data.iloc[:, 2:].values.astype(np.float32)
+        self.stu_store = SnapshotStore(stu_data)
+        self.pro_store = SnapshotStore(pro_data)
 
         self.entity_to_paired = dict()
 
         # construct mappings from entity to other entities it was in positive pair
-        for que, stu, pro, time in pos_pairs:
-            if que not in self.entity_to_paired:
-                self.entity_to_paired[que] = {pro}
-            else:
-                self.entity_to_paired[que].add(pro)
-
-            if pro not in self.entity_to_paired:
-                self.entity_to_paired[pro] = {que}
-            else:
-                self.entity_to_paired[pro].add(que)
+        Predictor.__pair(self.entity_to_paired, pos_pairs)
 
         # form final features for 1all known questions and professionals
 
-        que_feat, que_ids, pro_feat, pro_ids = [], [], [], []
+        ques = que_index.values
+        stus = np.array([que_to_stu[que] for que in ques], dtype=object)
+        known = self.stu_store.known(stus)
 
-        for que in self.que_dict.keys():
-            cur_stu = que_to_stu[que]
-            if cur_stu in self.stu_dict:
-                # actual question's features are both question and student's features
-                que_feat.append(np.hstack([self.stu_dict[cur_stu], self.que_dict[que]]))
-                que_ids.append(que)
+        # actual question's features are both question and student's features
+        self.que_stus = stus[known]
+        self.que_feat = np.hstack([self.stu_store.latest(self.que_stus), que_mat[known]])
+        self.que_ids = ques[known].reshape(-1, 1)
 
-        for pro in self.pro_dict.keys():
-            pro_feat.append(self.pro_dict[pro])
-            pro_ids.append(pro)
+        self.pro_ids = np.sort(self.pro_store.index.values).reshape(-1, 1)
+        self.pro_feat = self.pro_store.latest(self.pro_ids)
 
-        self.pro_feat = np.vstack(pro_feat)
-        self.pro_ids = np.vstack(pro_ids)
-        self.que_feat = np.vstack(que_feat)
-        self.que_ids = np.vstack(que_ids)
+        # positions of questions and professionals in latent indices, removed ones keep their positions
+        self.que_positions = {que: i for i, que in enumerate(self.que_ids.ravel())}
+        self.pro_positions = {pro: i for i, pro in enumerate(self.pro_ids.ravel())}
+
+        # already paired questions and professionals of each entity, over positions in latent indices
+        self.paired_ques = PairedIndex(self.entity_to_paired, self.que_ids)
+        self.paired_pros = PairedIndex(self.entity_to_paired, self.pro_ids)
 
         # create two encoders
         self.que_model = model.que_model
@@ -78,14 +87,216 @@ class Predictor:
         self.que_lat_vecs = self.que_model.predict(self.que_feat)
         self.pro_lat_vecs = self.pro_model.predict(self.pro_feat)
 
-        # create KDTree trees from question and professional latent vectors
-        self.que_tree = KDTree(self.que_lat_vecs)
-        self.pro_tree = KDTree(self.pro_lat_vecs)
+        # dates questions were added, used for time partitioning of their latent vectors
+        self.que_dates = que_data.set_index('questions_id')['questions_time'].reindex(self.que_ids.ravel()).values
+        self.__que_time_index = None
+
+        # create indices from question and professional latent vectors, accepting new vectors without rebuild
+        self.que_tree = DeltaIndex(self.que_lat_vecs, build=self.__build_que_index)
+        self.pro_tree = DeltaIndex(self.pro_lat_vecs)
+
+        # tag inverted indices for hybrid queries, see index_tags
+        self.que_tag_index, self.pro_tag_index = None, None
 
         # initialize preprocessors
         self.que_proc = que_proc
         self.pro_proc = pro_proc
 
+    @property
+    def que_time_index(self) -> TimeIndex:
+        """
+        Index of question's latent vectors partitioned by date added and answered status, built on first access
+        """
+        if self.__que_time_index is None:
+            answered = np.array([que in self.entity_to_paired for que in self.que_ids.ravel()], dtype=bool)
+            self.__que_time_index = TimeIndex(self.que_lat_vecs, self.que_dates, answered)
+            self.__que_time_index.remove(np.flatnonzero(self.que_tree.removed))
+        return self.__que_time_index
+
+    @staticmethod
+    def __pair(entity_to_paired: dict, pairs: list):
+        """
+        Add question-student-professional-time pairs to mappings from entity to other entities it was paired with
+        """
+        for que, stu, pro, time in pairs:
+            if que not in entity_to_paired:
+                entity_to_paired[que] = {pro}
+            else:
+                entity_to_paired[que].add(pro)
+
+            if pro not in entity_to_paired:
+                entity_to_paired[pro] = {que}
+            else:
+                entity_to_paired[pro].add(que)
+
+    def __build_que_index(self, vectors: np.ndarray, positions: np.ndarray):
+        """
+        Build main index over question's latent vectors at given positions, each shard is quantized if needed
+        """
+        build = KDTree if self.index_dtype is None else partial(QuantizedIndex, dtype=self.index_dtype)
+        if self.n_shards > 1:
+            return ShardedIndex(vectors, time_partition(self.que_dates[positions], self.n_shards), build)
+        return build(vectors)
+
+    def quantize(self, dtype: str = 'int8'):
+        """
+        Switch encoders and latent indices to float16 or int8 versions, which are smaller and run without Keras.
+        Full precision latent vectors are kept for callers using them directly
+
+        :param dtype: 'float16' or 'int8'
+        """
+        self.que_model = QuantizedEncoder.from_keras(self.que_model, dtype)
+        self.pro_model = QuantizedEncoder.from_keras(self.pro_model, dtype)
+
+        # main indices are rebuilt quantized, question's one keeps its shards, inserted and removed vectors are kept
+        self.index_dtype = dtype
+        self.pro_tree.build = lambda vectors, positions: QuantizedIndex(vectors, dtype)
+        for tree in [self.que_tree, self.pro_tree]:
+            tree.merge()
+
+    def lat_vecs_at(self, date: str) -> (np.ndarray, np.ndarray):
+        """
+        Encode initially known questions and professionals with student's and professional's features as of given date,
+        e.g. to evaluate or reproduce recommendations made on that date
+
+        :return: latent vectors of questions and professionals, in the order of que_feat and pro_feat
+        """
+        stu_dim = self.stu_store.feat.shape[1]
+        que_feat = np.hstack([self.stu_store.asof(self.que_stus, date), self.que_feat[:, stu_dim:]])
+        pro_feat = self.pro_store.asof(self.pro_ids[:len(self.pro_feat)], date)
+        return self.que_model.predict(que_feat), self.pro_model.predict(pro_feat)
+
+    @staticmethod
+    def __tag_pairs(positions: dict, ids: np.ndarray, tags: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Convert entity-tag pairs to position-tag pairs, skipping unknown entities
+        """
+        pos = np.array([positions.get(i, -1) for i in ids], dtype=np.int64)
+        return pos[pos >= 0], np.asarray(tags, dtype=object)[pos >= 0]
+
+    @staticmethod
+    def __group_tags(ids: np.ndarray, keys: np.ndarray, tags: np.ndarray) -> list:
+        """
+        :return: array of tags for each of ids
+        """
+        grouped = {key: group.values for key, group in pd.Series(tags, dtype=object).groupby(keys)}
+        return [grouped.get(i, np.empty(0, dtype=object)) for i in ids]
+
+    def index_tags(self, que_tags: pd.DataFrame, pro_tags: pd.DataFrame):
+        """
+        Build tag inverted indices over known questions and professionals, used by hybrid queries
+
+        :param que_tags: questions's tags in raw format
+        :param pro_tags: professional's tags data in raw format
+        """
+        self.que_tag_index = TagIndex(*Predictor.__tag_pairs(self.que_positions,
+                                                            que_tags['tag_questions_question_id'].values,
+                                                            que_tags['tags_tag_name'].values))
+        self.pro_tag_index = TagIndex(*Predictor.__tag_pairs(self.pro_positions,
+                                                            pro_tags['tag_users_user_id'].values,
+                                                            pro_tags['tags_tag_name'].values))
+
+    def add_questions(self, que_df: pd.DataFrame, que_tags: pd.DataFrame):
+        """
+        Make new questions searchable without rebuilding Predictor.
+        Questions with known ids, even removed ones, are replaced in place, so each id keeps a single position
+
+        :param que_df: question's data in raw format
+        :param que_tags: questions's tags in raw format
+        """
+        lat_vecs = self.__get_que_latent(que_df, que_tags)
+        # the last version of each question is kept
+        last = ~que_df['questions_id'].duplicated(keep='last').values
+        ids, lat_vecs = que_df['questions_id'].values[last], lat_vecs[last]
+        dates = que_df['questions_date_added'].values.astype('datetime64[ns]')[last]
+
+        positions = np.array([self.que_positions.get(que, -1) for que in ids], dtype=np.int64)
+        known = positions >= 0
+        self.que_tree.replace(positions[known], lat_vecs[known])
+        positions[~known] = self.que_tree.add(lat_vecs[~known])
+
+        self.que_ids = np.vstack([self.que_ids, ids[~known].reshape(-1, 1)])
+        self.que_lat_vecs = np.vstack([self.que_lat_vecs, lat_vecs[~known]])
+        self.que_lat_vecs[positions[known]] = lat_vecs[known]
+        self.que_dates = np.concatenate([self.que_dates, dates[~known]])
+        self.que_dates[positions[known]] = dates[known]
+        self.que_positions.update(zip(ids[~known], positions[~known]))
+
+        if self.que_tag_index is not None:
+            self.que_tag_index.remove(positions[known])
+            self.que_tag_index.add(*Predictor.__tag_pairs(self.que_positions,
+                                                          que_tags['tag_questions_question_id'].values,
+                                                          que_tags['tags_tag_name'].values))
+
+        if self.__que_time_index is not None:
+            self.__que_time_index.remove(positions[known])
+            answered = np.array([que in self.entity_to_paired for que in ids], dtype=bool)
+            self.__que_time_index.add(lat_vecs, positions, dates, answered)
+
+    def add_professionals(self, pro_df: pd.DataFrame, que_df: pd.DataFrame, ans_df: pd.DataFrame,
+                          pro_tags: pd.DataFrame):
+        """
+        Make new professionals searchable without rebuilding Predictor.
+        Professionals with known ids, even removed ones, are replaced in place, so each id keeps a single position
+
+        :param pro_df: professional's data in raw format
+        :param que_df: question's data in raw format
+        :param ans_df: answer's data in raw format
+        :param pro_tags: professional's tags data in raw format
+        """
+        # latent vectors are computed in order of sorted professional's ids
+        ids = np.unique(pro_df['professionals_id'].values)
+        lat_vecs = self.__get_pro_latent(pro_df, que_df, ans_df, pro_tags)
+
+        positions = np.array([self.pro_positions.get(pro, -1) for pro in ids], dtype=np.int64)
+        known = positions >= 0
+        self.pro_tree.replace(positions[known], lat_vecs[known])
+        positions[~known] = self.pro_tree.add(lat_vecs[~known])
+
+        self.pro_ids = np.vstack([self.pro_ids, ids[~known].reshape(-1, 1)])
+        self.pro_lat_vecs = np.vstack([self.pro_lat_vecs, lat_vecs[~known]])
+        self.pro_lat_vecs[positions[known]] = lat_vecs[known]
+        self.pro_positions.update(zip(ids[~known], positions[~known]))
+
+        if self.pro_tag_index is not None:
+            self.pro_tag_index.remove(positions[known])
+            self.pro_tag_index.add(*Predictor.__tag_pairs(self.pro_positions, pro_tags['tag_users_user_id'].values,
+                                                          pro_tags['tags_tag_name'].values))
+
+    def remove_questions(self, ids: np.ndarray):
+        """
+        Stop recommending questions with given ids, unknown ids are ignored
+        """
+        positions = np.array([self.que_positions[que] for que in ids if que in self.que_positions], dtype=np.int64)
+        self.que_tree.remove(positions)
+        if self.__que_time_index is not None:
+            self.__que_time_index.remove(positions)
+
+    def remove_professionals(self, ids: np.ndarray):
+        """
+        Stop recommending professionals with given ids, unknown ids are ignored
+        """
+        positions = np.array([self.pro_positions[pro] for pro in ids if pro in self.pro_positions], dtype=np.int64)
+        self.pro_tree.remove(positions)
+
+    def add_answers(self, pairs: list):
+        """
+        Register new answers, so answered questions and their professionals are no longer recommended to each other
+
+        :param pairs: list of new positive question-student-professional-time pairs
+        """
+        Predictor.__pair(self.entity_to_paired, pairs)
+
+        ques = np.array([que for que, stu, pro, time in pairs], dtype=object)
+        pros = np.array([pro for que, stu, pro, time in pairs], dtype=object)
+        que_pos = np.array([self.que_positions.get(que, -1) for que in ques], dtype=np.int64)
+        pro_pos = np.array([self.pro_positions.get(pro, -1) for pro in pros], dtype=np.int64)
+
+        self.paired_ques.add(pros[que_pos >= 0], que_pos[que_pos >= 0])
+        self.paired_pros.add(ques[pro_pos >= 0], pro_pos[pro_pos >= 0])
+        if self.__que_time_index is not None:
+            self.__que_time_index.mark_answered(que_pos[que_pos >= 0])
+
     def __get_que_latent(self, que_df: pd.DataFrame, que_tags: pd.DataFrame) -> np.ndarray:
         """
         Get latent vectors for questions in raw format
@@ -93,14 +304,16 @@ class Predictor:
         que_df['questions_date_added'] = pd.to_datetime(que_df['questions_date_added'])
 
         # extract and preprocess question's features
-        que_feat = self.que_proc.transform(que_df, que_tags).values[:, 2:]
+        with span('serve.que_transform'):
+            que_feat = self.que_proc.transform(que_df, que_tags).iloc[:, 2:].values.astype(np.float32)
 
-        # actual question's features are both question and student's features
-        stu_feat = np.vstack([self.stu_dict[stu] for stu in que_df['questions_author_id']])
-        que_feat = np.hstack([stu_feat, que_feat])
+            # actual question's features are both question and student's features, the latter as of question's date
+            stu_feat = self.stu_store.asof(que_df['questions_author_id'].values, que_df['questions_date_added'].values)
+            que_feat = np.hstack([stu_feat, que_feat])
 
         # encode question's data to get latent representation
-        lat_vecs = self.que_model.predict(que_feat)
+        with span('serve.que_encode'):
+            lat_vecs = self.que_model.predict(que_feat)
 
         return lat_vecs
 
@@ -114,70 +327,126 @@ class Predictor:
         ans_df['answers_date_added'] = pd.to_datetime(ans_df['answers_date_added'])
 
         # extract and preprocess professional's features
-        pro_feat = self.pro_proc.transform(pro_df, que_df, ans_df, pro_tags)
+        with span('serve.pro_transform'):
+            pro_feat = self.pro_proc.transform(pro_df, que_df, ans_df, pro_tags)
 
-        # select the last available version of professional's features
-        pro_feat = pro_feat.groupby('professionals_id').last().values[:, 1:]
+            # select the last available version of professional's features
+            pro_feat = pro_feat.groupby('professionals_id').last().iloc[:, 1:].values.astype(np.float32)
 
         # encode professional's data to get latent representation
-        lat_vecs = self.pro_model.predict(pro_feat)
+        with span('serve.pro_encode'):
+            lat_vecs = self.pro_model.predict(pro_feat)
 
         return lat_vecs
 
-    def __construct_df(self, ids, sims, scores):
-        scores = np.round(scores, 4)
-        tuples = []
-        for i, cur_id in enumerate(ids):
-            for j, sim in enumerate(sims[i]):
-                if sim[0] not in self.entity_to_paired.get(cur_id, {}):
-                    tuples.append((cur_id, sim[0], scores[i, j]))
-        score_df = pd.DataFrame(tuples, columns=['id', 'match_id', 'match_score'])
+    @staticmethod
+    def __construct_df(ids, match_ids, dists, positions):
+        """
+        Flatten query results into dataframe, skipping padded positions
+        """
+        valid = positions >= 0
+        score_df = pd.DataFrame({'id': np.repeat(ids, valid.sum(axis=1)),
+                                 'match_id': match_ids[positions[valid]],
+                                 'match_score': np.round(np.exp(-dists[valid]), 4)})
         return score_df
 
-    def __get_ques_by_latent(self, ids: np.ndarray, lat_vecs: np.ndarray, top: int) -> pd.DataFrame:
+    @staticmethod
+    def __query_hybrid(tree: DeltaIndex, tag_index: TagIndex, ids: np.ndarray, lat_vecs: np.ndarray, tags: list,
+                       top: int, paired: PairedIndex) -> (np.ndarray, np.ndarray):
+        """
+        Score candidates sharing tags with queries exactly, queries with too few of them fall back to the full index
+        """
+        ids, lat_vecs = np.asarray(ids), np.atleast_2d(lat_vecs)
+        dists, positions, done = query_tagged(tree.vectors, tree.removed, tag_index, lat_vecs, ids, tags, top, paired)
+
+        rest = np.flatnonzero(~done)
+        if rest.size:
+            dists[rest], positions[rest] = query_unseen(tree, lat_vecs[rest], ids[rest], top, paired, len(tree))
+        return dists, positions
+
+    def __get_ques_by_latent(self, ids: np.ndarray, lat_vecs: np.ndarray, top: int, since: str = None,
+                             answered: bool = None, tags: list = None) -> pd.DataFrame:
         """
-        Get top questions with most similar latent representations to given vectors
+        Get top questions with most similar latent representations to given vectors,
+        except questions already paired with entities of given ids,
+        optionally only among questions added since given date and with given answered status,
+        or only among questions sharing given tags if there are enough of them
         """
-        dists, ques = self.que_tree.query(lat_vecs, k=top)
-        ques = self.que_ids[ques]
-        scores = np.exp(-dists)
-        return self.__construct_df(ids, ques, scores)
+        with span('serve.que_index_query'):
+            if since is not None or answered is not None:
+                dists, ques = query_unseen(self.que_time_index, lat_vecs, ids, top, self.paired_ques,
+                                           len(self.que_time_index), since=since, answered=answered)
+            elif tags is not None and self.que_tag_index is not None:
+                dists, ques = Predictor.__query_hybrid(self.que_tree, self.que_tag_index, ids, lat_vecs, tags, top,
+                                                       self.paired_ques)
+            else:
+                dists, ques = query_unseen(self.que_tree, lat_vecs, ids, top, self.paired_ques, len(self.que_tree))
+        return Predictor.__construct_df(ids, self.que_ids.ravel(), dists, ques)
 
-    def __get_pros_by_latent(self, ids: np.ndarray, lat_vecs: np.ndarray, top: int) -> pd.DataFrame:
+    def __get_pros_by_latent(self, ids: np.ndarray, lat_vecs: np.ndarray, top: int,
+                             tags: list = None) -> pd.DataFrame:
         """
-        Get top professionals with most similar latent representations to given vectors
+        Get top professionals with most similar latent representations to given vectors,
+        except professionals already paired with entities of given ids,
+        optionally only among professionals sharing given tags if there are enough of them
         """
-        dists, pros = self.pro_tree.query(lat_vecs, k=top)
-        pros = self.pro_ids[pros]
-        scores = np.exp(-dists)
-        return self.__construct_df(ids, pros, scores)
+        with span('serve.pro_index_query'):
+            if tags is not None and self.pro_tag_index is not None:
+                dists, pros = Predictor.__query_hybrid(self.pro_tree, self.pro_tag_index, ids, lat_vecs, tags, top,
+                                                       self.paired_pros)
+            else:
+                dists, pros = query_unseen(self.pro_tree, lat_vecs, ids, top, self.paired_pros, len(self.pro_tree))
+        return Predictor.__construct_df(ids, self.pro_ids.ravel(), dists, pros)
+
+    @staticmethod
+    def __que_query_tags(que_df: pd.DataFrame, que_tags: pd.DataFrame, hybrid: bool) -> list:
+        if not hybrid:
+            return None
+        return Predictor.__group_tags(que_df['questions_id'].values, que_tags['tag_questions_question_id'].values,
+                                      que_tags['tags_tag_name'].values)
 
-    def find_pros_by_que(self, que_df: pd.DataFrame, que_tags: pd.DataFrame, top: int = 10) -> pd.DataFrame:
+    @staticmethod
+    def __pro_query_tags(pro_df: pd.DataFrame, pro_tags: pd.DataFrame, hybrid: bool) -> list:
+        if not hybrid:
+            return None
+        return Predictor.__group_tags(pro_df['professionals_id'].values, pro_tags['tag_users_user_id'].values,
+                                      pro_tags['tags_tag_name'].values)
+
+    def find_pros_by_que(self, que_df: pd.DataFrame, que_tags: pd.DataFrame, top: int = 10,
+                         hybrid: bool = False) -> pd.DataFrame:
         """
         Get top professionals with most similar internal representation to given questions
 
         :param que_df: question's data in raw format
         :param que_tags: questions's tags in raw format
         :param top: number of professionals for each question to return
+        :param hybrid: search only professionals subscribed to question's tags, if there are enough of them.
+        Needs index_tags to be called first
         :return: dataframe of question's ids, matched professional's ids and similarity scores
         """
         lat_vecs = self.__get_que_latent(que_df, que_tags)
-        return self.__get_pros_by_latent(que_df['questions_id'].values, lat_vecs, top)
+        return self.__get_pros_by_latent(que_df['questions_id'].values, lat_vecs, top,
+                                         Predictor.__que_query_tags(que_df, que_tags, hybrid))
 
-    def find_ques_by_que(self, que_df: pd.DataFrame, que_tags: pd.DataFrame, top: int = 10) -> pd.DataFrame:
+    def find_ques_by_que(self, que_df: pd.DataFrame, que_tags: pd.DataFrame, top: int = 10,
+                         hybrid: bool = False) -> pd.DataFrame:
         """
         Get top questions with most similar internal representation to given questions
 
         :param que_df: question's data in raw format
         :param que_tags: questions's tags in raw format
         :param top: number of questions for each question to return
+        :param hybrid: search only questions sharing tags with given ones, if there are enough of them.
+        Needs index_tags to be called first
         :return: dataframe of question's ids, matched question's ids and similarity scores
         """
         lat_vecs = self.__get_que_latent(que_df, que_tags)
-        return self.__get_ques_by_latent(que_df['questions_id'].values, lat_vecs, top)
+        return self.__get_ques_by_latent(que_df['questions_id'].values, lat_vecs, top,
+                                         tags=Predictor.__que_query_tags(que_df, que_tags, hybrid))
 
     def find_ques_by_pro(self, pro_df: pd.DataFrame, que_df: pd.DataFrame, ans_df: pd.DataFrame,
-                         pro_tags: pd.DataFrame, top: int = 10) -> pd.DataFrame:
+                         pro_tags: pd.DataFrame, top: int = 10, since: str = None,
+                         answered: bool = None, hybrid: bool = False) -> pd.DataFrame:
         """
         Get top questions with most similar internal representation to given professional
 
@@ -186,13 +455,18 @@ class Predictor:
         :param ans_df: answer's data in raw format
         :param pro_tags: professional's tags data in raw format
         :param top: number of questions for each professional to return
+        :param since: search only questions added on this date or later, e.g. 30 days ago
+        :param answered: search only answered (True) or not answered (False) questions
+        :param hybrid: search only questions with professional's subscribed tags, if there are enough of them.
+        Needs index_tags to be called first, not used together with since and answered
         :return: dataframe of professional's ids, matched question's ids and similarity scores
         """
         lat_vecs = self.__get_pro_latent(pro_df, que_df, ans_df, pro_tags)
-        return self.__get_ques_by_latent(pro_df['professionals_id'].values, lat_vecs, top)
+        return self.__get_ques_by_latent(pro_df['professionals_id'].values, lat_vecs, top, since, answered,
+                                         Predictor.__pro_query_tags(pro_df, pro_tags, hybrid))
 
     def find_pros_by_pro(self, pro_df: pd.DataFrame, que_df: pd.DataFrame, ans_df: pd.DataFrame,
-                         pro_tags: pd.DataFrame, top: int = 10) -> pd.DataFrame:
+                         pro_tags: pd.DataFrame, top: int = 10, hybrid: bool = False) -> pd.DataFrame:
         """
         Get top professionals with most similar internal representation to given professional
 
@@ -201,10 +475,13 @@ class Predictor:
         :param ans_df: answer's data in raw format
         :param pro_tags: professional's tags data in raw format
         :param top: number of questions for each professional to return
+        :param hybrid: search only professionals sharing subscribed tags with given ones, if there are enough of them.
+        Needs index_tags to be called first
         :return: dataframe of professional's ids, matched professional's ids and similarity scores
         """
         lat_vecs = self.__get_pro_latent(pro_df, que_df, ans_df, pro_tags)
-        return self.__get_pros_by_latent(pro_df['professionals_id'].values, lat_vecs, top)
+        return self.__get_pros_by_latent(pro_df['professionals_id'].values, lat_vecs, top,
+                                         Predictor.__pro_query_tags(pro_df, pro_tags, hybrid))
 
 
 class Formatter:
@@ -212,21 +489,72 @@ class Formatter:
     Class with useful for Predictor input/output functionality
     """
 
-    def __init__(self, data_path: str):
-        pro = pd.read_csv(os.path.join(data_path, 'professionals.csv'))
-        que = pd.read_csv(os.path.join(data_path, 'questions.csv'))
+    # columns of raw tables which are actually shown to the user
+    pro_columns = ['professionals_id', 'professionals_location', 'professionals_industry',
+                   'professionals_headline', 'professionals_date_joined']
+    que_columns = ['questions_id', 'questions_author_id', 'questions_date_added',
+                   'questions_title', 'questions_body']
+
+    def __init__(self, data_path: str, dump_path: str = None):
+        """
+        :param data_path: path to the folder with raw csv files
+        :param dump_path: path to the dump folder to keep prebuilt store of formatted tables in.
+        Store is rebuilt when raw csv files change, without dump_path tables are built on every load
+        """
+        self.data_path = data_path
+        self.store_path = os.path.join(dump_path, 'formatter.pkl') if dump_path is not None else None
+
+        # tables are loaded lazily, on first access
+        self.__pro, self.__que = None, None
+
+    @property
+    def pro(self) -> pd.DataFrame:
+        if self.__pro is None:
+            self.__load()
+        return self.__pro
 
-        tags = pd.read_csv(os.path.join(data_path, 'tags.csv'))
-        tag_users = pd.read_csv(os.path.join(data_path, 'tag_users.csv'))
-        tag_que = pd.read_csv(os.path.join(data_path, 'tag_questions.csv'))
+    @property
+    def que(self) -> pd.DataFrame:
+        """
+        Raw questions table with aggregated tags. Shared with callers instead of reading questions.csv again
+        """
+        if self.__que is None:
+            self.__load()
+        return self.__que
+
+    def __load(self):
+        """
+        Load formatted tables from the store or build them from raw csv files and save to the store
+        """
+        sources = [os.path.join(self.data_path, table + '.csv') for table in
+                   ['professionals', 'questions', 'tags', 'tag_users', 'tag_questions']]
+        # store is valid only for exactly the same raw files it was built from
+        mtimes = tuple(os.path.getmtime(f) if os.path.isfile(f) else None for f in sources)
+
+        if self.store_path is not None and os.path.isfile(self.store_path):
+            with open(self.store_path, 'rb') as file:
+                store = pickle.load(file)
+            if store['mtimes'] == mtimes:
+                self.__pro, self.__que = store['pro'], store['que']
+                return
+
+        raw = load_tables(self.data_path, {'professionals': Formatter.pro_columns, 'questions': Formatter.que_columns,
+                                           'tags': None, 'tag_users': None, 'tag_questions': None})
+        pro, que, tags, tag_users, tag_que = \
+            raw['professionals'], raw['questions'], raw['tags'], raw['tag_users'], raw['tag_questions']
 
         tag_merged = tags.merge(tag_users, left_on='tags_tag_id', right_on='tag_users_tag_id')
-        tags_grouped = tag_merged.groupby('tag_users_user_id').agg(lambda x: ' '.join(x))[['tags_tag_name']]
-        self.pro = pro.merge(tags_grouped, left_on='professionals_id', right_index=True, how='left')
+        tags_grouped = join_grouped(tag_merged['tag_users_user_id'].values, tag_merged['tags_tag_name'].values)
+        self.__pro = pro.merge(tags_grouped.rename('tags_tag_name').to_frame(),
+                               left_on='professionals_id', right_index=True, how='left')
 
         tag_merged = tags.merge(tag_que, left_on='tags_tag_id', right_on='tag_questions_tag_id')
-        tags_grouped = tag_merged.groupby('tag_questions_question_id').agg(lambda x: ' '.join(x))[['tags_tag_name']]
-        self.que = que.merge(tags_grouped, left_on='questions_id', right_index=True, how='left')
+        tags_grouped = join_grouped(tag_merged['tag_questions_question_id'].values, tag_merged['tags_tag_name'].values)
+        self.__que = que.merge(tags_grouped.rename('tags_tag_name').to_frame(),
+                               left_on='questions_id', right_index=True, how='left')
+
+        if self.store_path is not None:
+            write_atomic(self.store_path, {'mtimes': mtimes, 'pro': self.__pro, 'que': self.__que})
 
     def get_que(self, scores: pd.DataFrame) -> pd.DataFrame:
         """
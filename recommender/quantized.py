@@ -0,0 +1,221 @@
+import numpy as np
+
+
+def quantize(x: np.ndarray, dtype: str = 'int8') -> (np.ndarray, np.ndarray):
+    """
+    Quantize matrix column-wise
+
+    :param x: matrix to quantize
+    :param dtype: 'float16' or 'int8'. For int8, each column is scaled symmetrically to [-127, 127]
+    :return: quantized matrix and float32 scales of its columns, None for float16
+    """
+    x = np.asarray(x, dtype=np.float32)
+    if dtype == 'float16':
+        return x.astype(np.float16), None
+    if dtype == 'int8':
+        scales = np.abs(x).max(axis=0) / 127 if x.shape[0] else np.ones(x.shape[1:], dtype=np.float32)
+        scales[scales == 0] = 1
+        return np.round(x / scales).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f'unsupported dtype {dtype}')
+
+
+def dequantize(q: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """
+    Restore float32 matrix from quantized one
+    """
+    return q.astype(np.float32) if scales is None else q.astype(np.float32) * scales
+
+
+class QuantizedEncoder:
+    """
+    Numpy version of Encoder with weights stored in float16 or int8,
+    computes latent vectors on CPU without Keras
+    """
+
+    def __init__(self, weights: list, n_embs: int, dtype: str = 'int8'):
+        """
+        :param weights: Encoder's weights in Keras order: embedding tables, then kernels and biases of two Dense layers
+        :param n_embs: number of embedding tables
+        :param dtype: 'float16' or 'int8'
+        """
+        self.dtype = dtype
+        self.n_embs = n_embs
+        # tables and kernels are quantized per output dimension, small biases are kept in float32
+        self.tables = [quantize(w, dtype) for w in weights[:n_embs]]
+        self.kernels = [quantize(w, dtype) for w in weights[n_embs::2]]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in weights[n_embs + 1::2]]
+
+    @classmethod
+    def from_keras(cls, encoder, dtype: str = 'int8'):
+        """
+        Create quantized copy of trained Encoder
+        """
+        weights = encoder.get_weights()
+        return cls(weights, len(weights) - 4, dtype)
+
+    def predict(self, x: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+        """
+        Compute latent vectors, same interface as Keras Model.predict
+
+        :param x: raw feature vectors with encoded categorical features in first columns
+        :param batch_size: number of rows processed at once
+        :return: float32 latent vectors
+        """
+        x = np.asarray(x, dtype=np.float32)
+        kernels = [dequantize(*kernel) for kernel in self.kernels]
+
+        res = []
+        for start in range(0, x.shape[0], batch_size):
+            batch = x[start:start + batch_size]
+            # gather quantized rows of each table and rescale only them
+            embs = [q[batch[:, i].astype(np.int64)].astype(np.float32) * (1 if s is None else s)
+                    for i, (q, s) in enumerate(self.tables)]
+            h = np.hstack(embs + [batch[:, self.n_embs:]])
+            h = np.tanh(h @ kernels[0] + self.biases[0])
+            res.append(h @ kernels[1] + self.biases[1])
+        return np.vstack(res) if res else np.empty((0, self.biases[-1].size), dtype=np.float32)
+
+    def to_arrays(self, prefix: str) -> dict:
+        """
+        :return: dict of arrays describing encoder, keys start with prefix
+        """
+        arrays = {f'{prefix}dtype': np.array(self.dtype), f'{prefix}n_embs': np.array(self.n_embs)}
+        for name, group in [('table', self.tables), ('kernel', self.kernels)]:
+            for i, (q, s) in enumerate(group):
+                arrays[f'{prefix}{name}_{i}'] = q
+                if s is not None:
+                    arrays[f'{prefix}{name}_scales_{i}'] = s
+        for i, b in enumerate(self.biases):
+            arrays[f'{prefix}bias_{i}'] = b
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str):
+        """
+        Restore encoder saved with to_arrays
+        """
+        enc = cls.__new__(cls)
+        enc.dtype, enc.n_embs = str(arrays[f'{prefix}dtype']), int(arrays[f'{prefix}n_embs'])
+        enc.tables, enc.kernels = [], []
+        for name, group, n in [('table', enc.tables, enc.n_embs), ('kernel', enc.kernels, 2)]:
+            for i in range(n):
+                scales = f'{prefix}{name}_scales_{i}'
+                group.append((arrays[f'{prefix}{name}_{i}'], arrays[scales] if scales in arrays else None))
+        enc.biases = [arrays[f'{prefix}bias_{i}'] for i in range(2)]
+        return enc
+
+
+class QuantizedIndex:
+    """
+    Exact nearest neighbours search over latent vectors stored in float16 or int8.
+    Has the same query interface as sklearn's KDTree
+    """
+
+    def __init__(self, vectors: np.ndarray, dtype: str = 'int8', block_size: int = 65536):
+        """
+        :param vectors: latent vectors to index
+        :param dtype: 'float16' or 'int8'
+        :param block_size: number of indexed vectors scanned at once, bounds memory of distance matrices
+        """
+        self.codes, self.scales = quantize(vectors, dtype)
+        self.block_size = block_size
+        # squared norms of the vectors as they are seen by the search
+        self.sq_norms = np.square(dequantize(self.codes, self.scales)).sum(axis=1)
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.sq_norms.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def query(self, x: np.ndarray, k: int = 1) -> (np.ndarray, np.ndarray):
+        """
+        Find k nearest vectors for each row of x
+
+        :param x: query vectors
+        :param k: number of neighbours
+        :return: euclidean distances and indices of neighbours, both sorted by distance
+        """
+        x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+        k = min(k, len(self))
+        # scales are moved to queries, so quantized vectors are only cast
+        xs = x if self.scales is None else x * self.scales
+        rows = np.arange(x.shape[0])[:, None]
+
+        best_d = np.full((x.shape[0], 0), np.inf, dtype=np.float32)
+        best_i = np.empty((x.shape[0], 0), dtype=np.int64)
+        for start in range(0, len(self), self.block_size):
+            block = self.codes[start:start + self.block_size].astype(np.float32)
+            # squared distances without the constant query's norm
+            d = self.sq_norms[None, start:start + block.shape[0]] - 2 * xs @ block.T
+
+            # best candidates of the block
+            i = np.argpartition(d, k - 1, axis=1)[:, :k] if d.shape[1] > k else \
+                np.tile(np.arange(d.shape[1]), (x.shape[0], 1))
+            d, i = d[rows, i], i + start
+
+            # merged with the current best ones
+            d, i = np.hstack([best_d, d]), np.hstack([best_i, i])
+            if d.shape[1] > k:
+                part = np.argpartition(d, k - 1, axis=1)[:, :k]
+                d, i = d[rows, part], i[rows, part]
+            best_d, best_i = d, i
+
+        order = np.argsort(best_d, axis=1)
+        dists = best_d[rows, order] + np.square(x).sum(axis=1)[:, None]
+        return np.sqrt(np.maximum(dists, 0)), best_i[rows, order]
+
+    def to_arrays(self, prefix: str) -> dict:
+        """
+        :return: dict of arrays describing index, keys start with prefix
+        """
+        arrays = {f'{prefix}codes': self.codes}
+        if self.scales is not None:
+            arrays[f'{prefix}scales'] = self.scales
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str, block_size: int = 65536):
+        """
+        Restore index saved with to_arrays
+        """
+        index = cls.__new__(cls)
+        index.codes = arrays[f'{prefix}codes']
+        index.scales = arrays[f'{prefix}scales'] if f'{prefix}scales' in arrays else None
+        index.block_size = block_size
+        index.sq_norms = np.square(dequantize(index.codes, index.scales)).sum(axis=1)
+        return index
+
+
+def export(predictor, path: str, dtype: str = 'int8'):
+    """
+    Save quantized encoders and latent indices of Predictor for CPU serving
+
+    :param predictor: Predictor with trained encoders and computed latent vectors
+    :param path: path to npz file
+    :param dtype: 'float16' or 'int8'
+    """
+    arrays = {}
+    for side in ['que', 'pro']:
+        encoder = QuantizedEncoder.from_keras(getattr(predictor, side + '_model'), dtype)
+        arrays.update(encoder.to_arrays(side + '_model_'))
+        arrays.update(QuantizedIndex(getattr(predictor, side + '_lat_vecs'), dtype).to_arrays(side + '_index_'))
+        arrays[side + '_ids'] = getattr(predictor, side + '_ids').ravel().astype(str)
+    np.savez(path, **arrays)
+
+
+def load(path: str) -> dict:
+    """
+    Load quantized encoders and latent indices saved with export
+
+    :return: dict with 'que_model', 'pro_model', 'que_index', 'pro_index', 'que_ids' and 'pro_ids'
+    """
+    res = {}
+    with np.load(path) as arrays:
+        arrays = dict(arrays)
+    for side in ['que', 'pro']:
+        res[side + '_model'] = QuantizedEncoder.from_arrays(arrays, side + '_model_')
+        res[side + '_index'] = QuantizedIndex.from_arrays(arrays, side + '_index_')
+        res[side + '_ids'] = arrays[side + '_ids'].astype(object)
+    return res
@@ -0,0 +1,194 @@
+import os
+import threading
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from sklearn.neighbors import KDTree
+
+
+def hash_partition(n: int, n_shards: int) -> np.ndarray:
+    """
+    Assign n vectors to shards round-robin, so shards are balanced in size
+
+    :return: shard of each vector
+    """
+    return np.arange(n) % n_shards
+
+
+def time_partition(dates: np.ndarray, n_shards: int) -> np.ndarray:
+    """
+    Assign vectors to shards by contiguous time buckets with equal number of vectors,
+    so only the shard with the latest bucket has to be rebuilt when new vectors arrive
+
+    :param dates: date of each vector
+    :return: shard of each vector
+    """
+    dates = pd.to_datetime(dates).values.astype('datetime64[ns]').astype(np.int64)
+    ranks = np.empty(dates.size, dtype=np.int64)
+    ranks[np.argsort(dates, kind='mergesort')] = np.arange(dates.size)
+    return ranks * n_shards // max(dates.size, 1)
+
+
+class _Shard:
+    """
+    Index over vectors of one shard, queried with positions of vectors in the whole index
+    """
+
+    def __init__(self, vectors: np.ndarray, positions: np.ndarray, build):
+        self.tree = build(vectors) if len(positions) else None
+        self.positions = positions
+
+    def query(self, x: np.ndarray, k: int) -> (np.ndarray, np.ndarray):
+        if self.tree is None:
+            return np.empty((x.shape[0], 0)), np.empty((x.shape[0], 0), dtype=np.int64)
+        dists, ind = self.tree.query(x, k=min(k, len(self.positions)))
+        return dists, self.positions[ind]
+
+
+def _serve_shard(conn, vectors: np.ndarray, positions: np.ndarray, build):
+    """
+    Main loop of shard process: builds index on its vectors and answers top-k queries over them
+    """
+    shard = _Shard(vectors, positions, build)
+    while True:
+        cmd, *args = conn.recv()
+        if cmd == 'query':
+            conn.send(shard.query(*args))
+        elif cmd == 'build':
+            shard = _Shard(*args, build)
+            conn.send(len(shard.positions))
+        elif cmd == 'close':
+            conn.close()
+            return
+
+
+class ShardedIndex:
+    """
+    Latent vectors partitioned across local worker processes, each of them holding an index over its shard.
+    Queries are sent to all the shards at once and their local top-k results are merged by coordinator.
+    Shard processes are started on the first query in each process, so forked workers, e.g. of a web server,
+    get their own shard processes instead of sharing pipes with the parent.
+    Daemonic processes, e.g. workers of multiprocessing.Pool, can't have children and hold all the shards themselves.
+    Has the same query interface as sklearn's KDTree
+    """
+
+    def __init__(self, vectors: np.ndarray, shards: np.ndarray, build=KDTree):
+        """
+        :param vectors: latent vectors to index
+        :param shards: shard of each vector, see hash_partition and time_partition
+        :param build: function building index of one shard from its vectors, e.g. QuantizedIndex with fixed dtype
+        """
+        self.n_shards = int(shards.max()) + 1 if len(shards) else 1
+        self.build = build
+        # content of each shard, kept to start shard processes in any process
+        self.data = []
+        for shard in range(self.n_shards):
+            positions = np.flatnonzero(shards == shard)
+            self.data.append((vectors[positions], positions))
+
+        # process which started shard processes, pipes to them are valid only there
+        self.pid, self.closed = None, False
+        self.lock = threading.Lock()
+        self.conns, self.procs, self.local = [], [], None
+
+    def __start(self):
+        """
+        Start shard processes owned by the current process, must be called under self.lock
+        """
+        if multiprocessing.current_process().daemon:
+            self.local = [_Shard(vectors, positions, self.build) for vectors, positions in self.data]
+        else:
+            # shard processes are forked with their data and build indices in parallel
+            ctx = multiprocessing.get_context('fork')
+            for vectors, positions in self.data:
+                parent, child = ctx.Pipe()
+                proc = ctx.Process(target=_serve_shard, args=(child, vectors, positions, self.build), daemon=True)
+                proc.start()
+                child.close()
+                self.conns.append(parent)
+                self.procs.append(proc)
+        self.pid = os.getpid()
+
+    def __acquire(self):
+        """
+        Lock shard processes of the current process, starting them if needed
+        """
+        if self.closed:
+            raise ValueError('index is closed')
+        if self.pid is not None and self.pid != os.getpid():
+            # inherited through fork: pipes and lock belong to the parent, which keeps using them
+            self.lock = threading.Lock()
+            self.conns, self.procs, self.local, self.pid = [], [], None, None
+        self.lock.acquire()
+        if self.pid is None:
+            try:
+                self.__start()
+            except BaseException:
+                self.lock.release()
+                raise
+
+    def rebuild(self, shard: int, vectors: np.ndarray, positions: np.ndarray):
+        """
+        Replace the content of one shard, other shards keep serving
+
+        :param shard: shard to rebuild
+        :param vectors: new latent vectors of the shard
+        :param positions: positions of vectors in the whole index, returned by queries
+        """
+        self.__acquire()
+        try:
+            self.data[shard] = (vectors, np.asarray(positions))
+            if self.local is not None:
+                self.local[shard] = _Shard(*self.data[shard], self.build)
+            else:
+                self.conns[shard].send(('build', *self.data[shard]))
+                self.conns[shard].recv()
+        finally:
+            self.lock.release()
+
+    def query(self, x: np.ndarray, k: int = 1) -> (np.ndarray, np.ndarray):
+        """
+        Find k nearest vectors for each row of x across all the shards
+
+        :param x: query vectors
+        :param k: number of neighbours
+        :return: distances and positions of neighbours, both sorted by distance
+        """
+        x = np.atleast_2d(x)
+        self.__acquire()
+        try:
+            if self.local is not None:
+                results = [shard.query(x, k) for shard in self.local]
+            else:
+                for conn in self.conns:
+                    conn.send(('query', x, k))
+                results = [conn.recv() for conn in self.conns]
+        finally:
+            self.lock.release()
+
+        dists = np.hstack([dists for dists, ind in results])
+        ind = np.hstack([ind for dists, ind in results])
+        order = np.argsort(dists, axis=1, kind='mergesort')[:, :k]
+        rows = np.arange(x.shape[0])[:, None]
+        return dists[rows, order], ind[rows, order]
+
+    def close(self):
+        """
+        Stop shard processes of the current process, the ones inherited from the parent are left to it
+        """
+        self.closed = True
+        if self.pid != os.getpid():
+            return
+        with self.lock:
+            for conn, proc in zip(self.conns, self.procs):
+                conn.send(('close',))
+                proc.join()
+            self.conns, self.procs, self.local, self.pid = [], [], None, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
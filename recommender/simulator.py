@@ -0,0 +1,257 @@
+import sys
+
+sys.path.extend(['..'])
+
+import os
+import copy
+import time
+import pickle
+import itertools
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from recommender.activity import DAY_NS, to_ns
+from recommender.timeindex import TimeIndex
+from recommender.exclusion import PairedIndex
+from recommender.eg_que_to_pro import Dispatcher
+from utils.loader import load_tables
+
+
+class Simulator:
+    """
+    Offline discrete-event replay of email dispatching.
+    Each simulated day Dispatcher recommends open questions to professionals registered so far and passes them
+    through activity filter, spam filter and epsilon exploration, exactly as in production.
+    Sent emails are scored against historical answers: an email captures an answer
+    if the professional answered that question on the day of email or later.
+    Pairs are excluded from recommendations only once their answers are given before the simulated day,
+    so the answers to be captured are not hidden from Dispatcher in advance
+    """
+
+    def __init__(self, dispatcher: Dispatcher, que_dates: np.ndarray, que_lat_vecs: np.ndarray,
+                 answers: pd.DataFrame, que_removed: np.ndarray = None):
+        """
+        :param dispatcher: Dispatcher over all the questions and professionals, with historical emails
+        :param que_dates: dates questions were added, aligned with dispatcher's que_ids
+        :param que_lat_vecs: latent vectors of questions, aligned with dispatcher's que_ids
+        :param answers: historical answers with columns 'answers_author_id', 'answers_question_id'
+        and 'answers_date_added'
+        :param que_removed: mask of removed questions aligned with dispatcher's que_ids, they are never dispatched
+        """
+        self.dispatcher = dispatcher
+        self.que_dates = to_ns(que_dates)
+        self.que_lat_vecs = np.asarray(que_lat_vecs, dtype=np.float32)
+        self.que_removed = np.zeros(self.que_dates.size, dtype=bool) if que_removed is None else \
+            np.asarray(que_removed, dtype=bool)
+        # sorted dates are used to count questions added in a time window
+        self.sorted_dates = np.sort(self.que_dates)
+
+        pro_dates = dispatcher.pro_dates.reindex(dispatcher.pro_ids).values.astype('datetime64[ns]')
+        # professionals with unknown registration dates are never registered in simulation
+        self.pro_known = ~np.isnat(pro_dates)
+        self.pro_dates = to_ns(pro_dates)
+
+        n_ques = dispatcher.que_ids.size
+        answers = answers[['answers_author_id', 'answers_question_id', 'answers_date_added']]
+        ans_pros = pd.Index(dispatcher.pro_ids).get_indexer(answers['answers_author_id'].values)
+        ans_ques = pd.Index(dispatcher.que_ids).get_indexer(answers['answers_question_id'].values)
+        ans_dates = to_ns(answers['answers_date_added'].values)
+
+        # answers of dispatched professionals sorted by date, they become paired as the replay passes their dates
+        known = (ans_pros >= 0) & (ans_ques >= 0)
+        order = np.argsort(ans_dates[known], kind='mergesort')
+        self.pair_pros = dispatcher.pro_ids[ans_pros[known][order]]
+        self.pair_ques = ans_ques[known][order]
+        self.pair_dates = ans_dates[known][order]
+
+        # date of the first answer of professional on question, used to score sent emails
+        keys, dates = ans_pros[known] * n_ques + ans_ques[known], ans_dates[known]
+        order = np.lexsort((dates, keys))
+        keys, dates = keys[order], dates[order]
+        first = np.ones(keys.size, dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        self.ans_index = pd.Index(keys[first])
+        self.ans_dates = dates[first]
+
+    @classmethod
+    def from_predictor(cls, predictor, questions: pd.DataFrame, professionals: pd.DataFrame, answers: pd.DataFrame,
+                       emails: pd.DataFrame, **kwargs):
+        """
+        Create Simulator with Dispatcher built from latent vectors and index already computed by Predictor
+
+        :param kwargs: additional arguments of Dispatcher
+        """
+        dispatcher = Dispatcher.from_predictor(predictor, professionals, answers, emails, **kwargs)
+        que_dates = questions.set_index('questions_id')['questions_date_added'].reindex(dispatcher.que_ids).values
+        return cls(dispatcher, que_dates, predictor.que_lat_vecs, answers, predictor.que_tree.removed)
+
+    def run(self, start: np.datetime64, end: np.datetime64, open_days: int = 30, seed: int = 0, **params) -> dict:
+        """
+        Replay the period from start to end day by day.
+        Spam filter starts from historical emails sent before start and then sees only simulated emails,
+        pairs of professionals and questions are excluded from recommendations from the day after their answers
+
+        :param start: first simulated day
+        :param end: day after the last simulated one
+        :param open_days: number of days question stays open if it was not answered
+        :param seed: seed of random generator used for epsilon exploration
+        :param params: Dispatcher's parameters to simulate with, like eps, min_days or active_max_days
+        :return: dict of simulation metrics and timings
+        """
+        dispatcher = copy.copy(self.dispatcher)
+        for name, value in params.items():
+            if not hasattr(dispatcher, name):
+                raise TypeError(f'Dispatcher has no parameter {name}')
+            setattr(dispatcher, name, value)
+
+        rng = np.random.RandomState(seed)
+        n_ques = self.que_dates.size
+        start, end = int(to_ns(np.datetime64(start, 'ns'))), int(to_ns(np.datetime64(end, 'ns')))
+
+        # open questions are searched in time window of not answered partitions, removed questions are closed
+        index = TimeIndex(self.que_lat_vecs, self.que_dates, np.zeros(n_ques, dtype=bool))
+        index.remove(np.flatnonzero(self.que_removed))
+        engine = dispatcher.filter_engine(np.datetime64(start, 'ns'))
+        # date of the first captured answer of each question
+        answered = np.full(n_ques, np.iinfo(np.int64).max)
+        closed = self.que_removed.copy()
+
+        # pairs known to Dispatcher are only the ones answered before the current day
+        dispatcher.paired = PairedIndex({}, dispatcher.que_ids)
+        n_paired = 0
+
+        sent, explored, captured, decisions = 0, 0, 0, 0
+        dispatch_time = 0
+
+        for day in range(start, end, DAY_NS):
+            cur_date = np.datetime64(day, 'ns')
+
+            # questions with captured answers given before current day are closed
+            new = np.flatnonzero(~closed & (answered < day))
+            index.mark_answered(new)
+            closed[new] = True
+
+            # answers given before current day become paired
+            n_new = np.searchsorted(self.pair_dates, day)
+            if n_new > n_paired:
+                dispatcher.paired.add(self.pair_pros[n_paired:n_new], self.pair_ques[n_paired:n_new])
+                n_paired = n_new
+
+            # questions which were added during the last open_days days, some of them may be already closed
+            n_open = np.diff(np.searchsorted(self.sorted_dates, [day - open_days * DAY_NS, day]))[0]
+            # candidates are professionals registered before current day
+            pos = np.flatnonzero(self.pro_known & (self.pro_dates < day))
+            if n_open == 0 or pos.size == 0:
+                continue
+
+            tick = time.time()
+            pros, ques, scores, explore, send = dispatcher.dispatch(
+                pos, cur_date, rng, engine, index, n_open,
+                since=cur_date - np.timedelta64(open_days, 'D'), until=cur_date, answered=False)
+            dispatch_time += time.time() - tick
+            decisions += pros.size
+
+            pros, ques = pros[send], ques[send]
+            engine.add_emails(dispatcher.pro_ids[pros], dispatcher.que_ids[ques], cur_date)
+            sent += pros.size
+            explored += explore.sum()
+
+            # email captures an answer if professional answered on the day of email or later
+            found = self.ans_index.get_indexer(pros * n_ques + ques)
+            hit = found >= 0
+            hit[hit] = self.ans_dates[found[hit]] >= day
+            captured += hit.sum()
+            np.minimum.at(answered, ques[hit], self.ans_dates[found[hit]])
+
+        # time to the first answer for questions added during the simulated period
+        period = (self.que_dates >= start) & (self.que_dates < end) & ~self.que_removed
+        got = period & (answered != np.iinfo(np.int64).max)
+        ttfa = (answered[got] - self.que_dates[got]) / DAY_NS
+
+        return {'emails_sent': sent,
+                'emails_explore': int(explored),
+                'answers_captured': int(captured),
+                'capture_rate': captured / sent if sent else np.nan,
+                'questions': int(period.sum()),
+                'questions_answered': ttfa.size,
+                'ttfa_mean_days': ttfa.mean() if ttfa.size else np.nan,
+                'ttfa_median_days': np.median(ttfa) if ttfa.size else np.nan,
+                'decisions': decisions,
+                'dispatch_seconds': dispatch_time,
+                'decisions_per_second': decisions / dispatch_time if dispatch_time else np.nan}
+
+
+# simulator shared with forked worker processes
+simulator = None
+
+
+def _run_config(args: tuple) -> dict:
+    start, end, params = args
+    tick = time.time()
+    res = simulator.run(start, end, **params)
+    res['total_seconds'] = time.time() - tick
+    return {**params, **res}
+
+
+def sweep(sim: Simulator, start: np.datetime64, end: np.datetime64, grid: dict, n_jobs: int = 1) -> pd.DataFrame:
+    """
+    Run simulation for every combination of parameters in grid across a process pool
+
+    :param sim: simulator to run, shared with forked workers
+    :param start: first simulated day
+    :param end: day after the last simulated one
+    :param grid: mapping from Simulator.run or Dispatcher parameter name to list of its values
+    :param n_jobs: number of worker processes
+    :return: dataframe with parameters and metrics of each run
+    """
+    global simulator
+    simulator = sim
+
+    names = list(grid.keys())
+    tasks = [(start, end, dict(zip(names, values))) for values in itertools.product(*[grid[n] for n in names])]
+    if n_jobs > 1:
+        with multiprocessing.Pool(n_jobs) as pool:
+            res = pool.map(_run_config, tasks)
+    else:
+        res = [_run_config(task) for task in tasks]
+    return pd.DataFrame(res)
+
+
+DATA_PATH, DUMP_PATH = '../data/', '../dump/'
+
+if __name__ == '__main__':
+    from models.distance import DistanceModel
+    from recommender.predictor import Predictor
+
+    pd.set_option('display.max_columns', 100, 'display.width', 1024)
+
+    model = DistanceModel(que_dim=34 - 2 + 8 - 2,
+                          que_input_embs=[102, 42], que_output_embs=[2, 2],
+                          pro_dim=42 - 2,
+                          pro_input_embs=[102, 102, 42], pro_output_embs=[2, 2, 2],
+                          inter_dim=20, output_dim=10)
+    model.load_weights(os.path.join(DUMP_PATH, 'model.h5'))
+
+    with open(os.path.join(DUMP_PATH, 'dump.pkl'), 'rb') as file:
+        d = pickle.load(file)
+    pred = Predictor(model, d['que_data'], d['stu_data'], d['pro_data'], d['que_proc'], d['pro_proc'],
+                     d['que_to_stu'], d['pos_pairs'])
+
+    raw = load_tables(DATA_PATH, {'questions': ['questions_id', 'questions_date_added'],
+                                  'professionals': ['professionals_id', 'professionals_date_joined'],
+                                  'answers': ['answers_id', 'answers_author_id', 'answers_question_id',
+                                              'answers_date_added'],
+                                  'emails': None, 'matches': None})
+    questions, professionals, answers = raw['questions'], raw['professionals'], raw['answers']
+    emails = raw['emails'].merge(raw['matches'], left_on='emails_id', right_on='matches_email_id') \
+        .rename(columns={'matches_question_id': 'questions_id'})
+
+    sim = Simulator.from_predictor(pred, questions, professionals, answers, emails)
+
+    grid = {'eps': [(0.01, 0.5, 0.3), (0.05, 0.3, 0.1), (0, 0, 0)],
+            'active_min_days': [0.5, 1],
+            'active_max_days': [7, 15, 30]}
+    res = sweep(sim, np.datetime64('2018-01-01'), np.datetime64('2019-01-01'), grid, n_jobs=os.cpu_count())
+    print(res)
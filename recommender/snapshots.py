@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from recommender.activity import to_ns
+
+
+class SnapshotStore:
+    """
+    Time-indexed feature snapshots of students or professionals, as produced by StuProc and ProProc.
+    Snapshots are kept in contiguous arrays sorted by entity and time, with int64 nanosecond times,
+    so the state of any batch of entities as of any times is found with a single vectorized search
+    """
+
+    def __init__(self, df: pd.DataFrame, dtype=np.float32):
+        """
+        :param df: dataframe of entity's id, snapshot's time and features after that time.
+        First snapshot of each entity is its default state, its time is usually missing
+        :param dtype: type features are stored in
+        """
+        codes, uniques = pd.factorize(df.iloc[:, 0].values)
+        # missing times become the smallest int64, so default snapshots go first
+        times = to_ns(pd.to_datetime(df.iloc[:, 1]).values)
+
+        order = np.lexsort((times, codes))
+        self.index = pd.Index(uniques)
+        self.columns = list(df.columns[2:])
+        self.offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(uniques)), out=self.offsets[1:])
+        self.times = times[order]
+        self.feat = np.ascontiguousarray(df.iloc[:, 2:].values[order].astype(dtype))
+
+        # times are replaced by their ranks, so (entity, time) pairs are ordered by single int64 key
+        self.uniq_times = np.unique(self.times)
+        self.keys = codes[order].astype(np.int64) * (self.uniq_times.size + 1) + \
+                    np.searchsorted(self.uniq_times, self.times)
+
+    def __len__(self):
+        return len(self.index)
+
+    def known(self, ids: np.ndarray) -> np.ndarray:
+        """
+        :return: whether each entity has snapshots
+        """
+        return self.index.get_indexer(np.asarray(ids).ravel()) >= 0
+
+    def __rows(self, ids: np.ndarray) -> np.ndarray:
+        rows = self.index.get_indexer(np.asarray(ids).ravel())
+        if (rows < 0).any():
+            raise KeyError(np.asarray(ids).ravel()[rows < 0][0])
+        return rows
+
+    def positions(self, ids: np.ndarray, times) -> np.ndarray:
+        """
+        Find snapshots of entities as of given times: the latest ones made strictly before each time,
+        or the default ones if there are none
+
+        :param ids: ids of entities, all of them must be known
+        :param times: time for each entity, or single time for all of them
+        :return: positions of snapshots in the store
+        """
+        rows = self.__rows(ids)
+        times = np.broadcast_to(to_ns(pd.to_datetime(np.atleast_1d(times)).values), rows.shape)
+
+        # the first snapshot of the entity not earlier than time, the one before it is the answer
+        found = np.searchsorted(self.keys, rows * (self.uniq_times.size + 1) +
+                                np.searchsorted(self.uniq_times, times))
+        return np.maximum(found - 1, self.offsets[rows])
+
+    def asof(self, ids: np.ndarray, times) -> np.ndarray:
+        """
+        :return: matrix of entity's features as of given times, see positions
+        """
+        return self.feat[self.positions(ids, times)]
+
+    def latest(self, ids: np.ndarray) -> np.ndarray:
+        """
+        :return: matrix of the latest entity's features
+        """
+        return self.feat[self.offsets[self.__rows(ids) + 1] - 1]
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+from recommender.exclusion import PairedIndex
+
+
+class TagIndex:
+    """
+    Inverted index from tag name to positions of questions or professionals in latent index, in CSR form.
+    Union of postings of query's tags is a candidate set, so per-query work is bounded by tag fan-out
+    """
+
+    def __init__(self, positions: np.ndarray, tags: np.ndarray):
+        """
+        :param positions: positions of tagged entities in latent index
+        :param tags: tag names, aligned with positions
+        """
+        self.index = pd.Index([])
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.empty(0, dtype=np.int64)
+        self.add(positions, tags)
+
+    def add(self, positions: np.ndarray, tags: np.ndarray):
+        """
+        Add new entity-tag pairs
+        """
+        # existing postings are unrolled back to flat form and CSR is rebuilt vectorized
+        tags = np.concatenate([np.repeat(np.asarray(self.index, dtype=object), np.diff(self.offsets)),
+                               np.asarray(tags, dtype=object)])
+        positions = np.concatenate([self.postings, np.asarray(positions, dtype=np.int64)])
+
+        codes, uniques = pd.factorize(tags)
+        order = np.lexsort((positions, codes))
+        codes, positions = codes[order], positions[order]
+        # duplicate pairs are stored once
+        first = np.ones(codes.size, dtype=bool)
+        first[1:] = (codes[1:] != codes[:-1]) | (positions[1:] != positions[:-1])
+
+        self.index = pd.Index(uniques)
+        self.offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes[first], minlength=len(uniques)), out=self.offsets[1:])
+        self.postings = positions[first]
+
+    def remove(self, positions: np.ndarray):
+        """
+        Remove all the tags of entities at given positions
+        """
+        keep = ~np.isin(self.postings, positions)
+        rows = np.repeat(np.arange(len(self.index)), np.diff(self.offsets))
+        np.cumsum(np.bincount(rows[keep], minlength=len(self.index)), out=self.offsets[1:])
+        self.postings = self.postings[keep]
+
+    def candidates(self, tags: np.ndarray) -> np.ndarray:
+        """
+        :return: sorted positions of entities having any of given tags
+        """
+        rows = self.index.get_indexer(np.asarray(tags, dtype=object))
+        rows = rows[rows >= 0]
+        if rows.size == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([self.postings[self.offsets[row]:self.offsets[row + 1]] for row in rows]))
+
+
+def query_tagged(vectors: np.ndarray, removed: np.ndarray, tag_index: TagIndex, x: np.ndarray, ids: np.ndarray,
+                 tags: list, top: int, paired: PairedIndex, min_candidates: int = None) -> tuple:
+    """
+    Hybrid top-k query: candidates sharing tags with each query are scored exactly in latent space,
+    queries with too few candidates are left for the full index
+
+    :param vectors: latent vectors by position, e.g. DeltaIndex.vectors
+    :param removed: boolean mask of removed positions
+    :param tag_index: tag inverted index over the same positions
+    :param x: query vectors
+    :param ids: ids of query entities
+    :param tags: array of tag names for each query
+    :param top: number of neighbours to find
+    :param paired: already paired targets of query entities, skipped
+    :param min_candidates: queries with fewer unseen candidates fall back to full index, top by default
+    :return: distances and positions of neighbours, padded with inf and -1,
+    and boolean mask of queries answered from candidates
+    """
+    x, ids = np.atleast_2d(x), np.asarray(ids).ravel()
+    min_candidates = top if min_candidates is None else min_candidates
+    dists = np.full((ids.size, top), np.inf)
+    positions = np.full((ids.size, top), -1, dtype=np.int64)
+    done = np.zeros(ids.size, dtype=bool)
+
+    for i in range(ids.size):
+        cands = tag_index.candidates(tags[i])
+        cands = cands[~removed[cands]]
+        cands = cands[~paired.excluded(ids[i:i + 1], cands[None, :])[0]]
+        if cands.size < max(min_candidates, 1):
+            continue
+
+        # exact distances to candidates, first top of them sorted by distance
+        d = np.sqrt(np.square(vectors[cands] - x[i]).sum(axis=1))
+        k = min(top, cands.size)
+        best = np.argpartition(d, k - 1)[:k]
+        best = best[np.argsort(d[best], kind='mergesort')]
+        dists[i, :k], positions[i, :k] = d[best], cands[best]
+        done[i] = True
+
+    return dists, positions, done
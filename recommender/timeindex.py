@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+from sklearn.neighbors import KDTree
+
+from recommender.activity import DAY_NS, to_ns
+
+
+class TimeIndex:
+    """
+    Latent vectors of questions partitioned by period of date added and by answered status.
+    Queries search only partitions overlapping the requested time window and status,
+    new questions roll partitions forward and old partitions are retired as a whole
+    """
+
+    def __init__(self, vectors: np.ndarray, dates: np.ndarray, answered: np.ndarray, period_days: int = 7):
+        """
+        :param vectors: latent vectors of questions
+        :param dates: dates questions were added
+        :param answered: whether each question is already answered
+        :param period_days: length of time period covered by single partition
+        """
+        self.period = period_days * DAY_NS
+        # partition key is pair of period number and answered status
+        self.parts = {}
+        # date and answered status of each position, used to move questions between partitions
+        self.dates = np.empty(0, dtype=np.int64)
+        self.answered = np.empty(0, dtype=bool)
+        self.add(vectors, np.arange(len(vectors)), dates, answered)
+
+    def __len__(self):
+        return sum(part['positions'].size for part in self.parts.values())
+
+    def __insert(self, key: tuple, vectors: np.ndarray, positions: np.ndarray):
+        part = self.parts.setdefault(key, {'vectors': np.empty((0, vectors.shape[1]), dtype=np.float32),
+                                           'positions': np.empty(0, dtype=np.int64), 'tree': None})
+        part['vectors'] = np.vstack([part['vectors'], vectors.astype(np.float32)])
+        part['positions'] = np.concatenate([part['positions'], positions])
+        # tree is rebuilt lazily on the next query touching the partition
+        part['tree'] = None
+
+    def add(self, vectors: np.ndarray, positions: np.ndarray, dates: np.ndarray, answered: np.ndarray = None):
+        """
+        Add new questions, only partitions of their periods are touched
+
+        :param vectors: latent vectors of questions
+        :param positions: positions of questions, returned by queries
+        :param dates: dates questions were added
+        :param answered: whether each question is already answered, not answered by default
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        dates = to_ns(dates)
+        answered = np.zeros(positions.size, dtype=bool) if answered is None else np.asarray(answered, dtype=bool)
+
+        if positions.size and positions.max() >= self.dates.size:
+            size = positions.max() + 1
+            self.dates = np.concatenate([self.dates, np.zeros(size - self.dates.size, dtype=np.int64)])
+            self.answered = np.concatenate([self.answered, np.zeros(size - self.answered.size, dtype=bool)])
+        self.dates[positions], self.answered[positions] = dates, answered
+
+        keys = pd.DataFrame({'period': dates // self.period, 'answered': answered})
+        for key, rows in keys.groupby(['period', 'answered']).indices.items():
+            self.__insert((int(key[0]), bool(key[1])), np.asarray(vectors)[rows], positions[rows])
+
+    def remove(self, positions: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Remove questions from their partitions, questions of retired partitions are skipped
+
+        :return: latent vectors and positions of removed questions
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        vectors, removed = [], []
+        keys = pd.DataFrame({'period': self.dates[positions] // self.period, 'answered': self.answered[positions]})
+        for key, rows in keys.groupby(['period', 'answered']).indices.items():
+            part = self.parts.get((int(key[0]), bool(key[1])))
+            if part is None:
+                continue
+            found = pd.Index(part['positions']).get_indexer(positions[rows])
+            found = found[found >= 0]
+            vectors.append(part['vectors'][found])
+            removed.append(part['positions'][found])
+
+            keep = np.ones(part['positions'].size, dtype=bool)
+            keep[found] = False
+            part['vectors'], part['positions'], part['tree'] = part['vectors'][keep], part['positions'][keep], None
+
+        if not removed:
+            return np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+        return np.vstack(vectors), np.concatenate(removed)
+
+    def mark_answered(self, positions: np.ndarray):
+        """
+        Move questions to answered partitions of their periods
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        vectors, positions = self.remove(np.unique(positions[~self.answered[positions]]))
+        if positions.size:
+            self.add(vectors, positions, self.dates[positions].astype('datetime64[ns]'),
+                     np.ones(positions.size, dtype=bool))
+
+    def retire(self, before: np.datetime64) -> int:
+        """
+        Drop partitions of periods which ended before given date
+
+        :return: number of retired questions
+        """
+        last = int(to_ns(np.datetime64(before, 'ns'))) // self.period
+        retired = [key for key in self.parts if key[0] < last]
+        return sum(self.parts.pop(key)['positions'].size for key in retired)
+
+    def query(self, x: np.ndarray, k: int = 1, since: np.datetime64 = None, until: np.datetime64 = None,
+              answered: bool = None) -> (np.ndarray, np.ndarray):
+        """
+        Find k nearest questions for each row of x among questions added in the window with given status
+
+        :param x: query vectors
+        :param k: number of neighbours, fewer are returned if the window is small
+        :param since: search questions added on this date or later
+        :param until: search questions added before this date
+        :param answered: search only answered (True) or only not answered (False) questions, all by default
+        :return: distances and positions of neighbours, both sorted by distance
+        """
+        x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+        lo = None if since is None else int(to_ns(np.datetime64(since, 'ns')))
+        hi = None if until is None else int(to_ns(np.datetime64(until, 'ns')))
+
+        dists, positions = [np.empty((x.shape[0], 0))], [np.empty((x.shape[0], 0), dtype=np.int64)]
+        for (period, status), part in self.parts.items():
+            # skip partitions out of the window as a whole
+            if (answered is not None and status != answered) or part['positions'].size == 0 or \
+                    (lo is not None and (period + 1) * self.period <= lo) or \
+                    (hi is not None and period * self.period >= hi):
+                continue
+
+            # partitions on the window's borders are filtered by exact dates
+            inside = np.ones(part['positions'].size, dtype=bool)
+            if lo is not None and period * self.period < lo:
+                inside &= self.dates[part['positions']] >= lo
+            if hi is not None and (period + 1) * self.period > hi:
+                inside &= self.dates[part['positions']] < hi
+            if not inside.any():
+                continue
+
+            if inside.all():
+                if part['tree'] is None:
+                    part['tree'] = KDTree(part['vectors'])
+                d, ind = part['tree'].query(x, k=min(k, inside.size))
+                dists.append(d)
+                positions.append(part['positions'][ind])
+            else:
+                d = np.sqrt(np.square(x[:, None, :] - part['vectors'][inside][None, :, :]).sum(axis=2))
+                ind = np.argsort(d, axis=1)[:, :k]
+                dists.append(np.take_along_axis(d, ind, axis=1))
+                positions.append(part['positions'][inside][ind])
+
+        dists, positions = np.hstack(dists), np.hstack(positions)
+        order = np.argsort(dists, axis=1, kind='mergesort')[:, :k]
+        rows = np.arange(x.shape[0])[:, None]
+        return dists[rows, order], positions[rows, order]
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommender.activity import activity_filter, activity_filter_bulk, spam_filter, email_filter, \
+    build_csr, FilterEngine
+
+START = np.datetime64('2018-01-01', 'ns')
+CUR_DATE = np.datetime64('2018-07-01', 'ns')
+
+
+def random_dates(rng, n, days=180):
+    return START + (rng.uniform(0, days, n) * 86400e9).astype('timedelta64[ns]')
+
+
+def test_activity_filter_bulk():
+    rng = np.random.RandomState(0)
+    # registration date and from zero to a dozen answers, some of them densely packed
+    n = 300
+    sizes = rng.randint(1, 14, n)
+    codes = np.repeat(np.arange(n), sizes)
+    dates = random_dates(rng, codes.size, days=rng.choice([10, 180]))
+
+    offsets, ns = build_csr(codes, n, dates)
+    sorted_dates = ns.astype('datetime64[ns]')
+    expected = [activity_filter(sorted_dates[offsets[i]:offsets[i + 1]], CUR_DATE) for i in range(n)]
+
+    np.testing.assert_array_equal(activity_filter_bulk(offsets, ns, CUR_DATE), expected)
+
+
+def test_activity_filter_bulk_empty():
+    # professionals without any dates are never active
+    offsets = np.array([0, 0, 2])
+    dates = np.array([START, CUR_DATE - np.timedelta64(3, 'D')])
+
+    np.testing.assert_array_equal(activity_filter_bulk(offsets, dates, CUR_DATE), [False, True])
+
+
+@pytest.fixture
+def history():
+    rng = np.random.RandomState(1)
+    pros = np.array(['p{}'.format(i) for i in range(40)])
+    ques = np.array(['q{}'.format(i) for i in range(60)])
+
+    # emailed pairs are unique, a part of them is answered some days after the email
+    pairs = pd.Series(rng.choice(pros.size * ques.size, 600, replace=False))
+    email_pros, email_ques = pros[pairs.values // ques.size], ques[pairs.values % ques.size]
+    email_dates = random_dates(rng, pairs.size)
+
+    answered = rng.rand(pairs.size) < 0.4
+    ans_pros, ans_ques = email_pros[answered], email_ques[answered]
+    ans_dates = email_dates[answered] + (rng.exponential(3, answered.sum()) * 86400e9).astype('timedelta64[ns]')
+
+    # answers to questions professionals were not emailed about
+    extra = 100
+    ans_pros = np.concatenate([ans_pros, rng.choice(pros, extra)])
+    ans_ques = np.concatenate([ans_ques, rng.choice(ques, extra)])
+    ans_dates = np.concatenate([ans_dates, random_dates(rng, extra)])
+
+    # a professional emailed just now and an unknown one
+    email_pros = np.append(email_pros, 'p0')
+    email_ques = np.append(email_ques, ques[0])
+    email_dates = np.append(email_dates, CUR_DATE - np.timedelta64(1, 'h'))
+    return email_pros, email_ques, email_dates, ans_pros, ans_ques, ans_dates
+
+
+def candidates(history):
+    email_pros, email_ques = history[0], history[1]
+    pros = np.unique(email_pros)
+    ques = np.unique(email_ques)[:20]
+    return np.repeat(pros, ques.size), np.tile(ques, pros.size)
+
+
+def scalar_inputs(history, pro):
+    email_pros, email_ques, email_dates, ans_pros, ans_ques, ans_dates = history
+    emails, answers = email_pros == pro, ans_pros == pro
+    # scalar filters take the first occurrence of each question, so events are ordered by date
+    e_order, a_order = np.argsort(email_dates[emails]), np.argsort(ans_dates[answers])
+    return email_ques[emails][e_order], email_dates[emails][e_order], \
+        ans_ques[answers][a_order], ans_dates[answers][a_order]
+
+
+def test_spam_filter(history):
+    engine = FilterEngine(*history)
+    pros, ques = candidates(history)
+    pros, ques = np.append(pros, 'unknown'), np.append(ques, 'q1')
+
+    expected = []
+    for pro, que in zip(pros, ques):
+        e_ques, e_dates, _, _ = scalar_inputs(history, pro)
+        expected.append(e_ques.size == 0 or spam_filter(que, e_ques, e_dates.max(), CUR_DATE))
+
+    np.testing.assert_array_equal(engine.spam_filter(pros, ques, CUR_DATE), expected)
+
+
+@pytest.mark.parametrize('offset_days,thresh', [(1, 0.1), (7, 0.3), (30, 0.5)])
+def test_email_filter(history, offset_days, thresh):
+    engine = FilterEngine(*history)
+    pros, ques = candidates(history)
+
+    expected = [email_filter(que, *scalar_inputs(history, pro), CUR_DATE, offset_days, thresh=thresh)
+                for pro, que in zip(pros, ques)]
+
+    np.testing.assert_array_equal(engine.email_filter(pros, ques, CUR_DATE, offset_days, thresh=thresh), expected)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from recommender.delta import DeltaIndex
+
+
+def brute_force(vectors: np.ndarray, live: np.ndarray, x: np.ndarray, k: int) -> (np.ndarray, np.ndarray):
+    positions = np.flatnonzero(live)
+    d = np.sqrt(np.square(x[:, None, :] - vectors[positions][None, :, :]).sum(axis=2))
+    order = np.argsort(d, axis=1, kind='mergesort')[:, :k]
+    return np.take_along_axis(d, order, axis=1), positions[order]
+
+
+@pytest.mark.parametrize('merge_size', [7, 10000])
+def test_updates(merge_size):
+    rng = np.random.RandomState(0)
+    vectors = rng.randn(200, 5).astype(np.float32)
+    live = np.ones(len(vectors), dtype=bool)
+    index = DeltaIndex(vectors, merge_size=merge_size)
+
+    for step in range(30):
+        action = step % 3
+        if action == 0:
+            new = rng.randn(rng.randint(1, 5), 5).astype(np.float32)
+            positions = index.add(new)
+            np.testing.assert_array_equal(positions, np.arange(len(vectors), len(vectors) + len(new)))
+            vectors, live = np.vstack([vectors, new]), np.concatenate([live, np.ones(len(new), dtype=bool)])
+        elif action == 1:
+            positions = rng.choice(len(vectors), 6)
+            index.remove(positions)
+            live[positions] = False
+        else:
+            # replaced vectors keep their positions, removed ones are restored
+            positions = rng.choice(len(vectors), 4, replace=False)
+            new = rng.randn(len(positions), 5).astype(np.float32)
+            index.replace(positions, new)
+            vectors[positions], live[positions] = new, True
+
+        x = rng.randn(10, 5).astype(np.float32)
+        dists, positions = index.query(x, k=8)
+        exp_dists, exp_positions = brute_force(vectors, live, x, 8)
+
+        assert len(index) == live.sum()
+        np.testing.assert_allclose(dists, exp_dists, rtol=1e-5)
+        np.testing.assert_array_equal(positions, exp_positions)
+
+
+def test_query_more_than_live():
+    index = DeltaIndex(np.eye(3, dtype=np.float32))
+    index.remove([0, 2])
+    index.add(np.ones((1, 3), dtype=np.float32))
+
+    dists, positions = index.query(np.zeros((2, 3)), k=5)
+    assert positions.shape == (2, 2)
+    np.testing.assert_array_equal(np.sort(positions, axis=1), [[1, 3], [1, 3]])
+
+
+def test_merge_builds_live_vectors():
+    built = []
+
+    def build(vectors, positions):
+        built.append(positions)
+        return DeltaIndex(vectors, merge_size=10 ** 9)
+
+    index = DeltaIndex(np.arange(12, dtype=np.float32).reshape(4, 3), build=build, merge_size=2)
+    index.remove([1])
+    index.replace([2], np.zeros((1, 3)))
+
+    # main index is rebuilt once enough of its entries are outdated, from live vectors only
+    np.testing.assert_array_equal(built[-1], [0, 2, 3])
+    assert index.delta.size == 0 and index.stale_main == 0
+
+    index.add(np.ones((2, 3)))
+    np.testing.assert_array_equal(built[-1], [0, 2, 3, 4, 5])
+    np.testing.assert_array_equal(index.query(np.zeros((1, 3)), k=1)[1], [[2]])
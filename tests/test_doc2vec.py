@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('gensim')
+pytest.importorskip('nltk')
+
+from nlp.doc2vec import CorpusJoin, TaggedCorpus
+
+
+@pytest.fixture
+def join() -> CorpusJoin:
+    que = pd.DataFrame({'questions_id': ['q0', 'q1', 'q2'], 'questions_title': ['law', np.nan, 'art'],
+                        'questions_body': ['b0', 'b1', 'b2']})
+    que['questions_whole'] = que['questions_title'].fillna('') + ' ' + que['questions_body']
+    ans = pd.DataFrame({'answers_question_id': ['q0', 'q1', 'q2', 'q0'], 'answers_author_id': ['p0', 'p1', 'p2', 'p2'],
+                        'answers_body': ['a0', 'a1', np.nan, 'a3']})
+    pro = pd.DataFrame({'professionals_id': ['p0', 'p1', 'p2'], 'professionals_industry': ['vet', np.nan, 'vet'],
+                        'professionals_headline': [np.nan, 'h1', 'h2']})
+    tag_que = pd.DataFrame({'tag_questions_question_id': ['q0', 'q1', 'q2', 'q2'],
+                            'tags_tag_name': ['t0', 't1', 't2', 't3']})
+    tag_pro = pd.DataFrame({'tag_users_user_id': ['p0', 'p1', 'p2'], 'tags_tag_name': ['u0', 'u1', 'u2']})
+    return CorpusJoin(que, ans, pro, tag_que, tag_pro)
+
+
+def pairs(corpus: TaggedCorpus) -> set:
+    return set(zip(corpus.texts, corpus.tags))
+
+
+def test_missing_values_are_skipped(join):
+    corpus = join.corpus('answers', 'professionals_industry', ['answers_body', 'professionals_headline',
+                                                               'professionals_industry'])
+    # answers of p1 have no industry, answer on q2 has no body, p0 has no headline
+    assert pairs(corpus) == {('a0', 'vet'), ('a3', 'vet'), ('h2', 'vet'), ('vet', 'vet')}
+
+    corpus = join.corpus('tags', 'tags_tag_name', ['questions_title', 'professionals_headline'])
+    assert pairs(corpus) == {('law', 't0'), ('art', 't2'), ('art', 't3'), ('h1', 't1'), ('h2', 't0'),
+                             ('h2', 't2'), ('h2', 't3')}
+    assert all(isinstance(text, str) for text in corpus.texts)
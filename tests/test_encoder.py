@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+h5py = pytest.importorskip('h5py')
+
+from models.distance import DistanceModel
+from models.encoder import CategoricalEmbedding
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dump', 'model.h5')
+
+
+def build_model() -> DistanceModel:
+    # the same dimensions as in app.py and other serving scripts
+    return DistanceModel(que_dim=34 - 2 + 8 - 2,
+                         que_input_embs=[102, 42], que_output_embs=[2, 2],
+                         pro_dim=42 - 2,
+                         pro_input_embs=[102, 102, 42], pro_output_embs=[2, 2, 2],
+                         inter_dim=20, output_dim=10)
+
+
+@pytest.fixture(scope='module')
+def model():
+    model = build_model()
+    model.load_weights(MODEL_PATH)
+    return model
+
+
+def saved_weights(layer: str) -> list:
+    with h5py.File(MODEL_PATH, 'r') as file:
+        group = file[layer]
+        return [group[name][()] for name in group.attrs['weight_names']]
+
+
+def encode(x: np.ndarray, tables: list, dense: list) -> np.ndarray:
+    """
+    Numpy forward pass of Encoder
+    """
+    codes = x[:, :len(tables)].astype(np.int64)
+    h = np.hstack([table[codes[:, i]] for i, table in enumerate(tables)] + [x[:, len(tables):]])
+    (k1, b1), (k2, b2) = dense
+    return np.tanh(h @ k1 + b1) @ k2 + b2
+
+
+@pytest.mark.parametrize('encoder,tables,dense,nuniques', [
+    ('que_model', ['embedding_1', 'embedding_2'], ['dense_1', 'dense_2'], [102, 42]),
+    ('pro_model', ['embedding_3', 'embedding_4', 'embedding_5'], ['dense_3', 'dense_4'], [102, 102, 42]),
+])
+def test_load_saved_model(model, encoder, tables, dense, nuniques):
+    encoder = getattr(model, encoder)
+    tables = [saved_weights(name)[0] for name in tables]
+    dense = [saved_weights(name) for name in dense]
+
+    rng = np.random.RandomState(0)
+    x = rng.randn(64, encoder.input_shape[1]).astype(np.float32)
+    x[:, :len(nuniques)] = np.array([rng.randint(0, n, x.shape[0]) for n in nuniques]).T
+
+    np.testing.assert_allclose(encoder.predict(x), encode(x, tables, dense), rtol=1e-4, atol=1e-5)
+
+
+def test_fused_embeddings(model):
+    assert [layer.input_dims for layer in model.layers if isinstance(layer, CategoricalEmbedding)] == \
+        [[102, 42], [102, 102, 42]]
+
+
+def test_save_load_weights(model, tmp_path):
+    path = str(tmp_path / 'model.h5')
+    model.save_weights(path)
+    loaded = build_model()
+    loaded.load_weights(path)
+
+    for a, b in zip(model.get_weights(), loaded.get_weights()):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from sklearn.neighbors import KDTree
+
+from recommender.exclusion import PairedIndex, query_unseen
+
+
+def test_paired_index():
+    paired = PairedIndex({'p0': {'q1', 'q2', 'qx'}, 'p1': {'q0'}, 'q0': {'p1'}}, ['q0', 'q1', 'q2'])
+    np.testing.assert_array_equal(paired.counts(['p0', 'p1', 'p2', 'q0']), [2, 1, 0, 0])
+
+    cands = np.array([[0, 1, 2], [0, 1, 2], [2, 1, 0]])
+    np.testing.assert_array_equal(paired.excluded(['p0', 'p1', 'p2'], cands),
+                                  [[False, True, True], [True, False, False], [False, False, False]])
+
+    # duplicate pairs are stored once
+    paired.add(np.array(['p1', 'p1', 'p2'], dtype=object), [0, 2, 1])
+    np.testing.assert_array_equal(paired.counts(['p0', 'p1', 'p2']), [2, 2, 1])
+    np.testing.assert_array_equal(paired.excluded(['p1'], np.array([[2, 1]])), [[True, False]])
+
+
+def test_empty_paired_index():
+    paired = PairedIndex({}, ['q0'])
+    np.testing.assert_array_equal(paired.counts(['p0', 'p1']), [0, 0])
+    np.testing.assert_array_equal(paired.excluded(['p0'], np.array([[0]])), [[False]])
+
+
+@pytest.mark.parametrize('top', [1, 5, 40])
+def test_query_unseen(top):
+    rng = np.random.RandomState(0)
+    vectors, x = rng.randn(50, 3), rng.randn(20, 3)
+    ids = np.array([f'p{i}' for i in range(len(x))], dtype=object)
+    # some entities are paired with most of the neighbours, so queries are retried with larger k
+    entity_to_paired = {ids[i]: {f'q{j}' for j in rng.choice(50, rng.randint(0, 45), replace=False)}
+                        for i in range(len(x))}
+    que_ids = np.array([f'q{j}' for j in range(len(vectors))], dtype=object)
+    paired = PairedIndex(entity_to_paired, que_ids)
+
+    dists, positions = query_unseen(KDTree(vectors), x, ids, top, paired, len(vectors))
+
+    d = np.sqrt(np.square(x[:, None, :] - vectors[None, :, :]).sum(axis=2))
+    for i in range(len(x)):
+        unseen = np.flatnonzero(~np.isin(que_ids, list(entity_to_paired[ids[i]])))
+        expected = unseen[np.argsort(d[i, unseen], kind='mergesort')][:top]
+        np.testing.assert_array_equal(positions[i, :expected.size], expected)
+        np.testing.assert_allclose(dists[i, :expected.size], d[i, expected])
+        # fewer unseen neighbours than top are padded
+        assert (positions[i, expected.size:] == -1).all() and np.isinf(dists[i, expected.size:]).all()
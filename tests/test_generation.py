@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from recommender.generation import Generation, Reloader
+
+
+@pytest.fixture
+def closed(monkeypatch) -> list:
+    """
+    Numbers of closed generations, in order of closing
+    """
+    closed = []
+    close = Generation.close
+
+    def __close(self):
+        closed.append(self.number)
+        close(self)
+
+    monkeypatch.setattr(Generation, 'close', __close)
+    return closed
+
+
+def test_retired_generation_closed_by_last_request(closed):
+    reloader = Reloader(lambda: {'x': 1}, [])
+    entered, finish = threading.Barrier(3), threading.Event()
+
+    def __request():
+        with reloader.use() as gen:
+            assert gen.number == 1
+            entered.wait()
+            finish.wait()
+
+    threads = [threading.Thread(target=__request) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    entered.wait()
+
+    # old generation stays open while requests use it, new requests get the new one
+    reloader.reload(wait=True)
+    assert reloader.status()['generation'] == 2 and closed == []
+    with reloader.use() as gen:
+        assert gen.number == 2 and gen['x'] == 1
+
+    finish.set()
+    for thread in threads:
+        thread.join()
+    assert closed == [1]
+
+
+def test_idle_generation_closed_on_reload(closed):
+    reloader = Reloader(lambda: {}, [])
+    with reloader.use():
+        pass
+    reloader.reload(wait=True)
+    assert closed == [1]
+
+
+def test_failed_reload_keeps_generation(closed):
+    builds = iter([{}])
+    reloader = Reloader(lambda: next(builds), [])
+    reloader.reload(wait=True)
+    assert reloader.status()['generation'] == 1 and 'StopIteration' in reloader.status()['error']
+    assert closed == []
@@ -0,0 +1,40 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip('gensim')
+
+from nlp.lda import BowCorpus, text_key
+
+
+class Dictionary:
+    def doc2bow(self, words: list) -> list:
+        return [(len(word), 1) for word in words]
+
+
+def test_pickled_corpus_is_located(tmp_path):
+    train, serve = tmp_path / 'train', tmp_path / 'serve'
+    train.mkdir()
+    serve.mkdir()
+    (train / 'lda_corpus.mm').write_text('')
+    texts = np.array(['a bb', 'ccc'], dtype=object)
+    corpus = BowCorpus(str(train / 'lda_corpus.mm'), ['q0', 'q1'], [text_key(text) for text in texts])
+
+    # only file name is pickled, texts are converted until the corpus is located
+    restored = pickle.loads(pickle.dumps(corpus))
+    assert restored.path is None and str(train) not in pickle.dumps(corpus).decode('latin-1')
+    assert restored.get(['q0', 'q1'], texts, Dictionary()) == [[(1, 1), (2, 1)], [(3, 1)]]
+    with pytest.raises(FileNotFoundError):
+        restored.mm
+
+    assert not restored.locate(str(serve)) and restored.path is None
+    (serve / 'lda_corpus.mm').write_text('')
+    assert restored.locate(str(serve)) and restored.path == os.path.join(str(serve), 'lda_corpus.mm')
+
+
+def test_corpus_pickled_with_absolute_path():
+    corpus = BowCorpus.__new__(BowCorpus)
+    corpus.__setstate__({'path': '/old/dump/lda_corpus.mm', 'ids': None, 'keys': None, '_BowCorpus__mm': None})
+    assert corpus.path is None and corpus.name == 'lda_corpus.mm'
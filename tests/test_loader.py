@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import loader
+from utils.loader import load_table, load_tables, cache_file
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    pd.DataFrame({
+        'students_id': ['s1', 's2', 's3'],
+        'students_location': ['Boston', None, 'Denver'],
+        'students_date_joined': ['2016-04-26 19:08:50 UTC+0000', None, '2018-01-02 03:04:05 UTC+0000'],
+    }).to_csv(str(tmp_path / 'students.csv'), index=False)
+    pd.DataFrame({'tags_tag_id': [1, 2], 'tags_tag_name': ['college', 'math']}) \
+        .to_csv(str(tmp_path / 'tags.csv'), index=False)
+    return str(tmp_path)
+
+
+@pytest.fixture(params=['parquet', 'npz'])
+def cache_format(request, monkeypatch):
+    if request.param == 'parquet':
+        pytest.importorskip('pyarrow')
+    monkeypatch.setattr(loader, 'CACHE_FORMAT', request.param)
+    return request.param
+
+
+def test_types(data_path, cache_format):
+    df = load_table(data_path, 'students')
+
+    assert list(df.columns) == ['students_id', 'students_location', 'students_date_joined']
+    assert df['students_date_joined'].dtype == np.dtype('datetime64[ns]')
+    assert df['students_date_joined'].iloc[0] == pd.Timestamp('2016-04-26 19:08:50')
+    assert pd.isnull(df['students_date_joined'].iloc[1])
+    assert pd.isnull(df['students_location'].iloc[1])
+    assert os.path.isfile(cache_file(data_path, 'students'))
+
+
+def test_columns_projected(data_path, cache_format):
+    load_table(data_path, 'students')
+    # the second read comes from cache and has only requested columns, in requested order
+    df = load_table(data_path, 'students', ['students_date_joined', 'students_id'])
+
+    assert list(df.columns) == ['students_date_joined', 'students_id']
+    assert list(df['students_id']) == ['s1', 's2', 's3']
+
+
+def test_outdated_cache(data_path, cache_format):
+    load_table(data_path, 'tags')
+    pd.DataFrame({'tags_tag_id': [3], 'tags_tag_name': ['art']}).to_csv(os.path.join(data_path, 'tags.csv'),
+                                                                        index=False)
+    path = cache_file(data_path, 'tags')
+    os.utime(path, (0, 0))
+
+    df = load_table(data_path, 'tags')
+    assert list(df['tags_tag_name']) == ['art']
+    assert df['tags_tag_id'].dtype == np.int64
+
+
+def test_failed_write_keeps_cache(data_path, cache_format, monkeypatch):
+    expected = load_table(data_path, 'tags')
+    os.utime(cache_file(data_path, 'tags'), (0, 0))
+
+    def fail(*args, **kwargs):
+        raise IOError('disk full')
+
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', fail)
+    monkeypatch.setattr(np, 'savez', fail)
+    with pytest.raises(IOError):
+        load_table(data_path, 'tags')
+
+    # the old cache file is left intact and no temporary files are left behind
+    monkeypatch.undo()
+    path = cache_file(data_path, 'tags')
+    os.utime(path, None)
+    pd.testing.assert_frame_equal(load_table(data_path, 'tags'), expected)
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+
+
+def test_load_tables(data_path, cache_format):
+    tables = load_tables(data_path, {'students': ['students_id'], 'tags': None})
+
+    assert list(tables['students'].columns) == ['students_id']
+    assert list(tables['tags'].columns) == ['tags_tag_id', 'tags_tag_name']
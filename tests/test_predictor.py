@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('keras')
+
+from recommender.predictor import Predictor
+from recommender.eg_que_to_pro import Dispatcher
+
+
+class Linear:
+    """
+    Stand-in for Keras encoder
+    """
+
+    def __init__(self, weights: np.ndarray):
+        self.weights = weights
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return np.asarray(x, dtype=np.float32) @ self.weights
+
+
+class QueProc:
+    def transform(self, que_df: pd.DataFrame, que_tags: pd.DataFrame) -> pd.DataFrame:
+        return pd.DataFrame({'questions_id': que_df['questions_id'].values,
+                             'questions_time': que_df['questions_date_added'].values,
+                             'questions_len': que_df['questions_body'].str.len().values})
+
+
+class ProProc:
+    def transform(self, pro_df, que_df, ans_df, pro_tags) -> pd.DataFrame:
+        return pd.DataFrame({'professionals_id': pro_df['professionals_id'].values,
+                             'professionals_time': pro_df['professionals_date_joined'].values,
+                             'professionals_len': pro_df['professionals_headline'].str.len().values,
+                             'professionals_one': 1.0})
+
+
+@pytest.fixture
+def predictor() -> Predictor:
+    model = type('Model', (), {'que_model': Linear(np.array([[1, 0], [0, 1]], dtype=np.float32)),
+                               'pro_model': Linear(np.array([[0, 1], [1, 0]], dtype=np.float32))})
+    dates = pd.to_datetime(['2018-01-01', '2018-01-02', '2018-01-03'])
+    que_data = pd.DataFrame({'questions_id': ['q0', 'q1', 'q2'], 'questions_time': dates,
+                             'questions_len': [1.0, 2.0, 3.0]})
+    stu_data = pd.DataFrame({'students_id': ['s0'], 'students_time': [pd.NaT], 'students_feat': [0.5]})
+    pro_data = pd.DataFrame({'professionals_id': ['p0', 'p1'], 'professionals_time': [pd.NaT, pd.NaT],
+                             'professionals_len': [1.0, 2.0], 'professionals_one': [1.0, 1.0]})
+    que_to_stu = {'q0': 's0', 'q1': 's0', 'q2': 's0'}
+    return Predictor(model, que_data, stu_data, pro_data, QueProc(), ProProc(), que_to_stu,
+                     [('q0', 's0', 'p0', dates[0])])
+
+
+def que_frame(ids: list, bodies: list) -> (pd.DataFrame, pd.DataFrame):
+    que_df = pd.DataFrame({'questions_id': ids, 'questions_author_id': 's0',
+                           'questions_date_added': '2018-02-01', 'questions_body': bodies})
+    que_tags = pd.DataFrame({'tag_questions_question_id': ids, 'tags_tag_name': 'law'})
+    return que_df, que_tags
+
+
+def pro_frame(ids: list, headlines: list) -> (pd.DataFrame, pd.DataFrame):
+    pro_df = pd.DataFrame({'professionals_id': ids, 'professionals_date_joined': '2018-02-01',
+                           'professionals_headline': headlines})
+    pro_tags = pd.DataFrame({'tag_users_user_id': ids, 'tags_tag_name': 'law'})
+    return pro_df, pro_tags
+
+
+def add_pros(predictor: Predictor, ids: list, headlines: list):
+    pro_df, pro_tags = pro_frame(ids, headlines)
+    que_df = pd.DataFrame({'questions_date_added': []})
+    ans_df = pd.DataFrame({'answers_date_added': []})
+    predictor.add_professionals(pro_df, que_df, ans_df, pro_tags)
+
+
+def test_add_same_ids_twice(predictor):
+    predictor.index_tags(que_frame([], [])[1], pro_frame([], [])[1])
+    predictor.add_questions(*que_frame(['q3', 'q3'], ['a', 'abcd']))
+    predictor.add_questions(*que_frame(['q3', 'q1'], ['abcdef', 'abcdefgh']))
+    add_pros(predictor, ['p2'], ['a'])
+    add_pros(predictor, ['p2', 'p1'], ['ab', 'abc'])
+
+    # each id keeps a single position with its latest vector
+    assert pd.Index(predictor.que_ids.ravel()).is_unique and len(predictor.que_ids) == 4
+    assert pd.Index(predictor.pro_ids.ravel()).is_unique and len(predictor.pro_ids) == 3
+    assert len(predictor.que_tree) == 4 and len(predictor.pro_tree) == 3
+    np.testing.assert_allclose(predictor.que_lat_vecs[predictor.que_positions['q3']], [0.5, 6])
+    np.testing.assert_allclose(predictor.que_tree.vectors[predictor.que_positions['q1']], [0.5, 8])
+    np.testing.assert_allclose(predictor.pro_tree.vectors[predictor.pro_positions['p1']], [1, 3])
+    np.testing.assert_array_equal(predictor.que_tag_index.candidates(['law']),
+                                  [predictor.que_positions['q1'], predictor.que_positions['q3']])
+
+    # latest question is the nearest one
+    dists, positions = predictor.que_tree.query([[0.5, 6]], k=4)
+    assert predictor.que_ids.ravel()[positions[0, 0]] == 'q3'
+    assert sorted(predictor.que_ids.ravel()[positions[0]]) == ['q0', 'q1', 'q2', 'q3']
+
+    predictor.remove_professionals(['p1'])
+    professionals = pd.DataFrame({'professionals_id': ['p0', 'p1', 'p2'],
+                                  'professionals_date_joined': pd.to_datetime(['2017-01-01'] * 3)})
+    answers = pd.DataFrame({'answers_author_id': ['p0'], 'answers_date_added': pd.to_datetime(['2018-01-01'])})
+    emails = pd.DataFrame({'emails_recipient_id': [], 'questions_id': [], 'emails_date_sent': pd.to_datetime([])})
+    dispatcher = Dispatcher.from_predictor(predictor, professionals, answers, emails)
+
+    assert sorted(dispatcher.pro_ids) == ['p0', 'p2']
+    np.testing.assert_allclose(dispatcher.pro_lat_vecs[dispatcher.pro_ids == 'p2'], [[1, 2]])
+
+
+def test_remove_then_add(predictor):
+    predictor.remove_questions(['q1'])
+    assert len(predictor.que_tree) == 2
+    assert 'q1' not in predictor.que_ids.ravel()[predictor.que_tree.query([[0, 0]], k=3)[1][0]]
+
+    # removed question is restored at its old position
+    position = predictor.que_positions['q1']
+    predictor.add_questions(*que_frame(['q1'], ['ab']))
+    assert predictor.que_positions['q1'] == position and len(predictor.que_ids) == 3
+    assert len(predictor.que_tree) == 3
+    assert predictor.que_tree.query([[0.5, 2]], k=1)[1][0, 0] == position
@@ -0,0 +1,71 @@
+from functools import partial
+
+import numpy as np
+import pytest
+
+from recommender.quantized import quantize, dequantize, QuantizedEncoder, QuantizedIndex
+from recommender.sharded import ShardedIndex, hash_partition
+
+
+@pytest.mark.parametrize('dtype, rtol', [('float16', 1e-3), ('int8', 2e-2)])
+def test_quantize(dtype, rtol):
+    x = np.random.RandomState(0).randn(100, 4).astype(np.float32)
+    q, scales = quantize(x, dtype)
+    assert q.dtype == np.dtype(dtype)
+    np.testing.assert_allclose(dequantize(q, scales), x, atol=rtol * np.abs(x).max())
+
+
+def test_quantize_zero_column():
+    q, scales = quantize(np.zeros((3, 2)), 'int8')
+    np.testing.assert_array_equal(dequantize(q, scales), np.zeros((3, 2)))
+
+
+def test_encoder():
+    rng = np.random.RandomState(0)
+    weights = [rng.randn(5, 2), rng.randn(4, 2), rng.randn(2 + 2 + 3, 6), rng.randn(6), rng.randn(6, 3), rng.randn(3)]
+    x = np.hstack([rng.randint(0, 5, (50, 1)), rng.randint(0, 4, (50, 1)), rng.randn(50, 3)])
+
+    # numpy forward pass of full precision Encoder
+    h = np.hstack([weights[0][x[:, 0].astype(int)], weights[1][x[:, 1].astype(int)], x[:, 2:]])
+    expected = np.tanh(h @ weights[2] + weights[3]) @ weights[4] + weights[5]
+
+    encoder = QuantizedEncoder(weights, 2, 'float16')
+    np.testing.assert_allclose(encoder.predict(x, batch_size=16), expected, atol=1e-2)
+
+    arrays = QuantizedEncoder(weights, 2, 'int8').to_arrays('que_')
+    restored = QuantizedEncoder.from_arrays(arrays, 'que_')
+    np.testing.assert_allclose(restored.predict(x), expected, atol=0.2)
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'int8'])
+def test_index(dtype):
+    rng = np.random.RandomState(0)
+    vectors, x = rng.randn(300, 4), rng.randn(20, 4)
+    index = QuantizedIndex(vectors, dtype, block_size=64)
+
+    # search is exact over the vectors as they are stored
+    stored = dequantize(*quantize(vectors, dtype))
+    d = np.sqrt(np.square(x[:, None, :] - stored[None, :, :]).sum(axis=2))
+    dists, ind = index.query(x, k=5)
+    np.testing.assert_array_equal(ind, np.argsort(d, axis=1)[:, :5])
+    np.testing.assert_allclose(dists, np.sort(d, axis=1)[:, :5], rtol=1e-4, atol=1e-4)
+
+    restored = QuantizedIndex.from_arrays(index.to_arrays('que_index_'), 'que_index_')
+    np.testing.assert_array_equal(restored.query(x, k=5)[1], ind)
+
+
+def test_sharded_quantized_index():
+    rng = np.random.RandomState(0)
+    vectors, x = rng.randn(200, 4), rng.randn(10, 4)
+    build = partial(QuantizedIndex, dtype='int8')
+
+    # each shard is quantized on its own, so results match brute force over per-shard quantized vectors
+    shards = hash_partition(len(vectors), 3)
+    stored = np.empty_like(vectors)
+    for shard in range(3):
+        stored[shards == shard] = dequantize(*quantize(vectors[shards == shard], 'int8'))
+    d = np.sqrt(np.square(x[:, None, :] - stored[None, :, :]).sum(axis=2))
+
+    with ShardedIndex(vectors, shards, build) as index:
+        dists, positions = index.query(x, k=5)
+    np.testing.assert_array_equal(positions, np.argsort(d, axis=1)[:, :5])
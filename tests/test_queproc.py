@@ -0,0 +1,93 @@
+import pickle
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip('gensim')
+
+from preprocessors.queproc import QueProc
+
+
+class Dictionary:
+    def doc2bow(self, words: list) -> list:
+        return [(len(word), 1) for word in words]
+
+
+class Tfidf:
+    def __getitem__(self, bow: list) -> list:
+        return bow
+
+
+class Lda:
+    """
+    Stand-in for LdaModel, its inference depends on the random state like the real one
+    """
+    num_topics = 3
+
+    def __init__(self):
+        self.random_state = np.random.RandomState(0)
+
+    def inference(self, chunk: list) -> (np.ndarray, None):
+        return np.array([self.random_state.rand(3) + sum(c for _, c in doc) for doc in chunk]), None
+
+
+def que_proc(**kwargs) -> QueProc:
+    return QueProc({}, None, Dictionary(), Tfidf(), Lda(), **kwargs)
+
+
+TEXTS = np.array([f'text {i} ' + 'word ' * (i % 7) for i in range(200)], dtype=object)
+IDS = np.array([f'q{i}' for i in range(len(TEXTS))], dtype=object)
+
+
+def test_infer_lda_is_deterministic():
+    expected = que_proc(chunk_size=1000).infer_lda(IDS, TEXTS)
+
+    # vectors don't depend on chunks, cache or other texts inferred together
+    proc = que_proc(chunk_size=7, cache_size=50)
+    np.testing.assert_allclose(proc.infer_lda(IDS[::-1], TEXTS[::-1]), expected[::-1])
+    np.testing.assert_allclose(proc.infer_lda(IDS[:10], TEXTS[:10]), expected[:10])
+    assert len(proc.lda_cache) == 50
+
+
+def test_infer_lda_concurrent():
+    expected = que_proc().infer_lda(IDS, TEXTS)
+    proc = que_proc(chunk_size=5, cache_size=20)
+    random_state = proc.lda_model.random_state
+    results, errors = {}, []
+
+    def __run(i: int):
+        try:
+            rows = np.random.RandomState(i).permutation(len(TEXTS))[:50]
+            for _ in range(5):
+                results.setdefault(i, []).append((rows, proc.infer_lda(IDS[rows], TEXTS[rows])))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=__run, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    for runs in results.values():
+        for rows, embs in runs:
+            np.testing.assert_allclose(embs, expected[rows])
+    # shared model is not touched
+    assert proc.lda_model.random_state is random_state
+
+
+def test_pickle_drops_cache():
+    proc = que_proc(n_jobs=2, chunk_size=10)
+    proc.infer_lda(IDS, TEXTS)
+    restored = pickle.loads(pickle.dumps(proc))
+    assert len(restored.lda_cache) == 0 and restored.chunk_size == 10 and restored.n_jobs == 2
+
+    # dumps made before caching and parallel inference
+    state = proc.__dict__.copy()
+    for name in ['lda_cache', 'lda_corpus', 'n_jobs', 'chunk_size', 'cache_size']:
+        del state[name]
+    old = QueProc.__new__(QueProc)
+    old.__setstate__(state)
+    np.testing.assert_allclose(old.infer_lda(IDS, TEXTS), proc.infer_lda(IDS, TEXTS))
@@ -0,0 +1,78 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from recommender.sharded import ShardedIndex, hash_partition, time_partition
+
+rng = np.random.RandomState(0)
+VECTORS, X = rng.randn(300, 4), rng.randn(20, 4)
+# index shared with forked processes
+INDEX = None
+
+
+def brute_force(vectors: np.ndarray, x: np.ndarray, k: int) -> np.ndarray:
+    d = np.sqrt(np.square(x[:, None, :] - vectors[None, :, :]).sum(axis=2))
+    return np.argsort(d, axis=1, kind='mergesort')[:, :k]
+
+
+def test_partitions():
+    np.testing.assert_array_equal(np.bincount(hash_partition(10, 3)), [4, 3, 3])
+    dates = np.array(['2018-03-01', '2018-01-01', '2018-02-01', '2018-04-01'], dtype='datetime64[ns]')
+    np.testing.assert_array_equal(time_partition(dates, 2), [1, 0, 0, 1])
+
+
+def test_query_and_rebuild():
+    with ShardedIndex(VECTORS, hash_partition(len(VECTORS), 4)) as index:
+        np.testing.assert_array_equal(index.query(X, k=7)[1], brute_force(VECTORS, X, 7))
+
+        # shard 0 keeps only its first ten vectors
+        positions = np.flatnonzero(hash_partition(len(VECTORS), 4) == 0)
+        index.rebuild(0, VECTORS[positions[:10]], positions[:10])
+        live = np.setdiff1d(np.arange(len(VECTORS)), positions[10:])
+        np.testing.assert_array_equal(index.query(X, k=7)[1], live[brute_force(VECTORS[live], X, 7)])
+
+    with pytest.raises(ValueError):
+        index.query(X)
+
+
+def test_forked_workers():
+    global INDEX
+    INDEX = index = ShardedIndex(VECTORS, hash_partition(len(VECTORS), 3))
+    expected = brute_force(VECTORS, X, 5)
+    np.testing.assert_array_equal(index.query(X, k=5)[1], expected)
+
+    # daemonic pool workers hold shards themselves, parent's shard processes keep answering it
+    with multiprocessing.get_context('fork').Pool(3) as pool:
+        results = pool.map(_query_global, [5] * 12)
+    for result in results:
+        np.testing.assert_array_equal(result, expected)
+    np.testing.assert_array_equal(index.query(X, k=5)[1], expected)
+    index.close()
+
+
+def _query_global(k: int) -> np.ndarray:
+    return INDEX.query(X, k=k)[1]
+
+
+def _query_forked(conn):
+    conn.send(INDEX.query(X, k=5)[1])
+    INDEX.close()
+
+
+def test_forked_process():
+    global INDEX
+    INDEX = ShardedIndex(VECTORS, hash_partition(len(VECTORS), 3))
+    expected = brute_force(VECTORS, X, 5)
+    np.testing.assert_array_equal(INDEX.query(X, k=5)[1], expected)
+
+    # forked process starts its own shard processes and stops only them
+    ctx = multiprocessing.get_context('fork')
+    parent, child = ctx.Pipe()
+    proc = ctx.Process(target=_query_forked, args=(child,))
+    proc.start()
+    np.testing.assert_array_equal(parent.recv(), expected)
+    proc.join()
+    assert proc.exitcode == 0
+    np.testing.assert_array_equal(INDEX.query(X, k=5)[1], expected)
+    INDEX.close()
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('keras')
+
+from recommender.delta import DeltaIndex
+from recommender.eg_que_to_pro import Dispatcher
+from recommender.simulator import Simulator
+
+
+def test_run_captures_future_answers():
+    vectors = np.array([[0, 0], [0, 1], [0, 2]], dtype=np.float32)
+    que_ids = np.array(['q0', 'q1', 'q2'], dtype=object)
+    que_dates = pd.to_datetime(['2018-01-09', '2018-01-09', '2018-01-09']).values
+    professionals = pd.DataFrame({'professionals_id': ['p0'],
+                                  'professionals_date_joined': pd.to_datetime(['2017-01-01'])})
+    # p0 answers q0 during the simulated period, the pair is also among historical pairs of predictor
+    answers = pd.DataFrame({'answers_author_id': ['p0'], 'answers_question_id': ['q0'],
+                            'answers_date_added': pd.to_datetime(['2018-01-12'])})
+    emails = pd.DataFrame({'emails_recipient_id': [], 'questions_id': [], 'emails_date_sent': pd.to_datetime([])})
+
+    dispatcher = Dispatcher(np.array(['p0'], dtype=object), vectors[:1], que_ids, DeltaIndex(vectors),
+                            {'p0': {'q0'}, 'q0': {'p0'}}, professionals, answers, emails, top_content=1,
+                            eps=(0, 0, 0))
+    # q1 is removed
+    sim = Simulator(dispatcher, que_dates, vectors, answers, que_removed=np.array([False, True, False]))
+    res = sim.run(np.datetime64('2018-01-09'), np.datetime64('2018-01-30'))
+
+    # q0 is sent before its answer and captures it, removed q1 is never sent,
+    # q2 is recommended once q0 is answered and paired
+    assert res['answers_captured'] == 1 and res['questions'] == 2 and res['questions_answered'] == 1
+    assert res['emails_sent'] == 2
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommender.snapshots import SnapshotStore
+
+
+def find(feat_ar: np.ndarray, time_ar: np.ndarray, search_time):
+    """
+    Lookup of features as of time, which was used by BatchGenerator before SnapshotStore
+    """
+    pos = np.searchsorted(time_ar[1:], search_time)
+    assert time_ar[pos] is pd.NaT or time_ar[pos] < search_time
+    return feat_ar[pos]
+
+
+@pytest.fixture
+def data() -> pd.DataFrame:
+    rng = np.random.RandomState(0)
+    rows = []
+    for i in range(30):
+        # the first snapshot is default state without time, the rest are sorted by time
+        days = np.sort(rng.choice(60, rng.randint(0, 6), replace=False))
+        times = [pd.NaT] + list(pd.Timestamp('2018-01-01') + pd.to_timedelta(days, unit='D'))
+        rows += [(f's{i}', time, rng.randn(), rng.randn()) for time in times]
+    return pd.DataFrame(rows, columns=['students_id', 'students_time', 'students_a', 'students_b'])
+
+
+def test_asof(data):
+    store = SnapshotStore(data)
+    assert len(store) == 30 and store.columns == ['students_a', 'students_b']
+
+    # queries at random times and exactly at snapshot's times, of every entity
+    rng = np.random.RandomState(1)
+    ids = np.repeat(store.index.values, 10)
+    times = pd.Timestamp('2017-12-25') + pd.to_timedelta(rng.randint(0, 70 * 24, ids.size), unit='h')
+    times = times.where(rng.rand(ids.size) < 0.5, pd.Timestamp('2018-01-01') +
+                        pd.to_timedelta(rng.randint(0, 60, ids.size), unit='D'))
+
+    expected = []
+    for i, time in zip(ids, times):
+        group = data[data['students_id'] == i]
+        expected.append(find(group.iloc[:, 2:].values, np.array(list(group['students_time']), dtype=object), time))
+    np.testing.assert_allclose(store.asof(ids, times.values), np.vstack(expected).astype(np.float32))
+
+
+def test_latest_and_known(data):
+    store = SnapshotStore(data.sample(frac=1, random_state=0))
+    latest = data.groupby('students_id', sort=False).last()
+    np.testing.assert_allclose(store.latest(latest.index.values), latest.iloc[:, 1:].values.astype(np.float32))
+    np.testing.assert_array_equal(store.known(['s0', 'x', 's29']), [True, False, True])
+
+    # single time is broadcast to all the entities, unknown ones are rejected
+    np.testing.assert_allclose(store.asof(['s0', 's1'], '2017-01-01'), data.drop_duplicates('students_id')
+                               .set_index('students_id').loc[['s0', 's1']].iloc[:, 1:].values.astype(np.float32))
+    with pytest.raises(KeyError):
+        store.asof(['x'], '2018-01-01')
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from recommender.exclusion import PairedIndex
+from recommender.tagindex import TagIndex, query_tagged
+
+
+def test_candidates():
+    index = TagIndex([0, 1, 1, 2, 2], ['law', 'law', 'art', 'art', 'art'])
+    np.testing.assert_array_equal(index.candidates(['law']), [0, 1])
+    np.testing.assert_array_equal(index.candidates(['art', 'law', 'x']), [0, 1, 2])
+    assert index.candidates(['x']).size == 0 and index.candidates([]).size == 0
+
+    index.add([3, 0], ['math', 'art'])
+    np.testing.assert_array_equal(index.candidates(['art']), [0, 1, 2])
+    np.testing.assert_array_equal(index.candidates(['math']), [3])
+
+    # all the tags of removed entities are dropped, tags themselves are kept
+    index.remove([0, 3])
+    np.testing.assert_array_equal(index.candidates(['law', 'art', 'math']), [1, 2])
+    index.add([3], ['math'])
+    np.testing.assert_array_equal(index.candidates(['math']), [3])
+
+
+@pytest.mark.parametrize('min_candidates', [None, 1])
+def test_query_tagged(min_candidates):
+    rng = np.random.RandomState(0)
+    vectors, x = rng.randn(100, 3), rng.randn(20, 3)
+    names = np.array(['t0', 't1', 't2', 't3', 't4'], dtype=object)
+    positions = rng.randint(0, 100, 150)
+    tags = names[rng.randint(0, 5, 150)]
+    index = TagIndex(positions, tags)
+
+    removed = rng.rand(100) < 0.1
+    ids = np.array([f'p{i}' for i in range(len(x))], dtype=object)
+    que_ids = np.array([f'q{j}' for j in range(len(vectors))], dtype=object)
+    entity_to_paired = {ids[i]: set(que_ids[rng.choice(100, 5)]) for i in range(len(x))}
+    paired = PairedIndex(entity_to_paired, que_ids)
+    query_tags = [names[rng.choice(5, rng.randint(0, 3), replace=False)] for _ in range(len(x))]
+
+    dists, found, done = query_tagged(vectors, removed, index, x, ids, query_tags, 5, paired, min_candidates)
+
+    for i in range(len(x)):
+        cands = np.unique(positions[np.isin(tags, query_tags[i])])
+        cands = cands[~removed[cands] & ~np.isin(que_ids[cands], list(entity_to_paired[ids[i]]))]
+        assert done[i] == (cands.size >= (5 if min_candidates is None else 1))
+        if not done[i]:
+            assert (found[i] == -1).all()
+            continue
+
+        d = np.sqrt(np.square(vectors[cands] - x[i]).sum(axis=1))
+        expected = cands[np.argsort(d, kind='mergesort')][:5]
+        np.testing.assert_array_equal(found[i, :expected.size], expected)
+        assert (found[i, expected.size:] == -1).all() and np.isinf(dists[i, expected.size:]).all()
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from recommender.timeindex import TimeIndex
+
+rng = np.random.RandomState(0)
+N = 200
+VECTORS = rng.randn(N, 3).astype(np.float32)
+DATES = np.datetime64('2018-01-01', 'ns') + rng.randint(0, 90 * 24, N).astype('timedelta64[h]')
+ANSWERED = rng.rand(N) < 0.5
+
+
+def brute_force(live: np.ndarray, status: np.ndarray, x: np.ndarray, k: int, since=None, until=None,
+                answered=None) -> np.ndarray:
+    mask = live.copy()
+    if since is not None:
+        mask &= DATES >= np.datetime64(since, 'ns')
+    if until is not None:
+        mask &= DATES < np.datetime64(until, 'ns')
+    if answered is not None:
+        mask &= status == answered
+    positions = np.flatnonzero(mask)
+    d = np.sqrt(np.square(x[:, None, :] - VECTORS[positions][None, :, :]).sum(axis=2))
+    return positions[np.argsort(d, axis=1, kind='mergesort')[:, :k]]
+
+
+WINDOWS = [dict(), dict(since='2018-02-03 05:00'), dict(until='2018-01-20'),
+           dict(since='2018-01-10', until='2018-01-12 12:00', answered=False), dict(answered=True)]
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_query(window):
+    index = TimeIndex(VECTORS[:150], DATES[:150], ANSWERED[:150])
+    index.add(VECTORS[150:], np.arange(150, N), DATES[150:], ANSWERED[150:])
+    assert len(index) == N
+
+    x = rng.randn(10, 3)
+    dists, positions = index.query(x, k=6, **window)
+    np.testing.assert_array_equal(positions, brute_force(np.ones(N, dtype=bool), ANSWERED, x, 6, **window))
+
+
+def test_remove_and_mark_answered():
+    index = TimeIndex(VECTORS, DATES, ANSWERED)
+    live = np.ones(N, dtype=bool)
+
+    removed = np.arange(0, N, 7)
+    vectors, positions = index.remove(removed)
+    np.testing.assert_array_equal(np.sort(positions), removed)
+    np.testing.assert_allclose(vectors[np.argsort(positions)], VECTORS[removed])
+    live[removed] = False
+
+    # questions move to answered partitions and are found only there
+    index.mark_answered(np.arange(1, N, 3))
+    status = ANSWERED.copy()
+    status[np.arange(1, N, 3)] = True
+
+    x = rng.randn(10, 3)
+    for window in WINDOWS:
+        np.testing.assert_array_equal(index.query(x, k=6, **window)[1], brute_force(live, status, x, 6, **window))
+
+
+def test_retire():
+    index = TimeIndex(VECTORS, DATES, ANSWERED, period_days=7)
+    before = np.datetime64('2018-02-01', 'ns')
+    retired = index.retire(before)
+
+    # whole partitions of periods ended before the date are dropped, the partition containing it is kept
+    period = 7 * 24 * 3600 * 10 ** 9
+    last = before.astype(np.int64) // period
+    periods = DATES.astype(np.int64) // period
+    assert retired == (periods < last).sum() and len(index) == N - retired
+    positions = index.query(np.zeros((1, 3)), k=N)[1]
+    np.testing.assert_array_equal(np.sort(positions[0]), np.flatnonzero(periods >= last))
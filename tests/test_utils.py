@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('nltk')
+
+from utils.utils import join_grouped
+
+
+@pytest.mark.parametrize('sep', [' ', ', '])
+def test_join_grouped(sep):
+    rng = np.random.RandomState(0)
+    keys = np.array([f'k{i}' for i in rng.randint(0, 20, 300)], dtype=object)
+    values = np.array([f'v{i}' for i in range(300)], dtype=object)
+
+    joined = join_grouped(keys, values, sep)
+    expected = pd.Series(values).groupby(keys).agg(lambda x: sep.join(x))
+    pd.testing.assert_series_equal(joined, expected, check_names=False, check_index_type=False,
+                                   check_dtype=False)
+
+
+def test_join_grouped_non_strings():
+    joined = join_grouped(np.array([2, 1, 2]), np.array([10, 20, 30]))
+    assert joined.to_dict() == {1: '20', 2: '10 30'}
+    assert join_grouped(np.array([]), np.array([])).empty
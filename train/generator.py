@@ -4,6 +4,8 @@ import keras
 import numpy as np
 import pandas as pd
 
+from recommender.snapshots import SnapshotStore
+from utils.profiler import span
 
 # TODO: consider questions without answers
 
@@ -16,7 +18,7 @@ class BatchGenerator(keras.utils.Sequence):
     exp_mean = 30
 
     def __init__(self, que: pd.DataFrame, stu: pd.DataFrame, pro: pd.DataFrame,
-                 batch_size: int, pos_pairs: list, nonneg_pairs: list, pro_dates: dict):
+                 batch_size: int, pos_pairs: list, nonneg_pairs: list, pro_dates: dict, span_name: str = None):
         """
         :param que: pre-processed questions data
         :param stu: pre-processed students data
@@ -28,13 +30,15 @@ class BatchGenerator(keras.utils.Sequence):
         :param nonneg_pairs: tuples of question, student and professional, which are known to form a positive pair.
         Superset of pos_pairs, used in sampling of negative pairs
         :param pro_dates: mappings from professional's id to his registration date
+        :param span_name: name of profiler span generation of each batch is timed under, not timed by default
         """
         self.batch_size = batch_size
+        self.span_name = span_name
 
-        # extract mappings from question's id to question's date and features
-        que_ar = que.values
-        self.que_feat = {que_ar[i, 0]: que_ar[i, 2:] for i in range(que_ar.shape[0])}
-        self.que_time = {que_ar[i, 0]: pd.Timestamp(que_ar[i, 1]) for i in range(que_ar.shape[0])}
+        # extract question's features matrix and mappings from question's id to question's date
+        self.que_index = pd.Index(que['questions_id'].values)
+        self.que_feat = que.iloc[:, 2:].values.astype(np.float32)
+        self.que_time = dict(zip(que['questions_id'].values, pd.to_datetime(que['questions_time'])))
 
         self.pos_pairs = pos_pairs
         self.on_epoch_end()  # shuffle pos_pairs
@@ -51,58 +55,39 @@ class BatchGenerator(keras.utils.Sequence):
         self.pros = self.pros[sorted_args]
         self.pros_times = self.pros_times[sorted_args]
 
-        # extract mappings from student's id to student's date and features
-        self.stu_feat = {}
-        self.stu_time = {}
-        for stu_id, group in stu.groupby('students_id'):
-            group_ar = group.values[:, 1:]
-            self.stu_feat[stu_id] = np.array([group_ar[i, 1:] for i in range(group_ar.shape[0])])
-            self.stu_time[stu_id] = np.array([group_ar[i, 0] for i in range(group_ar.shape[0])])
-
-        # extract mappings from professional's id to professional's date and features
-        self.pro_feat = {}
-        self.pro_time = {}
-        for pro_id, group in pro.groupby('professionals_id'):
-            group_ar = group.values[:, 1:]
-            self.pro_feat[pro_id] = np.array([group_ar[i, 1:] for i in range(group_ar.shape[0])])
-            self.pro_time[pro_id] = np.array([group_ar[i, 0] for i in range(group_ar.shape[0])])
+        # time-indexed snapshots of student's and professional's features
+        self.stu_store = SnapshotStore(stu)
+        self.pro_store = SnapshotStore(pro)
 
     def __len__(self):
         return len(self.pos_pairs) // self.batch_size
 
-    @staticmethod
-    def __find(feat_ar: np.ndarray, time_ar: np.ndarray, search_time):
-        pos = np.searchsorted(time_ar[1:], search_time)
-        assert time_ar[pos] is pd.NaT or time_ar[pos] < search_time
-        return feat_ar[pos]
-
     def __convert(self, pairs: list) -> (np.ndarray, np.ndarray):
         """
         Convert list of pairs of ids to NumPy arrays
         of question and professionals features
         """
-        x_que, x_pro, current_times = [], [], []
-        for que, stu, pro, current_time in pairs:
-            que_data = self.que_feat[que]
-
-            # find student's and professional's feature at current time
-            stu_data = BatchGenerator.__find(self.stu_feat[stu], self.stu_time[stu], current_time)
-            pro_data = BatchGenerator.__find(self.pro_feat[pro], self.pro_time[pro], current_time)
+        ques, stus, pros, current_times = zip(*pairs)
+        current_times = pd.to_datetime(list(current_times)).values
 
-            # prepare current time as feature itself
-            current_time = current_time.year + (current_time.dayofyear + current_time.hour / 24) / 365
-            current_times.append(current_time)
+        # find student's and professional's feature at current time
+        stu_data = self.stu_store.asof(stus, current_times)
+        pro_data = self.pro_store.asof(pros, current_times)
+        que_data = self.que_feat[self.que_index.get_indexer(ques)]
 
-            x_que.append(np.hstack([stu_data, que_data]))
-            x_pro.append(pro_data)
-
-        # and append them to both questions and professionals
-        return np.vstack(x_que), np.vstack(x_pro)
+        return np.hstack([stu_data, que_data]), pro_data
 
     def __getitem__(self, index):
         """
         Generate the batch
         """
+        if self.span_name is None:
+            return self.__generate(index)
+        # batches are generated by Keras worker threads as well, profiler accumulates them under a lock
+        with span(self.span_name):
+            return self.__generate(index)
+
+    def __generate(self, index):
         pos_pairs = self.pos_pairs[self.batch_size * index: self.batch_size * (index + 1)]
         neg_pairs = []
 
@@ -13,9 +13,13 @@ from preprocessors.queproc import QueProc
 from preprocessors.stuproc import StuProc
 from preprocessors.proproc import ProProc
 from train.generator import BatchGenerator
+from train.ranking import evaluate_ranking
+from recommender.predictor import Predictor
 from models.distance import DistanceModel, Adam
 from utils.importance import permutation_importance, plot_fi
 from utils.utils import TextProcessor
+from utils.loader import load_tables
+from utils.profiler import profiler, span
 
 pd.set_option('display.max_columns', 100, 'display.width', 1024)
 pd.options.mode.chained_assignment = None
@@ -31,31 +35,33 @@ if __name__ == '__main__':
     #
     # ##################################################################################################################
 
-    answers = pd.read_csv(os.path.join(DATA_PATH, 'answers.csv'), parse_dates=['answers_date_added'])
-    answers['answers_body'] = answers['answers_body'].apply(tp.process)
-    ans_train = answers[answers['answers_date_added'] < SPLIT_DATE]
+    with span('read'):
+        raw = load_tables(DATA_PATH, ['answers', 'questions', 'professionals', 'students',
+                                      'tags', 'tag_questions', 'tag_users'])
 
-    questions = pd.read_csv(os.path.join(DATA_PATH, 'questions.csv'), parse_dates=['questions_date_added'])
-    questions['questions_title'] = questions['questions_title'].apply(tp.process)
-    questions['questions_body'] = questions['questions_body'].apply(tp.process)
-    questions['questions_whole'] = questions['questions_title'] + ' ' + questions['questions_body']
-    que_train = questions[questions['questions_date_added'] < SPLIT_DATE]
+    with span('text_processing'):
+        answers = raw['answers']
+        answers['answers_body'] = answers['answers_body'].apply(tp.process)
+        ans_train = answers[answers['answers_date_added'] < SPLIT_DATE]
 
-    professionals = pd.read_csv(os.path.join(DATA_PATH, 'professionals.csv'), parse_dates=['professionals_date_joined'])
-    professionals['professionals_headline'] = professionals['professionals_headline'].apply(tp.process)
-    professionals['professionals_industry'] = professionals['professionals_industry'].apply(tp.process)
-    pro_train = professionals[professionals['professionals_date_joined'] < SPLIT_DATE]
+        questions = raw['questions']
+        questions['questions_title'] = questions['questions_title'].apply(tp.process)
+        questions['questions_body'] = questions['questions_body'].apply(tp.process)
+        questions['questions_whole'] = questions['questions_title'] + ' ' + questions['questions_body']
+        que_train = questions[questions['questions_date_added'] < SPLIT_DATE]
 
-    students = pd.read_csv(os.path.join(DATA_PATH, 'students.csv'), parse_dates=['students_date_joined'])
-    stu_train = students[students['students_date_joined'] < SPLIT_DATE]
+        professionals = raw['professionals']
+        professionals['professionals_headline'] = professionals['professionals_headline'].apply(tp.process)
+        professionals['professionals_industry'] = professionals['professionals_industry'].apply(tp.process)
+        pro_train = professionals[professionals['professionals_date_joined'] < SPLIT_DATE]
 
-    tags = pd.read_csv(os.path.join(DATA_PATH, 'tags.csv'))
-    tags['tags_tag_name'] = tags['tags_tag_name'].apply(lambda x: tp.process(x, allow_stopwords=True))
+        students = raw['students']
 
-    tag_que = pd.read_csv(os.path.join(DATA_PATH, 'tag_questions.csv')) \
-        .merge(tags, left_on='tag_questions_tag_id', right_on='tags_tag_id')
-    tag_pro = pd.read_csv(os.path.join(DATA_PATH, 'tag_users.csv')) \
-        .merge(tags, left_on='tag_users_tag_id', right_on='tags_tag_id')
+        tags = raw['tags']
+        tags['tags_tag_name'] = tags['tags_tag_name'].apply(lambda x: tp.process(x, allow_stopwords=True))
+
+        tag_que = raw['tag_questions'].merge(tags, left_on='tag_questions_tag_id', right_on='tags_tag_id')
+        tag_pro = raw['tag_users'].merge(tags, left_on='tag_users_tag_id', right_on='tags_tag_id')
 
     # ##################################################################################################################
     #
@@ -67,22 +73,34 @@ if __name__ == '__main__':
 
     # calculate and save tag and industry embeddings on train data
     print('doc2vec: embeddings training')
-    tag_embs, ind_embs, head_d2v, ques_d2v = pipeline_d2v(que_train, ans_train, pro_train, tag_que, tag_pro, 10)
+    with span('train.d2v'):
+        tag_embs, ind_embs, head_d2v, ques_d2v = pipeline_d2v(que_train, ans_train, pro_train, tag_que, tag_pro, 10)
     print('lda: topic model training')
-    lda_dic, lda_tfidf, lda_model = pipeline_lda(que_train, 10)
+    with span('train.lda'):
+        lda_dic, lda_tfidf, lda_model, lda_corpus = pipeline_lda(que_train, 10,
+                                                                 path=os.path.join(DUMP_PATH, 'lda_corpus.mm'))
 
-    # extract and preprocess feature for all three main entities
+    # extract and preprocess feature for all three main entities over the whole history, once.
+    # Scalers and encoders are fitted only on rows before the split date, so test data doesn't leak into them
     print('processor: questions')
-    que_proc = QueProc(tag_embs, ques_d2v, lda_dic, lda_tfidf, lda_model)
-    que_data = que_proc.transform(que_train, tag_que)
+    que_proc = QueProc(tag_embs, ques_d2v, lda_dic, lda_tfidf, lda_model, lda_corpus, n_jobs=os.cpu_count())
+    with span('train.que_transform'):
+        que_all = que_proc.transform(questions, tag_que, fit_before=SPLIT_DATE)
 
     print('processor: students')
     stu_proc = StuProc()
-    stu_data = stu_proc.transform(stu_train, que_train, ans_train)
+    with span('train.stu_transform'):
+        stu_all = stu_proc.transform(students, questions, answers, fit_before=SPLIT_DATE)
 
     print('processor: professionals')
     pro_proc = ProProc(tag_embs, ind_embs, head_d2v, ques_d2v)
-    pro_data = pro_proc.transform(pro_train, que_train, ans_train, tag_pro)
+    with span('train.pro_transform'):
+        pro_all = pro_proc.transform(professionals, questions, answers, tag_pro, fit_before=SPLIT_DATE)
+
+    # snapshots are computed from past events only, so train views are just their time prefixes
+    que_data = que_all[que_all['questions_time'] < SPLIT_DATE]
+    stu_data = stu_all[stu_all['students_time'].isnull() | (stu_all['students_time'] < SPLIT_DATE)]
+    pro_data = pro_all[pro_all['professionals_time'].isnull() | (pro_all['professionals_time'] < SPLIT_DATE)]
 
     # ##################################################################################################################
     #
@@ -105,7 +123,10 @@ if __name__ == '__main__':
     # mappings from professional's id to his registration date. Used in batch generator
     pro_to_date = {row['professionals_id']: row['professionals_date_joined'] for i, row in professionals.iterrows()}
 
-    bg = BatchGenerator(que_data, stu_data, pro_data, 64, pos_pairs, pos_pairs, pro_to_date)
+    # generation of each batch during fitting is timed separately from construction
+    with span('train.batch_generator_init'):
+        bg = BatchGenerator(que_data, stu_data, pro_data, 64, pos_pairs, pos_pairs, pro_to_date,
+                            span_name='train.batch_generator')
 
     # ##################################################################################################################
     #
@@ -120,9 +141,10 @@ if __name__ == '__main__':
                           pro_input_embs=[102, 102, 42], pro_output_embs=[2, 2, 2],
                           inter_dim=20, output_dim=10)
 
-    for lr, epochs in zip([0.01, 0.001, 0.0001, 0.00001], [5, 10, 10, 5]):
-        model.compile(Adam(lr=lr), loss='binary_crossentropy', metrics=['accuracy'])
-        model.fit_generator(bg, epochs=epochs, verbose=2)
+    with span('train.fit'):
+        for lr, epochs in zip([0.01, 0.001, 0.0001, 0.00001], [5, 10, 10, 5]):
+            model.compile(Adam(lr=lr), loss='binary_crossentropy', metrics=['accuracy'])
+            model.fit_generator(bg, epochs=epochs, verbose=2)
 
     # ##################################################################################################################
     #
@@ -138,8 +160,9 @@ if __name__ == '__main__':
           "pro": list(pro_data.columns[2:])}
 
     # calculate and plot feature importance
-    fi = permutation_importance(model, bg[0][0][0], bg[0][0][1], bg[0][1], fn, n_trials=3)
-    plot_fi(fi)
+    with span('train.importance'):
+        fi = permutation_importance(model, bg[0][0][0], bg[0][0][1], bg[0][1], fn, n_trials=3)
+        plot_fi(fi)
 
     # ##################################################################################################################
     #
@@ -149,24 +172,19 @@ if __name__ == '__main__':
     print('TEST')
     # non-negative pairs are all known positive pairs to the moment
     nonneg_pairs = pos_pairs
+    known_pairs = list(nonneg_pairs)
 
     # extract positive pairs
     pos_pairs = list(pairs_df.loc[pairs_df['answers_date_added'] >= SPLIT_DATE].itertuples(index=False, name=None))
     nonneg_pairs += pos_pairs
 
-    # extract and preprocess feature for all three main entities
-
-    que_proc = QueProc(tag_embs, ques_d2v, lda_dic, lda_tfidf, lda_model)
-    que_data = que_proc.transform(questions, tag_que)
-
-    stu_proc = StuProc()
-    stu_data = stu_proc.transform(students, questions, answers)
-
-    pro_proc = ProProc(tag_embs, ind_embs, head_d2v, ques_d2v)
-    pro_data = pro_proc.transform(professionals, questions, answers, tag_pro)
+    # full-history features were already computed in train phase
+    que_data, stu_data, pro_data = que_all, stu_all, pro_all
 
     # initialize batch generator
-    bg = BatchGenerator(que_data, stu_data, pro_data, 64, pos_pairs, nonneg_pairs, pro_to_date)
+    with span('test.batch_generator_init'):
+        bg = BatchGenerator(que_data, stu_data, pro_data, 64, pos_pairs, nonneg_pairs, pro_to_date,
+                            span_name='test.batch_generator')
 
     # ##################################################################################################################
     #
@@ -174,9 +192,24 @@ if __name__ == '__main__':
     #
     # ##################################################################################################################
 
-    loss, acc = model.evaluate_generator(bg)
+    with span('test.evaluate'):
+        loss, acc = model.evaluate_generator(bg)
     print(f'Loss: {loss}, accuracy: {acc}')
 
+    # mappings from question's id to its author id. Used in Predictor
+    que_to_stu = {row['questions_id']: row['questions_author_id'] for i, row in questions.iterrows()}
+
+    # rank true professionals of test pairs among all the eligible professionals via latent index
+    with span('test.ranking'):
+        pred = Predictor(model, que_data, stu_data, pro_data, que_proc, pro_proc, que_to_stu, known_pairs)
+        que_to_date = dict(zip(questions['questions_id'], questions['questions_date_added']))
+        # student's and professional's features as of split date, so test answers don't leak into ranking
+        que_lat, pro_lat = pred.lat_vecs_at(SPLIT_DATE)
+        ranking = evaluate_ranking(que_lat, pred.que_ids, que_to_date, pro_lat, pred.pro_ids,
+                                   pro_to_date, pos_pairs, known_pairs)
+    print(', '.join(f'{name}: {value:.4f}' if isinstance(value, float) else f'{name}: {value}'
+                    for name, value in ranking.items()))
+
     # dummy batch generator used to extract single big batch of data to calculate feature importance
     bg = BatchGenerator(que_data, stu_data, pro_data, 1024, pos_pairs, nonneg_pairs, pro_to_date)
 
@@ -185,11 +218,9 @@ if __name__ == '__main__':
           "pro": list(pro_data.columns[2:])}
 
     # calculate and plot feature importance
-    fi = permutation_importance(model, bg[0][0][0], bg[0][0][1], bg[0][1], fn, n_trials=3)
-    plot_fi(fi)
-
-    # mappings from question's id to its author id. Used in Predictor
-    que_to_stu = {row['questions_id']: row['questions_author_id'] for i, row in questions.iterrows()}
+    with span('test.importance'):
+        fi = permutation_importance(model, bg[0][0][0], bg[0][0][1], bg[0][1], fn, n_trials=3)
+        plot_fi(fi)
 
     # ##################################################################################################################
     #
@@ -204,6 +235,10 @@ if __name__ == '__main__':
          'pro_proc': pro_proc,
          'que_to_stu': que_to_stu,
          'pos_pairs': pos_pairs}
-    with open(os.path.join(DUMP_PATH, 'dump.pkl'), 'wb') as file:
-        pickle.dump(d, file)
-    model.save_weights(os.path.join(DUMP_PATH, 'model.h5'))
+    with span('dump'):
+        with open(os.path.join(DUMP_PATH, 'dump.pkl'), 'wb') as file:
+            pickle.dump(d, file)
+        model.save_weights(os.path.join(DUMP_PATH, 'model.h5'))
+
+    # per-stage timings, call counts and peak memory
+    profiler.dump(os.path.join(DUMP_PATH, 'profile.json'))
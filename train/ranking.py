@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from scipy.sparse import csr_matrix
+
+
+def ranking_metrics(que_lat: np.ndarray, que_dates: np.ndarray, pro_lat: np.ndarray, pro_dates: np.ndarray,
+                    pos_pairs: tuple, known_pairs: tuple, ks: tuple = (1, 5, 10, 20),
+                    batch_size: int = 512) -> dict:
+    """
+    Rank all the eligible professionals for every question with positive pairs
+    and measure how high the true professionals are placed
+
+    :param que_lat: latent vectors of questions
+    :param que_dates: dates questions were added, professionals registered later are not eligible
+    :param pro_lat: latent vectors of professionals
+    :param pro_dates: registration dates of professionals
+    :param pos_pairs: tuple of arrays of question's and professional's positions forming evaluated positive pairs
+    :param known_pairs: tuple of arrays of question's and professional's positions forming already known pairs,
+    which are excluded from ranking
+    :param ks: cut-offs for recall and NDCG
+    :param batch_size: number of questions ranked at once
+    :return: dict with recall@k, NDCG@k, MRR and coverage@k
+    """
+    n_ques, n_pros = que_lat.shape[0], pro_lat.shape[0]
+    que_dates, pro_dates = pd.to_datetime(que_dates).values, pd.to_datetime(pro_dates).values
+    max_k = min(max(ks), n_pros)
+
+    # sparse masks of positive and known pairs, indexed by question
+    pos = csr_matrix((np.ones(len(pos_pairs[0]), dtype=np.int8), pos_pairs), shape=(n_ques, n_pros))
+    known = csr_matrix((np.ones(len(known_pairs[0]), dtype=np.int8), known_pairs), shape=(n_ques, n_pros))
+    # positive pairs themselves are never excluded
+    known = (known > 0) > (pos > 0)
+    ques = np.flatnonzero(np.diff(pos.indptr))
+
+    pro_lat = pro_lat.astype(np.float32)
+    pro_sq = np.square(pro_lat).sum(axis=1)
+
+    recalls = {k: [] for k in ks}
+    ndcgs = {k: [] for k in ks}
+    rrs = []
+    covered = np.zeros((len(ks), n_pros), dtype=bool)
+
+    # discounts of DCG for ranks 1, 2, ...
+    discounts = 1 / np.log2(np.arange(2, max_k + 2))
+
+    for start in range(0, ques.size, batch_size):
+        batch = ques[start:start + batch_size]
+
+        # squared distances, ranking is the same as with euclidean ones
+        dists = pro_sq[None, :] - 2 * que_lat[batch].astype(np.float32) @ pro_lat.T
+
+        # exclude professionals registered after question and already known pairs
+        dists[pro_dates[None, :] > que_dates[batch][:, None]] = np.inf
+        rows, cols = known[batch].nonzero()
+        dists[rows, cols] = np.inf
+
+        # batched top-k
+        top = np.argpartition(dists, max_k - 1, axis=1)[:, :max_k]
+        rows = np.arange(batch.size)[:, None]
+        top = top[rows, np.argsort(dists[rows, top], axis=1)]
+
+        batch_pos = pos[batch]
+        rel = np.asarray(batch_pos[rows, top].todense()) > 0
+        n_rel = np.diff(batch_pos.indptr)
+
+        for i, k in enumerate(ks):
+            recalls[k].append(rel[:, :k].sum(axis=1) / n_rel)
+            dcg = (rel[:, :k] * discounts[:k]).sum(axis=1)
+            idcg = np.cumsum(discounts[:k])[np.minimum(n_rel, k) - 1]
+            ndcgs[k].append(dcg / idcg)
+            covered[i, top[:, :k].ravel()] = True
+
+        # rank of the best placed true professional among all eligible ones
+        rows, cols = batch_pos.nonzero()
+        ranks = (dists[rows] < dists[rows, cols][:, None]).sum(axis=1) + 1
+        best = pd.Series(ranks).groupby(rows).min().values
+        rrs.append(1 / best)
+
+    res = {'questions': ques.size, 'pairs': len(pos_pairs[0]), 'mrr': np.concatenate(rrs).mean()}
+    for i, k in enumerate(ks):
+        res[f'recall@{k}'] = np.concatenate(recalls[k]).mean()
+        res[f'ndcg@{k}'] = np.concatenate(ndcgs[k]).mean()
+        res[f'coverage@{k}'] = covered[i].mean()
+    return res
+
+
+def evaluate_ranking(que_lat: np.ndarray, que_ids: np.ndarray, que_dates: dict,
+                     pro_lat: np.ndarray, pro_ids: np.ndarray, pro_dates: dict,
+                     pos_pairs: list, known_pairs: list, **kwargs) -> dict:
+    """
+    Wrapper over ranking_metrics working with ids and question-student-professional-time pairs
+
+    :param que_lat: latent vectors of questions
+    :param que_ids: ids of questions in que_lat
+    :param que_dates: mappings from question's id to its date
+    :param pro_lat: latent vectors of professionals
+    :param pro_ids: ids of professionals in pro_lat
+    :param pro_dates: mappings from professional's id to his registration date
+    :param pos_pairs: evaluated positive question-student-professional-time pairs
+    :param known_pairs: known question-student-professional-time pairs to exclude from ranking
+    :return: dict with ranking metrics
+    """
+    que_ids, pro_ids = np.asarray(que_ids).ravel(), np.asarray(pro_ids).ravel()
+    que_index, pro_index = pd.Index(que_ids), pd.Index(pro_ids)
+
+    def __positions(pairs):
+        ques = que_index.get_indexer([que for que, stu, pro, time in pairs])
+        pros = pro_index.get_indexer([pro for que, stu, pro, time in pairs])
+        # pairs with questions or professionals missing in latent index can't be ranked
+        found = (ques >= 0) & (pros >= 0)
+        return ques[found], pros[found]
+
+    return ranking_metrics(que_lat, [que_dates[que] for que in que_ids], pro_lat, [pro_dates[pro] for pro in pro_ids],
+                           __positions(pos_pairs), __positions(known_pairs), **kwargs)
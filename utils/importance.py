@@ -1,4 +1,4 @@
-import copy
+import multiprocessing
 
 import numpy as np
 import pandas as pd
@@ -9,12 +9,82 @@ import pandas as pd
 
 from matplotlib import pyplot as plt
 
-from sklearn.utils import shuffle
 import keras
 
+from models.distance import DistanceModel
+
+# state shared with forked worker processes
+_state = {}
+
+
+def distance_merge(que_lat: np.ndarray, pro_lat: np.ndarray) -> np.ndarray:
+    """
+    Numpy version of DistanceModel's head, which maps latent vectors to probabilities
+    """
+    return np.exp(-np.square(que_lat - pro_lat).sum(axis=1))
+
+
+def _bce(y: np.ndarray, p: np.ndarray) -> float:
+    """
+    Binary cross-entropy, computed the same way as Keras does
+    """
+    p = np.clip(p, 1e-7, 1 - 1e-7)
+    return -np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))
+
+
+def _predict(side: str, x: np.ndarray) -> np.ndarray:
+    """
+    Predict probabilities for several variants of one side's data stacked in x,
+    while the other side's data stays unchanged
+    """
+    s = _state
+    other = 'pro' if side == 'que' else 'que'
+    k = x.shape[0] // s['x'][side].shape[0]
+
+    if s['merge'] is not None:
+        # unchanged side is encoded only once
+        lat = getattr(s['model'], side + '_model').predict(x, batch_size=s['batch_size'])
+        other_lat = np.tile(s['lat'][other], (k, 1))
+        return s['merge'](lat, other_lat) if side == 'que' else s['merge'](other_lat, lat)
+
+    if s['tiled'].get(other) is None:
+        s['tiled'][other] = np.tile(s['x'][other], (k, 1))
+    inputs = [x, s['tiled'][other]] if side == 'que' else [s['tiled'][other], x]
+    return s['model'].predict(inputs, batch_size=s['batch_size']).ravel()
+
+
+def _feature_losses(task: tuple) -> list:
+    """
+    Calculate mean loss after shuffling each of the given features of one side
+    """
+    side, cols = task
+    s = _state
+    x, y, n_trials = s['x'][side], s['y'], s['n_trials']
+    n = x.shape[0]
+
+    # n_trials stacked copies of data are allocated once, and each column is permuted and restored in place
+    if s['buf'].get(side) is None:
+        s['buf'][side] = np.tile(x, (n_trials, 1))
+    buf = s['buf'][side]
+
+    losses = []
+    for i in cols:
+        rng = np.random.RandomState([s['seed'], int(side == 'pro'), i])
+        for j in range(n_trials):
+            buf[j * n:(j + 1) * n, i] = x[rng.permutation(n), i]
+
+        # all the permuted variants of a feature are evaluated in one call
+        p = _predict(side, buf)
+        losses.append(np.mean([_bce(y, p[j * n:(j + 1) * n]) for j in range(n_trials)]))
+
+        for j in range(n_trials):
+            buf[j * n:(j + 1) * n, i] = x[:, i]
+    return losses
+
 
 def permutation_importance(model: keras.models.Model, x_que: np.ndarray, x_pro: np.ndarray, y: np.ndarray,
-                           fn: dict, n_trials: int) -> pd.DataFrame:
+                           fn: dict, n_trials: int, n_jobs: int = 1, merge=None, batch_size: int = 4096,
+                           seed: int = 0) -> pd.DataFrame:
     """
     Calculate model feature importance via random permutations of feature values
 
@@ -24,23 +94,45 @@ def permutation_importance(model: keras.models.Model, x_que: np.ndarray, x_pro:
     :param y: target labels
     :param fn: dict with feature names of both questions and professionals
     :param n_trials: number of shuffles for each feature
+    :param n_jobs: number of forked worker processes to fan features out.
+    Model must be safe to use after fork, i.e. built in the parent process before the pool is created
+    :param merge: function mapping question and professional latent vectors to probabilities.
+    If specified, unchanged side is encoded only once with model's que_model or pro_model.
+    Used by default for DistanceModel
+    :param batch_size: batch size of model's predict calls
+    :param seed: seed of random permutations
     :return: Pandas DataFrame with importance of each feature
     """
+    global _state
+
+    if merge is None and isinstance(model, DistanceModel):
+        merge = distance_merge
+
+    _state = {'model': model, 'x': {'que': x_que, 'pro': x_pro}, 'y': np.asarray(y).ravel(),
+              'n_trials': n_trials, 'merge': merge, 'batch_size': batch_size, 'seed': seed,
+              'buf': {}, 'tiled': {}, 'lat': {}}
+
     # model performance on normal, non-shuffled data
-    base_loss, base_acc = model.evaluate([x_que, x_pro], y)
-    losses = []
-    for i, name in enumerate(fn['que'] + fn['pro']):
-        loss = 0
-        for j in range(n_trials):
-            x_que_i, x_pro_i = copy.deepcopy(x_que), copy.deepcopy(x_pro)
+    if merge is not None:
+        _state['lat'] = {'que': model.que_model.predict(x_que, batch_size=batch_size),
+                         'pro': model.pro_model.predict(x_pro, batch_size=batch_size)}
+        p = merge(_state['lat']['que'], _state['lat']['pro'])
+    else:
+        p = model.predict([x_que, x_pro], batch_size=batch_size).ravel()
+    base_loss = _bce(_state['y'], p)
 
-            if name in fn['que']:
-                x_que_i[:, i] = shuffle(x_que_i[:, i])
-            else:
-                x_pro_i[:, i - len(fn['que'])] = shuffle(x_pro_i[:, i - len(fn['que'])])
-            loss += model.evaluate([x_que_i, x_pro_i], y, verbose=0)[0]
+    # split features of each side into chunks processed by workers
+    n_chunks = max(n_jobs, 1)
+    tasks = [(side, cols) for side, x in [('que', x_que), ('pro', x_pro)]
+             for cols in np.array_split(np.arange(x.shape[1]), n_chunks) if cols.size > 0]
 
-        losses.append(loss / n_trials)
+    if n_jobs > 1:
+        with multiprocessing.Pool(n_jobs) as pool:
+            res = pool.map(_feature_losses, tasks)
+    else:
+        res = [_feature_losses(task) for task in tasks]
+    losses = [loss for chunk in res for loss in chunk]
+    _state = {}
 
     fi = pd.DataFrame({'importance': losses}, index=fn['que'] + fn['pro'])
     fi.sort_values(by='importance', inplace=True, ascending=True)
@@ -0,0 +1,129 @@
+import os
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'npz'
+
+# column types of raw CareerVillage tables, 'date' columns are parsed once and stored as int64 nanoseconds
+SCHEMAS = {
+    'answers': {'answers_id': 'str', 'answers_author_id': 'str', 'answers_question_id': 'str',
+                'answers_date_added': 'date', 'answers_body': 'str'},
+    'questions': {'questions_id': 'str', 'questions_author_id': 'str', 'questions_date_added': 'date',
+                  'questions_title': 'str', 'questions_body': 'str'},
+    'professionals': {'professionals_id': 'str', 'professionals_location': 'str', 'professionals_industry': 'str',
+                      'professionals_headline': 'str', 'professionals_date_joined': 'date'},
+    'students': {'students_id': 'str', 'students_location': 'str', 'students_date_joined': 'date'},
+    'tags': {'tags_tag_id': 'int', 'tags_tag_name': 'str'},
+    'tag_users': {'tag_users_tag_id': 'int', 'tag_users_user_id': 'str'},
+    'tag_questions': {'tag_questions_tag_id': 'int', 'tag_questions_question_id': 'str'},
+    'emails': {'emails_id': 'int', 'emails_recipient_id': 'str', 'emails_date_sent': 'date',
+               'emails_frequency_level': 'str'},
+    'matches': {'matches_email_id': 'int', 'matches_question_id': 'str'},
+}
+
+
+def parse_dates(s: pd.Series) -> np.ndarray:
+    """
+    Parse dates like '2016-04-26 19:08:50 UTC+0000' with explicit format, all of them are in UTC
+
+    :return: int64 nanoseconds, missing dates are the smallest int64 like NaT
+    """
+    return pd.to_datetime(s.str.slice(0, 19), format='%Y-%m-%d %H:%M:%S').values \
+        .astype('datetime64[ns]').astype(np.int64)
+
+
+def cache_file(data_path: str, table: str) -> str:
+    return os.path.join(data_path, 'cache', table + '.' + CACHE_FORMAT)
+
+
+def write_atomic(path: str, obj, write=None):
+    """
+    Write object to a temporary file next to path and move it into place,
+    so readers never see partially written file, even if the writer crashes
+
+    :param path: destination file
+    :param obj: object to write
+    :param write: function writing object to open binary file, pickle.dump by default
+    """
+    write = pickle.dump if write is None else write
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            write(obj, file)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def convert(data_path: str, table: str) -> str:
+    """
+    Convert raw csv table to columnar binary cache, with typed columns and dates as int64
+
+    :return: path to cache file
+    """
+    schema = SCHEMAS[table]
+    df = pd.read_csv(os.path.join(data_path, table + '.csv'), usecols=list(schema),
+                     dtype={col: (np.int64 if kind == 'int' else object) for col, kind in schema.items()})
+    for col, kind in schema.items():
+        if kind == 'date':
+            df[col] = parse_dates(df[col])
+
+    path = cache_file(data_path, table)
+    if CACHE_FORMAT == 'parquet':
+        write_atomic(path, df, lambda df, file: df.to_parquet(file, index=False))
+    else:
+        # npz members are read separately, so columns are projected on read like in Parquet
+        write_atomic(path, df, lambda df, file: np.savez(file, **{col: df[col].values for col in df.columns}))
+    return path
+
+
+def load_table(data_path: str, table: str, columns: list = None) -> pd.DataFrame:
+    """
+    Read raw table from columnar cache, converting csv file first if cache is missing or outdated
+
+    :param data_path: path to the folder with raw csv files
+    :param table: name of the table, key of SCHEMAS
+    :param columns: columns to read, all by default
+    :return: dataframe with dates as datetime64[ns]
+    """
+    path = cache_file(data_path, table)
+    csv = os.path.join(data_path, table + '.csv')
+    if not os.path.isfile(path) or (os.path.isfile(csv) and os.path.getmtime(path) < os.path.getmtime(csv)):
+        convert(data_path, table)
+
+    columns = list(SCHEMAS[table]) if columns is None else list(columns)
+    if CACHE_FORMAT == 'parquet':
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        with np.load(path, allow_pickle=True) as file:
+            df = pd.DataFrame({col: file[col] for col in columns}, columns=columns)
+
+    for col in columns:
+        if SCHEMAS[table][col] == 'date':
+            df[col] = df[col].values.astype('datetime64[ns]')
+    return df
+
+
+def load_tables(data_path: str, tables, n_jobs: int = 4) -> dict:
+    """
+    Read several raw tables concurrently
+
+    :param data_path: path to the folder with raw csv files
+    :param tables: list of table names or dict from table name to columns to read
+    :param n_jobs: number of threads
+    :return: dict from table name to dataframe
+    """
+    tables = dict.fromkeys(tables) if not isinstance(tables, dict) else tables
+    with ThreadPoolExecutor(n_jobs) as pool:
+        futures = {table: pool.submit(load_table, data_path, table, columns) for table, columns in tables.items()}
+        return {table: future.result() for table, future in futures.items()}
@@ -0,0 +1,80 @@
+import json
+import time
+import resource
+import threading
+
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Collects per-stage timings, call counts and peak memory of named spans
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Context manager measuring wall time of the enclosed code under the given name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            # peak resident set size of the process so far, in kilobytes on Linux
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            with self.lock:
+                stat = self.stats.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                                    'peak_rss_mb': 0.0})
+                stat['count'] += 1
+                stat['total_seconds'] += elapsed
+                stat['max_seconds'] = max(stat['max_seconds'], elapsed)
+                stat['peak_rss_mb'] = max(stat['peak_rss_mb'], rss / 1024)
+
+    def report(self) -> dict:
+        """
+        :return: copy of collected statistics with mean time of each span
+        """
+        with self.lock:
+            return {name: {**stat, 'mean_seconds': stat['total_seconds'] / stat['count']}
+                    for name, stat in self.stats.items()}
+
+    def dump(self, path: str):
+        """
+        Save collected statistics to JSON file
+        """
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2, sort_keys=True)
+
+    def prometheus(self, prefix: str = 'kcv') -> str:
+        """
+        :return: collected statistics in Prometheus text exposition format
+        """
+        lines = []
+        for metric, key, kind in [('span_seconds_total', 'total_seconds', 'counter'),
+                                  ('span_calls_total', 'count', 'counter'),
+                                  ('span_max_seconds', 'max_seconds', 'gauge'),
+                                  ('span_peak_rss_megabytes', 'peak_rss_mb', 'gauge')]:
+            lines.append(f'# TYPE {prefix}_{metric} {kind}')
+            for name, stat in sorted(self.report().items()):
+                lines.append(f'{prefix}_{metric}{{span="{name}"}} {stat[key]}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+
+# default profiler shared by training and serving code
+profiler = Profiler()
+
+
+def span(name: str):
+    """
+    Shortcut for span of the default profiler
+    """
+    return profiler.span(name)
@@ -1,5 +1,8 @@
 import re
 
+import numpy as np
+import pandas as pd
+
 from nltk.stem import PorterStemmer
 from nltk.corpus import stopwords
 
@@ -57,3 +60,30 @@ class Averager:
         if self.cnt == 0:
             return None
         return self.sum / self.cnt
+
+
+def join_grouped(keys: np.ndarray, values: np.ndarray, sep: str = ' ') -> pd.Series:
+    """
+    Join string values sharing the same key with sep, keeping their original order inside each group.
+    Vectorized alternative to groupby(...).agg(lambda x: ' '.join(x))
+
+    :param keys: array of group keys
+    :param values: array of strings to join, aligned with keys
+    :param sep: separator to put between joined values
+    :return: Series of joined strings indexed by unique keys
+    """
+    if len(keys) == 0:
+        return pd.Series([], dtype=object)
+
+    # stable sort keeps the original order of values inside each group
+    order = np.argsort(keys, kind='mergesort')
+    keys, values = np.asarray(keys)[order], np.asarray(values).astype(str).astype(object)[order]
+
+    # positions where new group starts
+    is_start = np.ones(len(keys), dtype=bool)
+    is_start[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(is_start)
+
+    # prepend separator to every value except the first in the group and concatenate groups at once
+    values = np.where(is_start, '', sep).astype(object) + values
+    return pd.Series(np.add.reduceat(values, starts), index=keys[starts])